@@ -56,6 +56,25 @@ function HtmlToggleView({ html, text, darkMode }) {
 
 
 
+const JOB_POLL_MS = 1000;
+// give up after five minutes, e.g. when no job worker is running
+const JOB_POLL_LIMIT = 300;
+
+// a page that is not indexed yet is answered with 202 and its index job:
+// poll the job until it finishes, then repeat the search
+async function waitForJob(job) {
+  for (let polls = 0; job.status === "queued" || job.status === "running"; polls++) {
+    if (polls >= JOB_POLL_LIMIT) {
+      throw new Error("The page is still being indexed; try again later.");
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+    job = (await axios.get(import.meta.env.VITE_API_BASE + `/api/jobs/${job.id}/`)).data;
+  }
+  if (job.status === "failed") {
+    throw new Error(job.error || "Indexing the page failed.");
+  }
+}
+
 export default function App() {
   const [url, setUrl] = useState("");
   const [query, setQuery] = useState("");
@@ -74,11 +93,16 @@ export default function App() {
     e.preventDefault();
     setLoading(true);
     try {
-      const res = await axios.post(
+      const search = () => axios.post(
         import.meta.env.VITE_API_BASE + "/api/search/",
         { url, query },
         { headers: { "Content-Type": "application/json" }, timeout: 90000 }
       );
+      let res = await search();
+      if (res.status === 202 && res.data.job) {
+        await waitForJob(res.data.job);
+        res = await search();
+      }
       setResults(res.data.results || []);
     } catch (err) {
       console.error(err);
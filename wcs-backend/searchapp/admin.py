@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import IndexedPage, Job
+
+
+@admin.register(IndexedPage)
+class IndexedPageAdmin(admin.ModelAdmin):
+    list_display = ("url", "domain", "collection", "chunk_count", "indexed_at")
+    search_fields = ("url",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "url", "status", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    search_fields = ("url",)
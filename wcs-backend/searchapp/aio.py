@@ -0,0 +1,40 @@
+import asyncio
+import weakref
+
+
+async def _close_at_shutdown(instance, close):
+    # an async generator suspended for the loop's whole life: the loop's
+    # shutdown_asyncgens() (run by asyncio.run, and so by asgiref and
+    # uvicorn) closes it, and the finally block closes the instance
+    try:
+        yield
+    finally:
+        await close(instance)
+
+
+def loop_local(factory, close=None):
+    """Return a getter for one ``factory()`` instance per running event loop.
+
+    Async clients (httpx, AsyncQdrantClient) hold connections bound to the loop
+    that opened them. Under ASGI there is a single loop and so a single shared
+    client; when async views run under WSGI, each request gets its own loop and
+    the client for a finished loop is dropped with it. ``close`` (e.g.
+    ``lambda client: client.aclose()``) is awaited on the instance when its
+    loop shuts down, so short-lived loops don't leak connections.
+    """
+    instances = weakref.WeakKeyDictionary()
+
+    def get():
+        loop = asyncio.get_running_loop()
+        entry = instances.get(loop)
+        if entry is None:
+            instance = factory()
+            closer = None
+            if close is not None:
+                closer = _close_at_shutdown(instance, close)
+                # run it up to its yield, which registers it with the loop
+                loop.create_task(closer.__anext__())
+            entry = instances[loop] = (instance, closer)
+        return entry[0]
+
+    return get
@@ -1,6 +1,47 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# load the embedding model when the server starts instead of on the first
+# request; under ``gunicorn --preload`` the workers share its weights
+PRELOAD = os.getenv("WCS_PRELOAD", "0") == "1"
+
+
+# servers recognised from the program name (``gunicorn``, ``python -m uvicorn``, ...)
+SERVER_PROGRAMS = {"gunicorn", "uvicorn", "daphne", "hypercorn"}
+
+
+def is_serving():
+    """Whether this process serves requests, as opposed to tests, workers or scripts.
+
+    Only known servers count; anything else (``manage.py`` commands, pytest,
+    celery, ad-hoc scripts) never preloads.
+    """
+    # set by gunicorn (and some other servers) for their workers
+    if os.environ.get("SERVER_SOFTWARE"):
+        return True
+    program = os.path.basename(sys.argv[0])
+    if program == "__main__.py":
+        # ``python -m uvicorn``: the package directory names the server
+        program = os.path.basename(os.path.dirname(sys.argv[0]))
+    if program in SERVER_PROGRAMS:
+        return True
+    if program != "manage.py" or sys.argv[1:2] != ["runserver"]:
+        return False
+    # the autoreloader's parent process only watches files
+    return os.environ.get("RUN_MAIN") == "true" or "--noreload" in sys.argv
 
 
 class SearchappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "searchapp"
+
+    def ready(self):
+        if PRELOAD and is_serving():
+            from .indexing import warm_up
+
+            warm_up()
@@ -0,0 +1,7 @@
+"""Helpers shared by the ``bench_*`` management commands."""
+
+
+def percentile(values, q):
+    """The ``q``-th percentile (0-100) of ``values``, nearest-rank."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import time
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+from dotenv import load_dotenv
+
+from .fetching import FETCH_MAX_BYTES, FETCH_TIMEOUT, HTML_CONTENT_TYPES, SNIFF_BYTES, USER_AGENT, detect_encoding
+
+load_dotenv()
+
+CRAWL_MAX_PAGES = int(os.getenv("WCS_CRAWL_MAX_PAGES", "200"))
+# simultaneous requests per host
+CRAWL_CONCURRENCY = int(os.getenv("WCS_CRAWL_CONCURRENCY", "4"))
+# minimum seconds between two requests to the same host (robots.txt Crawl-delay wins if larger)
+CRAWL_DELAY = float(os.getenv("WCS_CRAWL_DELAY", "0.25"))
+# nested sitemap indexes followed at most this deep
+MAX_SITEMAP_DEPTH = 2
+
+SKIPPED_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".pdf", ".zip", ".gz", ".mp3", ".mp4",
+    ".avi", ".mov", ".css", ".js", ".json", ".xml", ".woff", ".woff2", ".ttf", ".exe", ".dmg",
+)
+
+
+class LinkParser(HTMLParser):
+    """Collects ``<a href>`` targets without building a DOM tree."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.base = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+        elif tag == "base" and self.base is None:
+            self.base = dict(attrs).get("href")
+
+
+def normalize_url(url):
+    """Drop the fragment and lowercase scheme and host, so a page is visited once."""
+    url, _ = urldefrag(url)
+    parsed = urlparse(url)
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), path=parsed.path or "/").geturl()
+
+
+def extract_links(html, page_url):
+    parser = LinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+    try:
+        base = urljoin(page_url, parser.base) if parser.base else page_url
+    except ValueError:
+        base = page_url
+    links = []
+    for href in parser.links:
+        # malformed hrefs such as "http://[bad" are skipped, not fatal
+        try:
+            links.append(urljoin(base, href.strip()))
+        except ValueError:
+            continue
+    return links
+
+
+class HostThrottle:
+    """Per-host concurrency limit plus a minimum delay between request starts."""
+
+    def __init__(self, concurrency, delay):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self._lock:
+            wait = self._next_start - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start = time.monotonic() + self.delay
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class SiteCrawler:
+    """Crawl one site with asyncio and hand every HTML page to ``index_page``.
+
+    Pages are discovered from ``sitemap.xml`` (and ``Sitemap:`` lines in
+    robots.txt) and from same-host links. ``index_page(url, html)`` is a
+    blocking callable, typically ``indexing.index_html``; it runs on the
+    default executor so parsing and embedding don't stall the event loop.
+    """
+
+    def __init__(self, start_url, index_page, max_pages=CRAWL_MAX_PAGES, concurrency=CRAWL_CONCURRENCY,
+                 delay=CRAWL_DELAY, respect_robots=True, use_sitemap=True, max_bytes=FETCH_MAX_BYTES):
+        if concurrency < 1 or max_pages < 1 or delay < 0:
+            raise ValueError("concurrency and max_pages must be at least 1 and delay not negative")
+        self.start_url = normalize_url(start_url)
+        self.host = urlparse(self.start_url).netloc
+        self.index_page = index_page
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.delay = delay
+        self.respect_robots = respect_robots
+        self.use_sitemap = use_sitemap
+        self.max_bytes = max_bytes
+
+        self.robots = None
+        self.frontier = asyncio.Queue()
+        self.seen = set()
+        self.disallowed = set()
+        self.stats = {"indexed": 0, "unchanged": 0, "failed": 0, "skipped": 0, "chunks_added": 0}
+        self.errors = {}
+
+    def _same_site(self, url):
+        parsed = urlparse(url)
+        return parsed.scheme in ("http", "https") and parsed.netloc.lower() == self.host
+
+    def _allowed(self, url):
+        return self.robots is None or self.robots.can_fetch(USER_AGENT, url)
+
+    def enqueue(self, url):
+        try:
+            url = normalize_url(url)
+        except ValueError:
+            return
+        if url in self.seen or len(self.seen) >= self.max_pages:
+            return
+        if not self._same_site(url) or urlparse(url).path.lower().endswith(SKIPPED_EXTENSIONS):
+            return
+        if not self._allowed(url):
+            if url not in self.disallowed:
+                self.disallowed.add(url)
+                self.stats["skipped"] += 1
+            return
+        self.seen.add(url)
+        self.frontier.put_nowait(url)
+
+    async def _get(self, client, url, html_only=True):
+        """GET ``url`` under the host throttle; returns decoded text or ``None``."""
+        async with self.throttle:
+            async with client.stream("GET", url) as resp:
+                if resp.status_code != 200 or not self._same_site(str(resp.url)):
+                    return None
+                content_type = resp.headers.get("Content-Type", "")
+                mime = content_type.split(";")[0].strip().lower()
+                if html_only and mime and mime not in HTML_CONTENT_TYPES:
+                    return None
+                body = bytearray()
+                async for chunk in resp.aiter_bytes():
+                    body += chunk
+                    if len(body) > self.max_bytes:
+                        return None
+        body = bytes(body)
+        return body.decode(detect_encoding(content_type, body[:SNIFF_BYTES]), errors="replace")
+
+    async def _load_robots(self, client):
+        robots_url = f"{urlparse(self.start_url).scheme}://{self.host}/robots.txt"
+        try:
+            text = await self._get(client, robots_url, html_only=False)
+        except (httpx.HTTPError, httpx.InvalidURL):
+            text = None
+        if text is None:
+            return []
+        self.robots = RobotFileParser(robots_url)
+        self.robots.parse(text.splitlines())
+        crawl_delay = self.robots.crawl_delay(USER_AGENT)
+        if crawl_delay:
+            self.throttle.delay = max(self.throttle.delay, float(crawl_delay))
+        return self.robots.site_maps() or []
+
+    async def _load_sitemap(self, client, url, depth=0):
+        try:
+            text = await self._get(client, url, html_only=False)
+            root = ET.fromstring(text.encode("utf-8")) if text else None
+        except (httpx.HTTPError, httpx.InvalidURL, ET.ParseError, ValueError):
+            return
+        if root is None:
+            return
+        locs = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+        if root.tag.endswith("sitemapindex"):
+            if depth < MAX_SITEMAP_DEPTH:
+                for loc in locs:
+                    await self._load_sitemap(client, loc, depth + 1)
+            return
+        for loc in locs:
+            self.enqueue(loc)
+
+    async def _crawl_one(self, client, url):
+        try:
+            html = await self._get(client, url)
+        except httpx.HTTPError as e:
+            self.stats["failed"] += 1
+            self.errors[url] = str(e)
+            return
+        if html is None:
+            self.stats["skipped"] += 1
+            return
+
+        for link in extract_links(html, url):
+            self.enqueue(link)
+
+        loop = asyncio.get_running_loop()
+        try:
+            _, changes = await loop.run_in_executor(None, self.index_page, url, html)
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.errors[url] = str(e)
+            return
+        if changes["added"] or changes["removed"]:
+            self.stats["indexed"] += 1
+        else:
+            self.stats["unchanged"] += 1
+        self.stats["chunks_added"] += changes["added"]
+
+    async def _worker(self, client):
+        while True:
+            url = await self.frontier.get()
+            try:
+                await self._crawl_one(client, url)
+            except Exception as e:
+                # one bad URL must not kill the worker, or frontier.join() never returns
+                self.stats["failed"] += 1
+                self.errors[url] = str(e) or type(e).__name__
+            finally:
+                self.frontier.task_done()
+
+    async def run(self):
+        """Crawl until the frontier is empty or ``max_pages`` URLs were seen."""
+        self.throttle = HostThrottle(self.concurrency, self.delay)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT}, timeout=FETCH_TIMEOUT, limits=limits, follow_redirects=True,
+        ) as client:
+            sitemaps = await self._load_robots(client) if self.respect_robots else []
+            self.enqueue(self.start_url)
+            if self.use_sitemap:
+                root = f"{urlparse(self.start_url).scheme}://{self.host}"
+                for sitemap in dict.fromkeys([*sitemaps, f"{root}/sitemap.xml"]):
+                    await self._load_sitemap(client, sitemap)
+
+            workers = [asyncio.create_task(self._worker(client)) for _ in range(self.concurrency)]
+            await self.frontier.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return {"pages_seen": len(self.seen), **self.stats, "errors": self.errors}
+
+
+def crawl_site(start_url, index_page, **options):
+    """Blocking entry point: crawl ``start_url`` and return the crawl statistics."""
+    return asyncio.run(SiteCrawler(start_url, index_page, **options).run())
@@ -0,0 +1,403 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+import portalocker
+from django.conf import settings
+from dotenv import load_dotenv
+
+from .metrics import Counter, Gauge, span
+
+load_dotenv()
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+
+# texts per forward pass when encoding a page's chunks
+EMBED_BATCH_SIZE = int(os.getenv("WCS_EMBED_BATCH_SIZE", "64"))
+# entries kept in the in-process LRU in front of the disk cache
+EMBEDDING_CACHE_SIZE = int(os.getenv("WCS_EMBEDDING_CACHE_SIZE", "10000"))
+# directory of the on-disk cache; set to an empty string to disable it
+EMBEDDING_CACHE_DIR = os.getenv(
+    "WCS_EMBEDDING_CACHE_DIR", str(Path(settings.BASE_DIR) / "var" / "embeddings")
+)
+# coalesce encode calls from concurrent requests into shared batches
+EMBED_MICROBATCH = os.getenv("WCS_EMBED_MICROBATCH", "1") == "1"
+# how long the batcher waits for more requests before flushing a batch
+EMBED_MAX_WAIT_MS = float(os.getenv("WCS_EMBED_MAX_WAIT_MS", "5"))
+# float16 halves the disk/page-cache footprint at a negligible cosine error
+EMBEDDING_CACHE_DTYPE = os.getenv("WCS_EMBEDDING_CACHE_DTYPE", "float16")
+
+# runtime that executes the model on CPU:
+#   torch       PyTorch, float32 weights (the original setup)
+#   torch-int8  PyTorch with the Linear layers dynamically quantized to int8
+#   onnx        ONNX Runtime with the exported graph
+#   onnx-int8   ONNX Runtime with the int8-quantized export (WCS_EMBED_ONNX_INT8_FILE)
+# the onnx backends need ``pip install "sentence-transformers[onnx]"``
+EMBED_BACKEND = os.getenv("WCS_EMBED_BACKEND", "torch")
+# quantized export inside the model repo; pick the variant matching the CPU
+# (model_quint8_avx2, model_qint8_avx512, model_qint8_avx512_vnni, model_qint8_arm64)
+EMBED_ONNX_INT8_FILE = os.getenv("WCS_EMBED_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+def _sentence_transformer(**kwargs):
+    # imported here: sentence_transformers pulls in torch, which commands that
+    # never embed anything (migrate, ...) should not pay for
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(MODEL_NAME, **kwargs)
+
+
+def _load_torch_int8():
+    import torch
+
+    model = _sentence_transformer(device="cpu")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+EMBED_BACKENDS = {
+    "torch": _sentence_transformer,
+    "torch-int8": _load_torch_int8,
+    "onnx": lambda: _sentence_transformer(backend="onnx"),
+    "onnx-int8": lambda: _sentence_transformer(backend="onnx", model_kwargs={"file_name": EMBED_ONNX_INT8_FILE}),
+}
+
+
+def load_model(backend=None):
+    """Load ``MODEL_NAME`` on the runtime named by ``backend`` (default ``EMBED_BACKEND``)."""
+    backend = backend or EMBED_BACKEND
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; choose one of: {', '.join(EMBED_BACKENDS)}")
+    return EMBED_BACKENDS[backend]()
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The embedding model of ``EMBED_BACKEND``, loaded on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = load_model()
+    return _model
+
+
+def warm_up():
+    """Load the model, run one encode and open the embedding cache, so the first request pays for none of them.
+
+    Called before forking, the loaded weights are shared copy-on-write by
+    the child processes.
+    """
+    get_model().encode(["warm-up"])
+    get_embedding_cache()
+
+# vectors from another runtime differ slightly, so each backend caches its own
+# (keys of the float32 PyTorch backend are unchanged)
+EMBEDDING_MODEL_ID = MODEL_NAME if EMBED_BACKEND == "torch" else f"{MODEL_NAME}:{EMBED_BACKEND}"
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(text):
+    """Cache key for ``text``: model and backend plus the whitespace-normalized text."""
+    return hashlib.sha256(f"{EMBEDDING_MODEL_ID}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """Append-only vector file, memory-mapped for reads, with a text index.
+
+    ``vectors.<dtype>.bin`` holds fixed-size rows; ``index.<dtype>.tsv`` holds one
+    ``key<TAB>row`` line per vector. Both are only ever appended to under a
+    file lock, so several worker processes can share one store and pick up
+    each other's entries by re-reading the tail of the index.
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM, dtype=EMBEDDING_CACHE_DTYPE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = self.dim * self.dtype.itemsize
+        self.vectors_path = self.directory / f"vectors.{self.dtype.name}.bin"
+        self.index_path = self.directory / f"index.{self.dtype.name}.tsv"
+        self.lock_path = self.directory / f"store.{self.dtype.name}.lock"
+        self.vectors_path.touch(exist_ok=True)
+        self.index_path.touch(exist_ok=True)
+
+        self._rows = {}
+        self._index_offset = 0
+        self._mmap = None
+        self._mapped_rows = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh_index()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _refresh_index(self):
+        """Read index lines appended (possibly by other processes) since last time."""
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # ignore a trailing partial line still being written by another process
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            key, _, row = line.decode("ascii").partition("\t")
+            if row:
+                self._rows[key] = int(row)
+        self._index_offset += end
+
+    def _vector(self, row):
+        if row >= self._mapped_rows:
+            rows = os.path.getsize(self.vectors_path) // self.row_bytes
+            self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+            self._mapped_rows = rows
+        return np.asarray(self._mmap[row], dtype=np.float32)
+
+    def get_many(self, keys):
+        """Return ``{key: vector}`` for every key present in the store."""
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh_index()
+            return {key: self._vector(self._rows[key]) for key in keys if key in self._rows}
+
+    def _drop_torn_tail(self):
+        """Cut off a partial row or index line left by a writer that died mid-append.
+
+        Runs under the file lock, right after ``_refresh_index``, so nobody is
+        appending and ``_index_offset`` is the end of the last whole line.
+        Without this, the next row would start inside the torn one and every
+        vector after it would be read shifted.
+        """
+        size = os.path.getsize(self.vectors_path)
+        if size % self.row_bytes:
+            os.truncate(self.vectors_path, size - size % self.row_bytes)
+        if os.path.getsize(self.index_path) > self._index_offset:
+            os.truncate(self.index_path, self._index_offset)
+
+    def put_many(self, items):
+        """Append ``(key, vector)`` pairs that are not stored yet."""
+        with self._lock, portalocker.Lock(self.lock_path, timeout=10):
+            self._refresh_index()
+            items = [(key, vector) for key, vector in items if key not in self._rows]
+            if not items:
+                return
+            self._drop_torn_tail()
+            block = np.asarray([vector for _, vector in items], dtype=self.dtype)
+            with open(self.vectors_path, "ab") as f:
+                first_row = f.tell() // self.row_bytes
+                f.write(block.tobytes())
+            lines = "".join(f"{key}\t{first_row + i}\n" for i, (key, _) in enumerate(items))
+            with open(self.index_path, "ab") as f:
+                f.write(lines.encode("ascii"))
+            self._refresh_index()
+
+
+EMBEDDING_CACHE_LOOKUPS = Counter("wcs_embedding_cache_lookups_total", "Embedding cache lookups by result.", ["result"])
+
+
+class EmbeddingCache:
+    """In-memory LRU of embeddings, optionally backed by a ``DiskEmbeddingStore``."""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = vector
+        missing = [key for key in keys if key not in found]
+        if missing and self.store is not None:
+            from_disk = self.store.get_many(missing)
+            with self._lock:
+                for key, vector in from_disk.items():
+                    self._remember(key, vector)
+            found.update(from_disk)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        EMBEDDING_CACHE_LOOKUPS.inc(len(found), result="hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(len(keys) - len(found), result="miss")
+        return found
+
+    def put_many(self, items, persist=True):
+        items = list(items)
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+        if persist and self.store is not None:
+            self.store.put_many(items)
+
+
+class EmbeddingBatcher:
+    """Single worker thread that owns the model and encodes in micro-batches.
+
+    Concurrent callers enqueue their texts and block on a future. The worker
+    takes the first waiting request, keeps collecting until ``max_batch_size``
+    texts are queued or ``max_wait_ms`` has passed, then runs one ``encode``
+    for all of them. Only this thread runs the model, so request threads never
+    compete for the CPU with their own forward passes.
+    """
+
+    def __init__(self, get_model, max_batch_size=EMBED_BATCH_SIZE, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        # a worker started before a fork does not exist in the child process
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def encode(self, texts):
+        """Encode ``texts`` as part of the next batch and return a float32 array."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._flush(batch)
+
+    def _flush(self, batch):
+        texts = [text for item_texts, _ in batch for text in item_texts]
+        try:
+            vectors = np.asarray(
+                self.get_model().encode(texts, batch_size=self.max_batch_size), dtype=np.float32
+            )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        start = 0
+        for item_texts, future in batch:
+            future.set_result(vectors[start:start + len(item_texts)])
+            start += len(item_texts)
+
+
+EMBEDDING_BATCHER = EmbeddingBatcher(get_model) if EMBED_MICROBATCH else None
+EMBED_QUEUE_DEPTH = Gauge(
+    "wcs_embed_queue_depth",
+    "Encode requests waiting for the embedding batcher.",
+    lambda: EMBEDDING_BATCHER.queue_depth if EMBEDDING_BATCHER is not None else 0,
+)
+
+
+def encode(texts, batch_size=EMBED_BATCH_SIZE):
+    """Run the model on ``texts``, through the shared batcher when enabled."""
+    with span("encode"):
+        if EMBEDDING_BATCHER is not None:
+            return EMBEDDING_BATCHER.encode(texts)
+        return np.asarray(get_model().encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """The process's embedding cache, opened on first use.
+
+    Opening reads the disk store's whole index, which commands that never
+    embed (``migrate``, ...) should not pay for.
+    """
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    store=DiskEmbeddingStore(EMBEDDING_CACHE_DIR) if EMBEDDING_CACHE_DIR else None,
+                )
+    return _embedding_cache
+
+
+def set_embedding_cache(cache):
+    """Make ``cache`` the process's embedding cache (benchmarks)."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        _embedding_cache = cache
+
+
+def embed_texts(texts, batch_size=EMBED_BATCH_SIZE, persist=True):
+    """Embed ``texts`` as a float32 array of shape ``(len(texts), EMBEDDING_DIM)``.
+
+    Cached vectors are reused; the remaining unique texts are encoded in a
+    single batched ``encode`` call. ``persist=False`` keeps new vectors in
+    memory only, which suits one-off inputs such as search queries.
+    """
+    keys = [embedding_key(text) for text in texts]
+    cache = get_embedding_cache()
+    found = cache.get_many(list(dict.fromkeys(keys)))
+
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in pending:
+            pending[key] = text
+    if pending:
+        computed = dict(zip(pending, encode(list(pending.values()), batch_size=batch_size)))
+        cache.put_many(computed.items(), persist=persist)
+        found.update(computed)
+
+    if not keys:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.stack([found[key] for key in keys])
+
+
+def embed_query(query):
+    return embed_texts([query], persist=False)[0]
@@ -0,0 +1,309 @@
+import hashlib
+import os
+import time
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+from nltk.tokenize import word_tokenize
+
+from .metrics import observe, span
+
+# Tags that usually hold a page's main content, in priority order. Each entry
+# is the CSS selector it stands for, as (tag, attribute, value): an ``id``
+# must equal the value, a ``class`` must contain it (``[class*='...']``).
+MAIN_CONTENT_SELECTORS = [
+    ("main", None, None),
+    ("article", None, None),
+    ("section", None, None),
+    ("div", "id", "main-content"),
+    ("div", "id", "content"),
+    ("div", "id", "primary"),
+    ("div", "class", "article"),
+    ("div", "class", "content"),
+    ("div", "class", "post"),
+    ("div", "class", "entry"),
+    ("div", "class", "page"),
+    ("div", "class", "text"),
+    ("div", "class", "read"),
+    ("div", "class", "container"),
+]
+# tags considered for the "largest text block" fallback
+FALLBACK_BLOCK_TAGS = ("div", "section", "article")
+# a candidate needs more than this many non-whitespace characters of text
+MIN_MAIN_CONTENT_CHARS = 200
+
+def _html5_parser(html):
+    # C (gumbo-based) HTML5 parser that builds a BeautifulSoup tree directly;
+    # needs the ``html5-parser`` package and an lxml built against the same libxml2
+    from html5_parser import parse
+
+    return parse(html, treebuilder="soup")
+
+
+# HTML parser backends: name -> callable(html) returning a BeautifulSoup tree
+PARSERS = {
+    "html.parser": lambda html: BeautifulSoup(html, "html.parser"),
+    "lxml": lambda html: BeautifulSoup(html, "lxml"),
+    "html5lib": lambda html: BeautifulSoup(html, "html5lib"),
+    "html5-parser": _html5_parser,
+}
+# backend used for page parsing; "lxml" is typically several times faster
+HTML_PARSER = os.getenv("WCS_HTML_PARSER", "html.parser")
+
+PAGE_JUNK_TAGS = ["script", "style", "noscript", "header", "footer", "svg"]
+# navigation, widgets and form controls are dropped from the main content
+MAIN_CONTENT_JUNK_TAGS = [
+    "nav", "aside", "footer", "form", "button", "svg", "script", "style", "noscript", "header", "iframe", "input",
+]
+
+# elements that start a new chunk unit; inline content between them is grouped
+BLOCK_TAGS = frozenset([
+    "address", "article", "aside", "blockquote", "body", "caption", "dd", "details", "dialog", "div",
+    "dl", "dt", "fieldset", "figcaption", "figure", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "hgroup", "hr", "html", "li", "main", "nav", "ol", "p", "pre", "section", "summary", "table",
+    "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+])
+
+# headings always start a new chunk
+HEADING_TAGS = frozenset(["h1", "h2", "h3", "h4", "h5", "h6"])
+
+# the README promises chunks of at most 500 tokens
+MAX_CHUNK_TOKENS = int(os.getenv("WCS_CHUNK_TOKENS", "500"))
+# average chunk size the content-defined boundaries aim for (see ``ends_chunk``)
+TARGET_CHUNK_TOKENS = int(os.getenv("WCS_CHUNK_TARGET_TOKENS", str(MAX_CHUNK_TOKENS // 2)))
+MAX_PREVIEW_CHARS = 2000
+
+
+def _matches(tag, selector):
+    name, attr, value = selector
+    if tag.name != name:
+        return False
+    if attr == "id":
+        return tag.get("id") == value
+    if attr == "class":
+        classes = tag.get("class")
+        if isinstance(classes, list):
+            classes = " ".join(classes)
+        return classes is not None and value in classes
+    return True
+
+
+def find_main_content(soup):
+    """Pick the element holding the page's main content in one DOM traversal.
+
+    Equivalent to running ``select_one`` for every entry of
+    ``MAIN_CONTENT_SELECTORS`` and comparing ``len(tag.get_text(strip=True))``,
+    but each node's text length is computed once, bottom-up, and reused.
+    Falls back to the largest ``div``/``section``/``article`` and finally to
+    ``<body>``.
+    """
+    lengths = {}
+    first_match = [None] * len(MAIN_CONTENT_SELECTORS)
+    blocks = []
+
+    stack = [(soup, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            total = 0
+            for child in node.contents:
+                if isinstance(child, Tag):
+                    total += lengths[id(child)]
+                elif type(child) is NavigableString:
+                    total += len(child.strip())
+            lengths[id(node)] = total
+            continue
+
+        # pre-order visit: nodes are seen in document order, like select_one
+        for i, selector in enumerate(MAIN_CONTENT_SELECTORS):
+            if first_match[i] is None and _matches(node, selector):
+                first_match[i] = node
+        if node.name in FALLBACK_BLOCK_TAGS:
+            blocks.append(node)
+
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.contents) if isinstance(child, Tag))
+
+    def text_length(tag):
+        return lengths[id(tag)]
+
+    candidates = [
+        tag for tag in first_match
+        if tag is not None and text_length(tag) > MIN_MAIN_CONTENT_CHARS
+    ]
+    if not candidates:
+        largest = max(blocks, key=text_length, default=None)
+        if largest is not None and text_length(largest) > MIN_MAIN_CONTENT_CHARS:
+            candidates.append(largest)
+
+    return max(candidates, key=text_length, default=soup.body)
+
+
+def _text_of(nodes):
+    parts = []
+    for node in nodes:
+        if isinstance(node, Tag):
+            parts.append(node.get_text(" ", strip=True))
+        else:
+            parts.append(node.strip())
+    return " ".join(part for part in parts if part)
+
+
+def _unit(nodes, in_main):
+    """A run of sibling nodes (or one leaf block) that is never split across chunks."""
+    return {
+        "text": _text_of(nodes),
+        "html": "".join(
+            node.decode() if isinstance(node, Tag) else node.output_ready() for node in nodes
+        ),
+        "source_line": next((node.sourceline for node in nodes if isinstance(node, Tag)), None),
+        "in_main_content": in_main,
+        "heading": len(nodes) == 1 and isinstance(nodes[0], Tag) and nodes[0].name in HEADING_TAGS,
+    }
+
+
+def _walk(node, main_content, in_main=False, is_root=False):
+    """Yield the chunk units under ``node`` in document order.
+
+    A block element without nested blocks is one unit; inline content that
+    sits between blocks is grouped into a unit of its own. Returns (as the
+    generator's value) whether ``node`` is or contains a block element, so a
+    parent knows whether to treat it as inline content.
+    """
+    in_main = in_main or node is main_content
+    run = []
+    contains_block = False
+    for child in node.contents:
+        if isinstance(child, Tag):
+            walker = _walk(child, main_content, in_main)
+            while True:
+                try:
+                    unit = next(walker)
+                except StopIteration as stop:
+                    child_is_block = stop.value
+                    break
+                # a block follows: the inline run before it becomes its own unit
+                if run:
+                    yield _unit(run, in_main)
+                    run = []
+                yield unit
+            if child_is_block:
+                contains_block = True
+                # also split around blocks that produced no units (e.g. empty <p>)
+                if run:
+                    yield _unit(run, in_main)
+                    run = []
+            else:
+                run.append(child)
+        elif type(child) is NavigableString and child.strip():
+            run.append(child)
+
+    if node.name in BLOCK_TAGS and not contains_block:
+        if run:
+            yield _unit([node], in_main)
+        return True
+    if run and (contains_block or is_root):
+        yield _unit(run, in_main)
+    # an inline element passes its content up to be grouped by its parent
+    return contains_block or node.name in BLOCK_TAGS
+
+
+def _preview(html):
+    if len(html) > MAX_PREVIEW_CHARS:
+        return html[:MAX_PREVIEW_CHARS] + "\n<!-- [truncated for performance] -->"
+    return html
+
+
+def ends_chunk(text, n_tokens, target_tokens=TARGET_CHUNK_TOKENS):
+    """Whether a chunk boundary follows the unit with this text.
+
+    The decision depends only on the unit itself: its text hash, read as a
+    number in [0, 1), is compared with its share of ``target_tokens``. Adding
+    or removing a paragraph therefore only moves the boundaries next to it,
+    and the chunks (and point ids) of the rest of the page stay the same.
+    """
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < n_tokens / target_tokens
+
+
+def iter_chunks(soup, max_tokens=MAX_CHUNK_TOKENS):
+    """Yield chunks of at most ``max_tokens`` tokens from a cleaned soup.
+
+    Units from ``_walk`` are grouped between content-defined boundaries: a
+    chunk ends after a unit picked by ``ends_chunk``, before a heading, and
+    before the unit that would take it past ``max_tokens``. A unit larger than
+    the budget is split by tokens and each piece keeps that unit's HTML.
+    Every chunk carries only its own HTML fragment, its ``[token_start,
+    token_end)`` range within the page's tokens, the source line it starts
+    on, and whether any of it is inside the page's main content.
+    ``MAIN_CONTENT_JUNK_TAGS`` are removed from the main content first, so
+    navigation and forms stay out of its chunks.
+    """
+    with span("main_content"):
+        main_content = find_main_content(soup)
+        if main_content is not None:
+            for junk in main_content.find_all(MAIN_CONTENT_JUNK_TAGS):
+                junk.decompose()
+    offset = 0
+    pending = []
+    pending_tokens = []
+    # tokenization runs once per unit; its time is reported once per page
+    tokenize_seconds = 0.0
+
+    def make_chunk(units, tokens):
+        return {
+            "text": " ".join(tokens),
+            "html": _preview("".join(unit["html"] for unit in units)),
+            "token_start": offset - len(tokens),
+            "token_end": offset,
+            "source_line": units[0]["source_line"],
+            "in_main_content": any(unit["in_main_content"] for unit in units),
+        }
+
+    try:
+        for unit in _walk(soup, main_content, is_root=True):
+            started = time.perf_counter()
+            tokens = word_tokenize(unit["text"])
+            tokenize_seconds += time.perf_counter() - started
+            if not tokens:
+                continue
+            if pending and (unit["heading"] or len(pending_tokens) + len(tokens) > max_tokens):
+                yield make_chunk(pending, pending_tokens)
+                pending, pending_tokens = [], []
+            if len(tokens) > max_tokens:
+                for i in range(0, len(tokens), max_tokens):
+                    piece = tokens[i:i + max_tokens]
+                    offset += len(piece)
+                    yield make_chunk([unit], piece)
+                continue
+            pending.append(unit)
+            pending_tokens.extend(tokens)
+            offset += len(tokens)
+            if ends_chunk(unit["text"], len(tokens)):
+                yield make_chunk(pending, pending_tokens)
+                pending, pending_tokens = [], []
+
+        if pending:
+            yield make_chunk(pending, pending_tokens)
+    finally:
+        observe("tokenize", tokenize_seconds)
+
+
+def parse_html(html, parser=None):
+    """Parse ``html`` with the configured (or the given) parser backend."""
+    parser = parser or HTML_PARSER
+    if parser not in PARSERS:
+        raise ValueError(f"Unknown HTML parser {parser!r}; choose one of: {', '.join(PARSERS)}")
+    return PARSERS[parser](html)
+
+
+def iter_page_chunks(html, parser=None):
+    """Parse a page and lazily yield its chunks, each with its own HTML fragment."""
+    with span("parse"):
+        soup = parse_html(html, parser)
+        for s in soup(PAGE_JUNK_TAGS):
+            s.decompose()
+    yield from iter_chunks(soup)
+
+
+def extract_chunks(html, parser=None):
+    return list(iter_page_chunks(html, parser))
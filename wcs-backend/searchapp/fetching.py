@@ -0,0 +1,249 @@
+import codecs
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from email.message import Message
+from pathlib import Path
+from urllib.parse import urlparse
+
+import charset_normalizer
+import requests
+from django.conf import settings
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+
+from .metrics import Counter
+
+load_dotenv()
+
+# directory for cached response bodies and validators; empty disables the cache
+FETCH_CACHE_DIR = os.getenv(
+    "WCS_FETCH_CACHE_DIR", str(Path(settings.BASE_DIR) / "var" / "fetch")
+)
+# cached pages younger than this are used without contacting the origin
+FETCH_CACHE_TTL = int(os.getenv("WCS_FETCH_CACHE_TTL", "300"))
+FETCH_TIMEOUT = float(os.getenv("WCS_FETCH_TIMEOUT", "10"))
+# larger (decompressed) bodies are rejected instead of being read into memory
+FETCH_MAX_BYTES = int(os.getenv("WCS_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+READ_CHUNK_BYTES = 64 * 1024
+# bytes looked at for a BOM / <meta charset> when the header names no charset
+SNIFF_BYTES = 4096
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
+USER_AGENT = "Mozilla/5.0"
+# every encoding urllib3 can decode here (gzip/deflate, plus br/zstd when installed)
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+# ``not_modified`` means the origin confirmed (304) or the TTL guarantees that
+# the body is the one fetched last time
+FetchedPage = namedtuple("FetchedPage", ["url", "html", "not_modified", "from_cache"])
+
+
+FETCH_CACHE_LOOKUPS = Counter(
+    "wcs_fetch_cache_lookups_total",
+    "Page fetches by cache outcome: fresh (served from cache), revalidated (304) or miss.",
+    ["result"],
+)
+
+
+class FetchError(Exception):
+    """Raised when a page cannot be fetched."""
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def session_for(url):
+    """One pooled keep-alive session per host (scheme + netloc)."""
+    parsed = urlparse(url)
+    host = f"{parsed.scheme}://{parsed.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING})
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+        return session
+
+
+class PageCache:
+    """Response bodies and their validators on local disk, one pair of files per URL."""
+
+    def __init__(self, directory):
+        # created on the first write, not at import
+        self.directory = Path(directory)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.directory / f"{key}.json", self.directory / f"{key}.body"
+
+    def _tmp(self, path):
+        return path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}")
+
+    def get(self, url):
+        """Return ``(meta, body_path)`` for ``url``, or ``None`` if it is not cached."""
+        meta_path, body_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not body_path.exists():
+            return None
+        return meta, body_path
+
+    def open_body(self, url):
+        """A temporary file to stream a new body of ``url`` into; ``put`` moves it into place."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return open(self._tmp(self._paths(url)[1]), "wb")
+
+    def discard(self, body_file):
+        """Drop a body file from ``open_body`` that was not stored, e.g. after a failed read."""
+        body_file.close()
+        try:
+            os.unlink(body_file.name)
+        except OSError:
+            pass
+
+    def put(self, url, meta, body_file=None):
+        """Store ``meta`` (and the body written to ``body_file``); writes are atomic renames."""
+        meta_path, body_path = self._paths(url)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if body_file is not None:
+            body_file.close()
+            os.replace(body_file.name, body_path)
+        tmp = self._tmp(meta_path)
+        tmp.write_text(json.dumps({**meta, "url": url}))
+        os.replace(tmp, meta_path)
+
+
+PAGE_CACHE = PageCache(FETCH_CACHE_DIR) if FETCH_CACHE_DIR else None
+
+
+def read_cached(body_path, encoding):
+    """Decode a cached body straight from its file, without holding its bytes as well."""
+    # newline="" keeps line endings exactly as fetched
+    with open(body_path, encoding=encoding or "utf-8", errors="replace", newline="") as f:
+        return f.read()
+
+
+def _known_encoding(name):
+    try:
+        return codecs.lookup(name).name
+    except (LookupError, TypeError):
+        return None
+
+
+def detect_encoding(content_type, head):
+    """Charset from the Content-Type header, a BOM, a ``<meta>`` tag, or detection."""
+    message = Message()
+    message["content-type"] = content_type or ""
+    encoding = _known_encoding(message.get_param("charset"))
+    if encoding:
+        return encoding
+    for bom, name in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if head.startswith(bom):
+            return name
+    match = META_CHARSET_RE.search(head)
+    if match:
+        encoding = _known_encoding(match.group(1).decode("ascii"))
+        if encoding:
+            return encoding
+    best = charset_normalizer.from_bytes(head).best()
+    return (best and _known_encoding(best.encoding)) or "utf-8"
+
+
+def read_html(resp, write=None, max_bytes=FETCH_MAX_BYTES):
+    """Stream an HTML body, enforcing ``max_bytes`` and decoding as it arrives.
+
+    Non-HTML responses are rejected from their headers before any of the body
+    is downloaded. The raw bytes are handed to ``write`` (e.g. a cache file)
+    chunk by chunk instead of being kept, so only the decoded text is held in
+    memory. Returns ``(encoding, html)``.
+    """
+    content_type = resp.headers.get("Content-Type", "")
+    mime = content_type.split(";")[0].strip().lower()
+    if mime and mime not in HTML_CONTENT_TYPES:
+        raise FetchError(f"Unsupported content type: {mime}")
+    declared = resp.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise FetchError(f"Page is larger than {max_bytes} bytes")
+
+    text, size = [], 0
+    head = b""
+    decoder = encoding = None
+    for chunk in resp.iter_content(READ_CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise FetchError(f"Page is larger than {max_bytes} bytes")
+        if write is not None:
+            write(chunk)
+        if decoder is None:
+            head += chunk
+            if len(head) < SNIFF_BYTES:
+                continue
+            encoding = detect_encoding(content_type, head)
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            chunk, head = head, b""
+        text.append(decoder.decode(chunk))
+
+    if decoder is None:
+        encoding = detect_encoding(content_type, head)
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        text.append(decoder.decode(head))
+    text.append(decoder.decode(b"", final=True))
+    return encoding, "".join(text)
+
+
+def fetch_page(url, ttl=FETCH_CACHE_TTL):
+    """Fetch ``url``, reusing the cached copy when it is fresh or revalidates (304)."""
+    cached = PAGE_CACHE.get(url) if PAGE_CACHE is not None else None
+    headers = {}
+    if cached is not None:
+        meta, body_path = cached
+        if time.time() - meta.get("fetched_at", 0) < ttl:
+            FETCH_CACHE_LOOKUPS.inc(result="fresh")
+            return FetchedPage(url, read_cached(body_path, meta.get("encoding")), True, True)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    body_file = html = None
+    try:
+        with session_for(url).get(url, timeout=FETCH_TIMEOUT, headers=headers, stream=True) as resp:
+            if resp.status_code == 304 and cached is not None:
+                meta, body_path = cached
+                PAGE_CACHE.put(url, {**meta, "fetched_at": time.time()})
+                FETCH_CACHE_LOOKUPS.inc(result="revalidated")
+                return FetchedPage(url, read_cached(body_path, meta.get("encoding")), True, True)
+            resp.raise_for_status()
+            body_file = PAGE_CACHE.open_body(url) if PAGE_CACHE is not None else None
+            encoding, html = read_html(resp, body_file.write if body_file is not None else None)
+    except requests.RequestException as e:
+        raise FetchError(str(e))
+    finally:
+        # ``put`` below takes a complete body; a failed read leaves a partial one
+        if body_file is not None and html is None:
+            PAGE_CACHE.discard(body_file)
+
+    FETCH_CACHE_LOOKUPS.inc(result="miss")
+    # the encoding is remembered so a 304 decodes the cached body identically
+    if PAGE_CACHE is not None:
+        PAGE_CACHE.put(url, {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "encoding": encoding,
+            "fetched_at": time.time(),
+        }, body_file)
+    return FetchedPage(url, html, False, False)
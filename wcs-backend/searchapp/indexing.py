@@ -0,0 +1,555 @@
+import asyncio
+import gc
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from dotenv import load_dotenv
+from qdrant_client.http.models import KeywordIndexParams, KeywordIndexType
+
+from . import embeddings
+from .embeddings import embed_query, embed_texts
+from .extraction import iter_page_chunks
+from .fetching import FetchError, fetch_page
+from .locks import SingleFlight, url_lock
+from .metrics import span
+from .models import IndexedPage
+from .pipeline import retry_with_backoff, run_pipeline
+from .previews import LEGACY_PREVIEW_FIELD, PREVIEW_FIELD, preview_payload, render_preview
+from .profiles import collection_options
+from .summaries import SUMMARIZE_ON_INDEX, asummarize_many, prefetch_summaries, summarize_many
+from .vectorstore import get_store
+
+load_dotenv()
+
+#  utility functions 
+
+def upsert_batch(store, collection_name, points, retries=4):
+    """Upsert one batch of points, retrying with exponential backoff."""
+    with span("upsert"):
+        retry_with_backoff(
+            lambda: store.upsert(collection_name, points),
+            retries=retries,
+            label=f"Upsert of {len(points)} points into {collection_name}",
+        )
+
+
+#  initialization 
+
+COLLECTION_NAME = "html_chunks"
+
+# "per_domain": one collection per domain (html_chunks_<domain>);
+# "shared": every domain in COLLECTION_NAME, partitioned by a "domain" tenant index
+COLLECTION_LAYOUT = os.getenv("WCS_COLLECTION_LAYOUT", "per_domain")
+
+# indexed pages older than this are re-fetched on the next search (0 = never)
+INDEX_TTL_SECONDS = int(os.getenv("WCS_INDEX_TTL_SECONDS", "86400"))
+
+# chunks per embed/upsert batch while indexing
+INGEST_BATCH_SIZE = int(os.getenv("WCS_INGEST_BATCH_SIZE", "64"))
+# batches allowed to wait between pipeline stages before the producer blocks
+INGEST_QUEUE_DEPTH = int(os.getenv("WCS_INGEST_QUEUE_DEPTH", "2"))
+
+# threads that run CPU-bound work (query embedding) for async views
+ASYNC_CPU_WORKERS = int(os.getenv("WCS_ASYNC_CPU_WORKERS", "8"))
+
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=ASYNC_CPU_WORKERS, thread_name_prefix="cpu")
+
+#  indexing 
+
+class IndexingError(Exception):
+    """Raised when a URL cannot be fetched or yields no indexable content."""
+
+
+# fixed namespace so the same URL + chunk content always maps to the same point id
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c1a52-3c1e-4c55-9a3e-0b7f6f0c2a11")
+
+
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def chunk_point_id(url, chunk_hash):
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{url}#{chunk_hash}"))
+
+
+def domain_of(url):
+    return urlparse(url).netloc
+
+
+def per_domain_collection(domain):
+    return f"html_chunks_{domain.replace('.', '_')}"
+
+
+def collection_for_url(url):
+    """Each domain gets its own collection (``html_chunks_<domain>``) unless the layout is shared."""
+    if COLLECTION_LAYOUT == "shared":
+        return COLLECTION_NAME
+    return per_domain_collection(domain_of(url))
+
+
+def chunk_filter(url, scope="page"):
+    """Payload conditions selecting the chunks of ``url`` (``scope="page"``) or of its whole site.
+
+    In the shared layout every filter names the domain, so the store only
+    searches that tenant's part of the collection.
+    """
+    conditions = {}
+    if COLLECTION_LAYOUT == "shared":
+        conditions["domain"] = domain_of(url)
+    if scope == "page":
+        conditions["url"] = url
+    return conditions or None
+
+
+def url_filter(url):
+    return chunk_filter(url, "page")
+
+
+# keyword payload indexes of a per-domain collection
+PAYLOAD_INDEXES = {"url": "keyword"}
+# the shared collection also indexes the tenant key, which Qdrant uses to
+# co-locate each domain's points
+SHARED_PAYLOAD_INDEXES = {
+    "url": "keyword",
+    "domain": KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+}
+
+
+class CollectionRegistry:
+    """Process-wide record of the collections and payload indexes known to exist.
+
+    ``warm`` lists the collections once; afterwards ``ensure`` answers from
+    memory, and only a collection it has never seen costs a targeted
+    existence check (plus the creation of whatever is missing).
+    """
+
+    def __init__(self, get_store):
+        self.get_store = get_store
+        self._lock = threading.Lock()
+        # collection name -> payload fields known to be indexed (None = not checked yet)
+        self._known = {}
+        self._warmed = False
+
+    def warm(self):
+        """Record every existing collection with a single listing call."""
+        names = self.get_store().collection_names()
+        with self._lock:
+            for name in names:
+                self._known.setdefault(name, None)
+            self._warmed = True
+        return names
+
+    def forget(self, collection_name):
+        """Drop what is known about a collection, e.g. after an operation on it failed."""
+        with self._lock:
+            self._known.pop(collection_name, None)
+
+    def ensure(self, collection_name, payload_indexes=PAYLOAD_INDEXES, create_options=None):
+        """Create the collection and its payload indexes unless they are known to exist.
+
+        ``payload_indexes`` maps field names to index schemas; ``create_options``
+        (see ``profiles.collection_options``) only apply when the collection is created.
+        """
+        fields = self._known.get(collection_name)
+        if fields is not None and fields.issuperset(payload_indexes):
+            return
+
+        if not self._warmed:
+            self.warm()
+        with self._lock:
+            known = collection_name in self._known
+
+        if not known and not self.get_store().collection_exists(collection_name):
+            self._create(collection_name, create_options or collection_options())
+            existing = set()
+        else:
+            existing = self.get_store().payload_index_fields(collection_name)
+
+        for field, field_schema in payload_indexes.items():
+            if field not in existing:
+                self._create_payload_index(collection_name, field, field_schema)
+                existing.add(field)
+
+        with self._lock:
+            self._known[collection_name] = frozenset(existing)
+
+    def _create(self, collection_name, create_options):
+        try:
+            self.get_store().create_collection(collection_name, create_options)
+            print(f"Created collection: {collection_name}")
+        except Exception as e:
+            # another process may have created it since the existence check
+            if "already exists" not in str(e).lower():
+                raise
+
+    def _create_payload_index(self, collection_name, field, field_schema):
+        try:
+            self.get_store().create_payload_index(collection_name, field, field_schema)
+            print(f"Created index for '{field}' in {collection_name}")
+        except Exception as e:
+            if "already exists" not in str(e).lower():
+                print(f"Could not create index for '{field}': {e}")
+
+
+COLLECTIONS = CollectionRegistry(get_store)
+
+
+def ensure_collection(collection_name):
+    """Create collection if it doesn't exist and ensure its payload indexes exist."""
+    with span("ensure"):
+        if collection_name == COLLECTION_NAME:
+            # searches there always filter by domain, so graphs are built per tenant
+            COLLECTIONS.ensure(collection_name, SHARED_PAYLOAD_INDEXES, collection_options(multitenant=True))
+        else:
+            COLLECTIONS.ensure(collection_name, PAYLOAD_INDEXES, collection_options())
+
+
+def warm_up():
+    """Load the embedding model and list the collections ahead of the first request.
+
+    Run before forking workers (``gunicorn --preload``, ``run_workers
+    --preload``), the model weights are shared copy-on-write by every worker;
+    each worker still opens its own vector store connection.
+    """
+    started = time.perf_counter()
+    embeddings.warm_up()
+    try:
+        COLLECTIONS.warm()
+    except Exception as e:
+        # the store may not be reachable yet; collections are then checked on first use
+        print(f"Could not list collections during warm-up: {e}")
+    # keep the collector from touching (and so copying) the preloaded objects in forked children
+    gc.freeze()
+    print(f"Warmed up in {time.perf_counter() - started:.1f}s")
+
+
+def fetch_html(url, revalidate=False):
+    """Fetch ``url`` through the conditional-GET cache; see ``fetching.fetch_page``."""
+    try:
+        with span("fetch"):
+            return fetch_page(url, ttl=0) if revalidate else fetch_page(url)
+    except FetchError as e:
+        raise IndexingError(f"Failed to fetch the URL: {str(e)}")
+
+
+def build_points(url, chunks):
+    # one batched, cache-aware encode for the whole page
+    with span("embed"):
+        vectors = embed_texts([chunk["text"] for chunk in chunks])
+    points = []
+    for chunk, vector in zip(chunks, vectors):
+        points.append({
+            "id": chunk["id"],
+            "vector": vector.tolist(),
+            "payload": {
+                "url": url,
+                "domain": domain_of(url),
+                "chunk_index": chunk["chunk_index"],
+                "content_hash": chunk["hash"],
+                "text": chunk["text"],
+                # the fragment is already cleaned and truncated by the chunker;
+                # the <details> wrapper is added when results are returned
+                **preview_payload(chunk["hash"], chunk["html"]),
+                "token_start": chunk["token_start"],
+                "token_end": chunk["token_end"],
+                "source_line": chunk["source_line"],
+                "in_main_content": chunk["in_main_content"],
+            },
+        })
+    return points
+
+
+# payload fields that describe where a chunk sits on the page; they can change
+# while the chunk's content (and so its point id) stays the same
+POSITION_FIELDS = ("chunk_index", "token_start", "token_end", "source_line")
+
+
+def stored_chunk_positions(collection_name, url):
+    """Map point id -> position fields for every chunk currently stored for ``url``."""
+    with span("scroll"):
+        return {
+            str(record.id): {field: record.payload.get(field) for field in POSITION_FIELDS}
+            for record in get_store().scroll(collection_name, url_filter(url), fields=list(POSITION_FIELDS))
+        }
+
+
+# index operations running in this process, by (url, force)
+_index_flights = SingleFlight()
+
+
+def unchanged_result(page):
+    return page, {"added": 0, "removed": 0, "unchanged": page.chunk_count}
+
+
+def index_url(url, force=False):
+    """Fetch and index ``url``, writing only the chunks that changed.
+
+    A page whose HTML is unchanged (a 304 from the origin, a fresh fetch-cache
+    hit, or the same hash as last time) is skipped entirely unless ``force``
+    is set. Returns the ``IndexedPage`` and a summary of the changes made.
+
+    Concurrent calls for the same URL are single-flighted: threads of this
+    process share the result of the call already running, and other
+    processes wait on the URL's lock and then reuse what it stored.
+    """
+    requested_at = timezone.now()
+
+    def run():
+        with url_lock(url):
+            if not force:
+                page = IndexedPage.objects.filter(url=url, indexed_at__gte=requested_at).first()
+                if page is not None:
+                    # another process indexed the page while we waited for the lock
+                    return unchanged_result(page)
+            fetched = fetch_html(url, revalidate=force)
+            return _index_html(url, fetched.html, force=force)
+
+    return _index_flights.do((url, force), run)
+
+
+def index_html(url, html, force=False):
+    """Index already-fetched ``html`` as the content of ``url``.
+
+    Point ids are derived from the URL and the chunk content, so a chunk that
+    is already stored is neither re-embedded nor re-upserted. Holds the URL's
+    lock, so it never interleaves its deletes and upserts with another
+    indexing run of the same URL.
+    """
+    with url_lock(url):
+        return _index_html(url, html, force=force)
+
+
+def _index_html(url, html, force=False):
+    page_hash = content_hash(html)
+    collection_name = collection_for_url(url)
+
+    page = IndexedPage.objects.filter(url=url).first()
+    previous_collection = page.collection if page is not None else None
+    # a 304 / fresh cache hit returns the body indexed last time, so it hashes
+    # equal unless that indexing run failed part-way
+    unchanged = page is not None and page.content_hash == page_hash
+    if not force and unchanged and previous_collection == collection_name:
+        page.indexed_at = timezone.now()
+        page.save(update_fields=["indexed_at"])
+        return unchanged_result(page)
+
+    ensure_collection(collection_name)
+    try:
+        stored = stored_chunk_positions(collection_name, url)
+    except Exception:
+        # the collection may have been dropped behind our back; check it next time
+        COLLECTIONS.forget(collection_name)
+        raise
+
+    chunks = {}
+    added = []
+
+    def new_chunk_batches():
+        """Extract the page lazily, yielding batches of chunks that are not stored yet."""
+        batch = []
+        for chunk in iter_page_chunks(html):
+            chunk["hash"] = content_hash(chunk["text"], chunk["html"])
+            chunk["id"] = chunk_point_id(url, chunk["hash"])
+            # identical chunks on the same page share one point
+            if chunk["id"] in chunks:
+                continue
+            chunk["chunk_index"] = len(chunks)
+            chunks[chunk["id"]] = chunk
+            if chunk["id"] not in stored:
+                batch.append(chunk)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def upsert(points):
+        upsert_batch(get_store(), collection_name, points)
+        added.extend(points)
+
+    # extraction, embedding and upserts overlap: batch N+1 is being embedded
+    # while batch N is written to the vector store
+    try:
+        run_pipeline(
+            new_chunk_batches(),
+            [lambda batch: build_points(url, batch), upsert],
+            maxsize=INGEST_QUEUE_DEPTH,
+        )
+    except Exception:
+        COLLECTIONS.forget(collection_name)
+        raise
+    if not chunks:
+        raise IndexingError("No textual content found.")
+
+    removed = [point_id for point_id in stored if point_id not in chunks]
+    moved = [
+        chunk for point_id, chunk in chunks.items()
+        if point_id in stored
+        and stored[point_id] != {field: chunk[field] for field in POSITION_FIELDS}
+    ]
+
+    # old chunks are only removed once their replacements are searchable
+    if removed:
+        with span("delete"):
+            get_store().delete(collection_name, removed)
+        print(f"Deleted {len(removed)} stale chunks for URL: {url}")
+
+    if added and SUMMARIZE_ON_INDEX:
+        prefetch_summaries([point["payload"]["text"] for point in added])
+
+    # unchanged chunks that shifted position only need their position updated
+    if moved:
+        with span("set_payload"):
+            get_store().set_payloads(collection_name, [
+                (chunk["id"], {field: chunk[field] for field in POSITION_FIELDS}) for chunk in moved
+            ])
+
+    page, _ = IndexedPage.objects.update_or_create(
+        url=url,
+        defaults={
+            "domain": domain_of(url),
+            "collection": collection_name,
+            "chunk_count": len(chunks),
+            "content_hash": page_hash,
+            "indexed_at": timezone.now(),
+        },
+    )
+    if previous_collection and previous_collection != collection_name:
+        # stored under another layout before; those points would otherwise
+        # keep answering site searches there
+        delete_page_points(previous_collection, url)
+    return page, {
+        "added": len(added),
+        "removed": len(removed),
+        "unchanged": len(chunks) - len(added),
+    }
+
+
+def delete_page_points(collection_name, url):
+    """Delete every point of ``url`` from ``collection_name``, e.g. the collection of a previous layout."""
+    store = get_store()
+    try:
+        ids = [str(record.id) for record in store.scroll(collection_name, {"url": url}, fields=["url"])]
+        if ids:
+            with span("delete"):
+                store.delete(collection_name, ids)
+            print(f"Deleted {len(ids)} chunks of {url} from {collection_name}")
+    except Exception as e:
+        # e.g. the collection was dropped by migrate_to_shared_collection --delete-source
+        print(f"Could not delete the chunks of {url} from {collection_name}: {e}")
+
+
+def get_indexed_page(url):
+    """Return the stored page for ``url`` if it is indexed and fresh, else ``None``.
+
+    A page stored in another collection than the current layout puts it in
+    (e.g. per-domain before ``WCS_COLLECTION_LAYOUT=shared``) is stale too:
+    its points lack the ``domain`` payload that shared-layout searches filter on.
+    """
+    page = IndexedPage.objects.filter(url=url).first()
+    if page is None or page.is_stale(INDEX_TTL_SECONDS) or page.collection != collection_for_url(url):
+        return None
+    return page
+
+
+#  search 
+
+# how search results get their "summary": generated before responding,
+# left out, or started in the background and fetched via /api/summaries/
+SUMMARY_MODES = ("full", "none", "lazy")
+# what a search covers: the given page only, or every indexed page of its domain
+SEARCH_SCOPES = ("page", "site")
+
+
+def site_is_indexed(url):
+    """Whether any page of ``url``'s domain has been indexed in the current layout."""
+    return IndexedPage.objects.filter(domain=domain_of(url), collection=collection_for_url(url)).exists()
+
+
+# the only payload fields a search reads
+SEARCH_PAYLOAD_FIELDS = ["url", "chunk_index", "content_hash", "text", PREVIEW_FIELD, LEGACY_PREVIEW_FIELD]
+
+
+def format_hits(search_result):
+    """Turn vector store hits into the result dicts returned by the search API."""
+    results = []
+    for item in search_result:
+        payload = item.payload or {}
+        html_pretty = render_preview(payload)
+        score = getattr(item, "score", 0.0) or 0.0
+
+        results.append({
+            "id": item.id,
+            "summary": None,
+            "score": round(score, 6),
+            "accuracy": round(score * 100, 2),
+            "html_pretty": html_pretty,
+            # stored text is already plain text extracted at index time
+            "text": payload.get("text", ""),
+            "chunk_index": payload.get("chunk_index"),
+            "url": payload.get("url"),
+        })
+    return results
+
+
+def search_url(url, query, collection_name, limit=10, summaries="full", scope="page"):
+    """Embed ``query`` and search the already-indexed chunks of ``url`` (or its whole site)."""
+    with span("embed_query"):
+        query_vec = embed_query(query).tolist()
+    with span("search"):
+        search_result = get_store().search(
+            collection_name, query_vec, limit, chunk_filter(url, scope), fields=SEARCH_PAYLOAD_FIELDS
+        )
+    results = format_hits(search_result)
+
+    texts = [r["text"] for r in results]
+    if summaries == "full":
+        with span("summarize"):
+            generated = summarize_many(texts)
+        for r, summary in zip(results, generated):
+            r["summary"] = summary
+    elif summaries == "lazy":
+        prefetch_summaries(texts)
+    return results
+
+
+async def asearch_url(url, query, collection_name, limit=10, summaries="full", scope="page"):
+    """``search_url`` for async views: the query is embedded on ``CPU_EXECUTOR``
+    and the vector store and ChatGroq are awaited instead of blocking a thread."""
+    loop = asyncio.get_running_loop()
+    with span("embed_query"):
+        query_vec = (await loop.run_in_executor(CPU_EXECUTOR, embed_query, query)).tolist()
+    with span("search"):
+        search_result = await get_store().asearch(
+            collection_name, query_vec, limit, chunk_filter(url, scope), fields=SEARCH_PAYLOAD_FIELDS
+        )
+    results = format_hits(search_result)
+
+    texts = [r["text"] for r in results]
+    if summaries == "full":
+        with span("summarize"):
+            generated = await asummarize_many(texts)
+        for r, summary in zip(results, generated):
+            r["summary"] = summary
+    elif summaries == "lazy":
+        await sync_to_async(prefetch_summaries)(texts)
+    return results
+
+
+def summarize_points(url, point_ids):
+    """Summarize stored chunks of ``url`` by point id (for lazy summaries)."""
+    records = get_store().retrieve(collection_for_url(url), point_ids, fields=["url", "text"])
+    records = [r for r in records if r.payload.get("url") == url]
+    texts = [r.payload.get("text", "") for r in records]
+    return {str(r.id): summary for r, summary in zip(records, summarize_many(texts))}
@@ -0,0 +1,315 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from .crawler import crawl_site
+from .indexing import index_html, index_url
+from .locks import pid_alive
+from .metrics import Gauge, Histogram
+from .models import Job
+
+load_dotenv()
+
+# "queue": jobs wait in the database for `manage.py run_workers` processes;
+# "thread": each job runs on a background thread of the process that submitted it
+JOB_RUNNER = os.getenv("WCS_JOB_RUNNER", "queue")
+# worker processes started by `manage.py run_workers`
+JOB_WORKERS = int(os.getenv("WCS_JOB_WORKERS", "2"))
+# seconds an idle worker waits before looking for new jobs again
+JOB_POLL_INTERVAL = float(os.getenv("WCS_JOB_POLL_INTERVAL", "0.5"))
+# seconds between a process's heartbeats for the jobs it is running
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("WCS_JOB_HEARTBEAT_INTERVAL", "10"))
+# a running job without a heartbeat for this long is taken back from its worker
+JOB_STALE_SECONDS = float(os.getenv("WCS_JOB_STALE_SECONDS", "60"))
+# claims of a job before a worker dying on it fails the job instead of re-queuing it
+JOB_MAX_ATTEMPTS = int(os.getenv("WCS_JOB_MAX_ATTEMPTS", "3"))
+
+
+JOB_SECONDS = Histogram("wcs_job_seconds", "Job run time by kind and outcome.", ["kind", "status"])
+
+
+def active_job_counts():
+    counts = {(kind, job_status): 0 for kind in HANDLERS for job_status in Job.ACTIVE_STATUSES}
+    rows = (
+        Job.objects.filter(status__in=Job.ACTIVE_STATUSES)
+        .order_by().values("kind", "status").annotate(n=Count("id"))
+    )
+    for row in rows:
+        counts[(row["kind"], row["status"])] = row["n"]
+    return counts
+
+
+def index_crawled_page(url, html):
+    """``index_html`` for crawler executor threads, which don't go through Django's request cycle."""
+    try:
+        return index_html(url, html)
+    finally:
+        close_old_connections()
+
+
+def crawl(url, **options):
+    """Crawl the site ``url`` belongs to and index every page found."""
+    return crawl_site(url, index_crawled_page, **options)
+
+
+def index(url, force=False):
+    page, changes = index_url(url, force=force)
+    return {
+        "collection": page.collection,
+        "chunks": page.chunk_count,
+        "indexed_at": page.indexed_at.isoformat(),
+        **changes,
+    }
+
+
+# job kind -> callable(url, **params) returning the job's JSON result
+HANDLERS = {
+    Job.KIND_INDEX: index,
+    Job.KIND_CRAWL: crawl,
+}
+JOB_QUEUE_DEPTH = Gauge("wcs_jobs", "Queued and running jobs (the job queue depth).", active_job_counts, ["kind", "status"])
+
+
+def worker_id(pid=None):
+    """Identity recorded on the jobs a process runs: ``<host>:<pid>``."""
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+
+class JobHeartbeat:
+    """Background thread refreshing ``heartbeat_at`` of the jobs this process is running."""
+
+    def __init__(self, interval=JOB_HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # like the metrics flusher, a thread started before a fork is gone in the child
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="job-heartbeat", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                Job.objects.filter(status=Job.STATUS_RUNNING, worker=worker_id()).update(
+                    heartbeat_at=timezone.now()
+                )
+            except Exception as e:
+                print(f"Could not record the job heartbeat: {e}")
+            finally:
+                close_old_connections()
+
+
+HEARTBEAT = JobHeartbeat()
+
+
+def submit_job(kind, url, params=None):
+    """Queue a job, or return the one already queued or running for ``kind`` + ``url``.
+
+    Returns ``(job, created)``. The partial unique constraint on active jobs
+    makes the deduplication hold across processes, not just in this one. A
+    running job whose process died is recovered first, so it can't block the
+    URL.
+    """
+    params = params or {}
+    active = Job.objects.filter(kind=kind, url=url, status__in=Job.ACTIVE_STATUSES)
+    requeue_stale_jobs(active)
+    job = active.first()
+    if job is not None:
+        job = join_job(job, params)
+        if JOB_RUNNER == "thread" and job.status == Job.STATUS_QUEUED:
+            start_job(job)
+        return job, False
+    try:
+        job = Job.objects.create(kind=kind, url=url, params=params)
+    except IntegrityError:
+        # another process queued the same URL between the check and the insert
+        job = active.first()
+        if job is None:
+            raise
+        return join_job(job, params), False
+    if JOB_RUNNER == "thread":
+        start_job(job)
+    return job, True
+
+
+def join_job(job, params):
+    """Fold the ``params`` of a duplicate submission into the active ``job``.
+
+    Only ``force`` is carried over, so a forced request is never swallowed by
+    an unforced job for the same URL: a queued job simply runs forced, and a
+    running one runs again, forced, once its current run ends (see ``run_job``).
+    """
+    if not params.get("force") or job.params.get("force"):
+        return job
+    Job.objects.filter(pk=job.pk, status__in=Job.ACTIVE_STATUSES).update(params={**job.params, "force": True})
+    job.refresh_from_db()
+    return job
+
+
+def claim_job(job):
+    """Take the queued ``job`` for this process; ``False`` if another process was faster."""
+    # the conditional UPDATE lets exactly one worker win each job
+    now = timezone.now()
+    claimed = Job.objects.filter(pk=job.pk, status=Job.STATUS_QUEUED).update(
+        status=Job.STATUS_RUNNING, started_at=now, worker=worker_id(), heartbeat_at=now,
+        attempts=F("attempts") + 1,
+    )
+    if not claimed:
+        return False
+    job.refresh_from_db()
+    HEARTBEAT.ensure_started()
+    return True
+
+
+def claim_next_job():
+    """Atomically take the oldest queued job, or return ``None`` if there is none."""
+    while True:
+        job = Job.objects.filter(status=Job.STATUS_QUEUED).order_by("id").first()
+        if job is None:
+            return None
+        if claim_job(job):
+            return job
+
+
+def run_job(job):
+    """Run ``job`` on the calling thread, recording its status and result."""
+    if job.status != Job.STATUS_RUNNING:
+        job.status = Job.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+    started = time.perf_counter()
+    while True:
+        params = job.params
+        try:
+            handler = HANDLERS.get(job.kind)
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            job.result = handler(job.url, **params)
+            job.status = Job.STATUS_DONE
+            job.error = ""
+        except Exception as e:
+            print(f"Job {job.pk} ({job.kind} {job.url}) failed: {e}")
+            job.status = Job.STATUS_FAILED
+            job.error = str(e)
+        job.finished_at = timezone.now()
+        finished = Job.objects.filter(pk=job.pk)
+        if not params.get("force"):
+            # unless a forced submission joined the job while it ran
+            finished = finished.exclude(params__force=True)
+        if finished.update(status=job.status, result=job.result, error=job.error, finished_at=job.finished_at):
+            break
+        job.refresh_from_db(fields=["params"])
+    JOB_SECONDS.observe(time.perf_counter() - started, kind=job.kind, status=job.status)
+    return job
+
+
+def start_job(job):
+    """Run ``job`` on a background thread so the request that created it can return."""
+
+    if not claim_job(job):
+        return
+
+    def target():
+        try:
+            run_job(job)
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=target, name=f"job-{job.pk}", daemon=True).start()
+
+
+def work(stop=None, poll_interval=JOB_POLL_INTERVAL):
+    """Worker loop: claim and run queued jobs until ``stop`` (an Event) is set."""
+    stop = stop or threading.Event()
+    next_check = 0.0
+    while not stop.is_set():
+        try:
+            if time.monotonic() >= next_check:
+                # take back jobs of processes that died, on this host or another
+                requeue_stale_jobs()
+                next_check = time.monotonic() + JOB_STALE_SECONDS / 2
+            job = claim_next_job()
+            if job is None:
+                stop.wait(poll_interval)
+                continue
+            run_job(job)
+        finally:
+            close_old_connections()
+
+
+def recover_jobs(jobs, reason):
+    """Re-queue the running ``jobs`` of a process that died, or fail those out of attempts.
+
+    Returns the number of jobs recovered. A job whose heartbeat changed in the
+    meantime is still alive and left alone.
+    """
+    recovered = 0
+    for job in jobs.filter(status=Job.STATUS_RUNNING):
+        current = Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, heartbeat_at=job.heartbeat_at)
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            print(f"Job {job.pk} ({job.kind} {job.url}) failed: {reason}")
+            recovered += current.update(
+                status=Job.STATUS_FAILED, error=f"{reason} ({job.attempts} attempts)", finished_at=timezone.now(),
+            )
+        else:
+            recovered += current.update(status=Job.STATUS_QUEUED, started_at=None, worker="", heartbeat_at=None)
+    return recovered
+
+
+def requeue_worker_jobs(pid):
+    """Recover the jobs of the worker process ``pid`` on this host after it exited."""
+    return recover_jobs(Job.objects.filter(worker=worker_id(pid)), "the worker process exited")
+
+
+def requeue_stale_jobs(jobs=None):
+    """Recover running jobs (of ``jobs``, default all) whose heartbeat is older than ``JOB_STALE_SECONDS``."""
+    cutoff = timezone.now() - timedelta(seconds=JOB_STALE_SECONDS)
+    jobs = Job.objects.all() if jobs is None else jobs
+    # no heartbeat at all: claimed before heartbeats were recorded
+    stale = jobs.filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True))
+    return recover_jobs(stale, "the worker stopped responding")
+
+
+def requeue_interrupted_jobs():
+    """Recover jobs left ``running`` by processes of this host that are gone, and stale jobs anywhere."""
+    prefix = f"{socket.gethostname()}:"
+    dead = [
+        job.worker for job in Job.objects.filter(status=Job.STATUS_RUNNING, worker__startswith=prefix)
+        if not pid_alive(int(job.worker[len(prefix):]))
+    ]
+    recovered = recover_jobs(Job.objects.filter(worker__in=dead), "the worker process exited")
+    return recovered + requeue_stale_jobs()
+
+
+def wait_for_job(job, timeout, poll_interval=0.2):
+    """Poll ``job`` until it finishes or ``timeout`` seconds pass; returns the refreshed job."""
+    deadline = time.monotonic() + timeout
+    while True:
+        job.refresh_from_db()
+        if job.is_finished or time.monotonic() >= deadline:
+            return job
+        time.sleep(poll_interval)
+
+
+async def await_job(job, timeout, poll_interval=0.2):
+    """``wait_for_job`` for async views: polls without holding a thread."""
+    deadline = time.monotonic() + timeout
+    while True:
+        await job.arefresh_from_db()
+        if job.is_finished or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(poll_interval)
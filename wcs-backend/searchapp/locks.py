@@ -0,0 +1,84 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+import portalocker
+from django.conf import settings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# one lock file per URL lives here; every process on the host must share it
+LOCK_DIR = os.getenv("WCS_LOCK_DIR", str(Path(settings.BASE_DIR) / "var" / "locks"))
+# longest a process waits for another one to finish indexing the same URL
+LOCK_TIMEOUT = float(os.getenv("WCS_LOCK_TIMEOUT", "300"))
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key into one execution.
+
+    The first caller runs the function; callers arriving while it runs wait
+    and receive the same result (or exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+@contextmanager
+def url_lock(url, timeout=LOCK_TIMEOUT):
+    """Exclusive lock on ``url`` shared by every thread and process on this host.
+
+    Backed by ``flock`` on a per-URL file, so it is released even if the
+    holder crashes. Raises ``TimeoutError`` after waiting ``timeout`` seconds.
+    """
+    directory = Path(LOCK_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.lock"
+    lock = portalocker.Lock(str(path), mode="a", timeout=timeout, check_interval=0.05)
+    try:
+        lock.acquire()
+    except portalocker.LockException:
+        raise TimeoutError(f"Timed out waiting for the indexing lock on {url}")
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def pid_alive(pid):
+    """Whether a process with ``pid`` exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # it exists, but belongs to another user
+        return True
+    return True
@@ -0,0 +1,137 @@
+import gc
+import json
+import os
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from searchapp.benchmarks import percentile
+from searchapp.embeddings import EMBED_BACKENDS, EMBED_BATCH_SIZE, load_model
+from searchapp.extraction import iter_page_chunks
+from searchapp.management.commands.bench_parsers import DEFAULT_CORPUS, load_corpus
+
+# lowest cosine similarity to the float32 PyTorch embedding a backend may produce
+DEFAULT_MIN_COSINE = float(os.getenv("WCS_EMBED_MIN_COSINE", "0.99"))
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def encode(model, texts, batch_size):
+    return np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+def cosines(reference, vectors):
+    """Row-wise cosine similarity between two ``(n, dim)`` arrays."""
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(vectors, axis=1)
+    return (reference * vectors).sum(axis=1) / np.where(norms == 0, 1, norms)
+
+
+class Command(BaseCommand):
+    help = "Compare embedding backends on encode throughput, memory and agreement with float32 PyTorch."
+    # standalone benchmark: skip URL checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", nargs="*", default=[str(DEFAULT_CORPUS)],
+                            help="HTML files or directories whose chunks are encoded (default: benchmarks/pages).")
+        parser.add_argument("--backends", nargs="+", default=list(EMBED_BACKENDS), choices=list(EMBED_BACKENDS))
+        parser.add_argument("--limit", type=int, default=512, help="Maximum chunks to encode.")
+        parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+        parser.add_argument("--repeat", type=int, default=3, help="Timed passes over the chunks (best is reported).")
+        parser.add_argument("--queries", type=int, default=50, help="Single-text encodes timed for query latency.")
+        parser.add_argument("--min-cosine", type=float, default=DEFAULT_MIN_COSINE,
+                            help="Fail if any chunk's cosine to the torch embedding is lower.")
+        parser.add_argument("--output", help="Also write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        texts = [
+            chunk["text"]
+            for html in load_corpus(options["corpus"]).values()
+            for chunk in iter_page_chunks(html)
+        ][:options["limit"]]
+        if not texts:
+            raise CommandError("No chunks found in the corpus.")
+        batch_size = options["batch_size"]
+        # the reference is always computed, even when torch itself is not benchmarked
+        backends = ["torch"] + [b for b in options["backends"] if b != "torch"]
+
+        results = {}
+        reference = None
+        for name in backends:
+            gc.collect()
+            rss_before = rss_bytes()
+            started = time.perf_counter()
+            try:
+                model = load_model(name)
+            except Exception as e:
+                if name == "torch":
+                    raise CommandError(f"Could not load the reference torch backend: {e}")
+                self.stdout.write(self.style.WARNING(f"{name}: unavailable ({e})"))
+                continue
+            load_s = time.perf_counter() - started
+
+            # first pass warms up the runtime and is the one compared for accuracy
+            vectors = encode(model, texts, batch_size)
+            if reference is None:
+                reference = vectors
+            passes = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                encode(model, texts, batch_size)
+                passes.append(time.perf_counter() - started)
+            latencies = []
+            for text in texts[:options["queries"]]:
+                started = time.perf_counter()
+                model.encode(text)
+                latencies.append((time.perf_counter() - started) * 1000)
+            rss_after = rss_bytes()
+
+            agreement = cosines(reference, vectors)
+            if name in options["backends"]:
+                results[name] = {
+                    "texts_per_s": round(len(texts) / min(passes), 1),
+                    "query_p50_ms": round(percentile(latencies, 50), 3),
+                    "query_p95_ms": round(percentile(latencies, 95), 3),
+                    "load_s": round(load_s, 2),
+                    "rss_mb": round((rss_after - rss_before) / 2**20, 1),
+                    "min_cosine": round(float(agreement.min()), 5),
+                    "mean_cosine": round(float(agreement.mean()), 5),
+                }
+            del model
+        if not results:
+            raise CommandError("None of the requested backends could be loaded.")
+
+        base = results.get("torch", {}).get("texts_per_s")
+        self.stdout.write(f"{len(texts)} chunks, batch size {batch_size}, best of {options['repeat']} passes")
+        self.stdout.write(f"{'backend':<12}{'texts/s':>9}{'speedup':>9}{'q p50 ms':>10}{'q p95 ms':>10}"
+                          f"{'load s':>8}{'RSS MB':>8}{'min cos':>9}{'mean cos':>10}")
+        for name, r in results.items():
+            speedup = f"{r['texts_per_s'] / base:.2f}x" if base else "-"
+            self.stdout.write(
+                f"{name:<12}{r['texts_per_s']:>9.1f}{speedup:>9}{r['query_p50_ms']:>10.2f}{r['query_p95_ms']:>10.2f}"
+                f"{r['load_s']:>8.2f}{r['rss_mb']:>8.1f}{r['min_cosine']:>9.4f}{r['mean_cosine']:>10.4f}"
+            )
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps({
+                "chunks": len(texts),
+                "batch_size": batch_size,
+                "min_cosine": options["min_cosine"],
+                "backends": results,
+            }, indent=2))
+
+        failed = [name for name, r in results.items() if r["min_cosine"] < options["min_cosine"]]
+        if failed:
+            raise CommandError(
+                f"{', '.join(failed)}: embeddings deviate from torch beyond cosine {options['min_cosine']}"
+            )
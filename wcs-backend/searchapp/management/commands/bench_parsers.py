@@ -0,0 +1,103 @@
+import json
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from searchapp.extraction import PAGE_JUNK_TAGS, PARSERS, iter_chunks, parse_html
+
+DEFAULT_CORPUS = Path(settings.BASE_DIR) / "benchmarks" / "pages"
+
+
+def load_corpus(paths):
+    """Read every ``*.html`` file under ``paths`` (files or directories)."""
+    pages = {}
+    for path in map(Path, paths):
+        files = sorted(path.glob("*.html")) if path.is_dir() else [path]
+        for file in files:
+            pages[file.name] = file.read_text(encoding="utf-8", errors="replace")
+    return pages
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid - 1] + values[mid]) / 2
+
+
+class Command(BaseCommand):
+    help = "Compare HTML parser backends on parse + chunk time and chunk output."
+    # standalone benchmark: skip system checks, which import every view module
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="*", default=[str(DEFAULT_CORPUS)],
+                            help="HTML files or directories of saved pages (default: benchmarks/pages).")
+        parser.add_argument("--parsers", nargs="+", default=list(PARSERS), choices=list(PARSERS))
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per page (median is reported).")
+        parser.add_argument("--output", help="Also write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        pages = load_corpus(options["paths"])
+        if not pages:
+            raise CommandError("No .html pages found.")
+
+        results = {}
+        baseline = None
+        for name in options["parsers"]:
+            try:
+                parse_html("<p>probe</p>", name)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"{name}: unavailable ({e})"))
+                continue
+
+            parse_ms, chunk_ms, outputs = [], [], {}
+            for page, html in pages.items():
+                page_parse, page_chunk = [], []
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    soup = parse_html(html, name)
+                    parsed = time.perf_counter()
+                    for junk in soup(PAGE_JUNK_TAGS):
+                        junk.decompose()
+                    chunks = list(iter_chunks(soup))
+                    done = time.perf_counter()
+                    page_parse.append((parsed - start) * 1000)
+                    page_chunk.append((done - parsed) * 1000)
+                parse_ms.append(median(page_parse))
+                chunk_ms.append(median(page_chunk))
+                outputs[page] = chunks
+
+            if baseline is None:
+                baseline = outputs
+            same_text = sum(
+                [c["text"] for c in outputs[p]] == [c["text"] for c in baseline[p]] for p in pages
+            )
+            same_html = sum(
+                [c["html"] for c in outputs[p]] == [c["html"] for c in baseline[p]] for p in pages
+            )
+            results[name] = {
+                "parse_ms": round(sum(parse_ms), 3),
+                "chunk_ms": round(sum(chunk_ms), 3),
+                "total_ms": round(sum(parse_ms) + sum(chunk_ms), 3),
+                "chunks": sum(len(chunks) for chunks in outputs.values()),
+                "pages_same_text": same_text,
+                "pages_same_html": same_html,
+            }
+
+        if not results:
+            raise CommandError("None of the requested parsers are installed.")
+
+        self.stdout.write(f"{len(pages)} pages, median of {options['repeat']} runs, times summed over pages")
+        self.stdout.write(
+            f"{'parser':<14}{'parse ms':>10}{'chunk ms':>10}{'total ms':>10}{'chunks':>8}{'same text':>11}{'same html':>11}"
+        )
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<14}{r['parse_ms']:>10.2f}{r['chunk_ms']:>10.2f}{r['total_ms']:>10.2f}{r['chunks']:>8}"
+                f"{r['pages_same_text']:>8}/{len(pages):<2}{r['pages_same_html']:>8}/{len(pages):<2}"
+            )
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps({"pages": len(pages), "parsers": results}, indent=2))
@@ -0,0 +1,167 @@
+import json
+import os
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import CollectionStatus, PointStruct
+
+from searchapp.benchmarks import percentile
+from searchapp.embeddings import EMBEDDING_DIM, embed_texts
+from searchapp.extraction import iter_page_chunks
+from searchapp.management.commands.bench_parsers import DEFAULT_CORPUS, load_corpus
+from searchapp.profiles import (
+    COLLECTION_PROFILES,
+    HNSW_EF,
+    HNSW_EF_CONSTRUCT,
+    HNSW_M,
+    collection_options,
+    search_params,
+)
+from searchapp.vectorstore import QDRANT_API_KEY, QDRANT_URL
+
+# bytes of vector data per point that must stay in RAM, by profile
+RAM_BYTES_PER_VECTOR = {
+    "float32": EMBEDDING_DIM * 4,
+    "int8": EMBEDDING_DIM,
+    "binary": EMBEDDING_DIM // 8,
+}
+
+
+class Command(BaseCommand):
+    help = "Compare collection profiles (float32, int8, binary) on recall@k, latency and vector RAM."
+    # standalone benchmark: skip URL checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", help="Read vectors from this existing collection instead of the page corpus.")
+        parser.add_argument("--corpus", nargs="*", default=[str(DEFAULT_CORPUS)],
+                            help="HTML files or directories whose chunks are embedded (default: benchmarks/pages).")
+        parser.add_argument("--limit", type=int, default=20000, help="Maximum vectors to index.")
+        parser.add_argument("--queries", type=int, default=100,
+                            help="Vectors held out of the index and used as queries.")
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--profiles", nargs="+", default=list(COLLECTION_PROFILES),
+                            choices=list(COLLECTION_PROFILES))
+        parser.add_argument("--m", type=int, default=HNSW_M)
+        parser.add_argument("--ef-construct", type=int, default=HNSW_EF_CONSTRUCT)
+        parser.add_argument("--hnsw-ef", type=int, default=HNSW_EF)
+        parser.add_argument("--oversampling", type=float, help="Override the profiles' oversampling.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections afterwards.")
+        parser.add_argument("--output", help="Also write the results as JSON to this file.")
+
+    def load_vectors(self, options):
+        if options["source"]:
+            vectors = []
+            offset = None
+            while len(vectors) < options["limit"] + options["queries"]:
+                records, offset = self.qdrant.scroll(
+                    collection_name=options["source"], limit=1000, offset=offset,
+                    with_payload=False, with_vectors=True,
+                )
+                vectors.extend(record.vector for record in records)
+                if offset is None:
+                    break
+            return np.asarray(vectors, dtype=np.float32)
+
+        texts = [
+            chunk["text"]
+            for html in load_corpus(options["corpus"]).values()
+            for chunk in iter_page_chunks(html)
+        ]
+        return embed_texts(texts[:options["limit"] + options["queries"]], persist=False)
+
+    def build(self, name, profile, vectors, options):
+        self.qdrant.create_collection(
+            collection_name=name,
+            **collection_options(profile, m=options["m"], ef_construct=options["ef_construct"]),
+        )
+        for start in range(0, len(vectors), 256):
+            self.qdrant.upsert(collection_name=name, points=[
+                PointStruct(id=start + i, vector=vector.tolist())
+                for i, vector in enumerate(vectors[start:start + 256])
+            ])
+        # let the optimizer finish building the index and quantized vectors
+        while self.qdrant.get_collection(name).status != CollectionStatus.GREEN:
+            time.sleep(0.5)
+
+    def handle(self, *args, **options):
+        # quantization is a Qdrant feature: this benchmark always talks to the
+        # server, whatever WCS_VECTOR_BACKEND is set to
+        self.qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
+        vectors = self.load_vectors(options)
+        if len(vectors) <= options["queries"]:
+            raise CommandError(f"Need more than {options['queries']} vectors, found {len(vectors)}.")
+
+        rng = random.Random(options["seed"])
+        order = list(range(len(vectors)))
+        rng.shuffle(order)
+        queries = vectors[order[:options["queries"]]]
+        indexed = vectors[order[options["queries"]:]][:options["limit"]]
+        k = options["k"]
+        prefix = f"bench_quantization_{os.getpid()}"
+
+        results = {}
+        truth = None
+        try:
+            # exact float32 search is the ground truth every profile is measured against
+            baseline = f"{prefix}_truth"
+            self.build(baseline, "float32", indexed, options)
+            exact = search_params("float32", exact=True)
+            truth = [
+                {hit.id for hit in self.qdrant.search(collection_name=baseline, query_vector=q.tolist(),
+                                                 limit=k, search_params=exact)}
+                for q in queries
+            ]
+
+            for profile in options["profiles"]:
+                name = f"{prefix}_{profile}"
+                started = time.perf_counter()
+                self.build(name, profile, indexed, options)
+                build_s = time.perf_counter() - started
+                params = search_params(profile, hnsw_ef=options["hnsw_ef"], oversampling=options["oversampling"])
+
+                recalls, latencies = [], []
+                for q, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    hits = self.qdrant.search(collection_name=name, query_vector=q.tolist(), limit=k,
+                                         search_params=params)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    recalls.append(len({hit.id for hit in hits} & expected) / max(1, len(expected)))
+
+                results[profile] = {
+                    f"recall@{k}": round(sum(recalls) / len(recalls), 4),
+                    "p50_ms": round(percentile(latencies, 50), 3),
+                    "p95_ms": round(percentile(latencies, 95), 3),
+                    "build_s": round(build_s, 2),
+                    "ram_bytes_per_vector": RAM_BYTES_PER_VECTOR[profile],
+                }
+        finally:
+            if not options["keep"]:
+                for c in self.qdrant.get_collections().collections:
+                    if c.name.startswith(prefix):
+                        self.qdrant.delete_collection(c.name)
+
+        self.stdout.write(f"{len(indexed)} vectors, {len(queries)} queries, m={options['m']}, "
+                          f"ef_construct={options['ef_construct']}, hnsw_ef={options['hnsw_ef'] or 'default'}")
+        self.stdout.write(f"{'profile':<10}{f'recall@{k}':>11}{'p50 ms':>9}{'p95 ms':>9}{'build s':>9}{'RAM B/vec':>11}")
+        for profile, r in results.items():
+            self.stdout.write(
+                f"{profile:<10}{r[f'recall@{k}']:>11.4f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                f"{r['build_s']:>9.2f}{r['ram_bytes_per_vector']:>11}"
+            )
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps({
+                "vectors": len(indexed),
+                "queries": len(queries),
+                "k": k,
+                "m": options["m"],
+                "ef_construct": options["ef_construct"],
+                "hnsw_ef": options["hnsw_ef"],
+                "profiles": results,
+            }, indent=2))
@@ -0,0 +1,325 @@
+import json
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from searchapp import embeddings, fetching, jobs, locks, metrics, summaries
+from searchapp.benchmarks import percentile
+from searchapp.extraction import iter_page_chunks
+from searchapp.models import ChunkSummary
+from searchapp.management.commands.bench_parsers import DEFAULT_CORPUS, load_corpus
+from searchapp.vectorstore import LocalStore, QdrantStore, set_store
+
+STUB_SUMMARY = "Stub summary of the chunk for benchmarking."
+
+
+def peak_rss_bytes():
+    """The process's high-water mark since it started (it never goes down)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss_bytes():
+    """Resident set size right now, or ``None`` where ``/proc`` is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextmanager
+def sampling_rss(interval=0.05):
+    """Track the highest current RSS while the block runs; yields a dict whose ``"mb"`` is set on exit.
+
+    Unlike ``peak_rss_bytes`` this belongs to the block alone, so a later
+    run does not inherit an earlier run's peak.
+    """
+    result = {"mb": None}
+    samples = []
+    done = threading.Event()
+
+    def sample():
+        while True:
+            rss = current_rss_bytes()
+            if rss is not None:
+                samples.append(rss)
+            if done.wait(interval):
+                return
+
+    thread = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    thread.start()
+    try:
+        yield result
+    finally:
+        done.set()
+        thread.join()
+        rss = current_rss_bytes()
+        if rss is not None:
+            samples.append(rss)
+        if samples:
+            result["mb"] = round(max(samples) / 2**20, 1)
+
+
+def latency_stats(seconds):
+    if not seconds:
+        return {"count": 0}
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "total_ms": round(sum(seconds) * 1000, 3),
+    }
+
+
+def stage_stats(samples):
+    by_stage = {}
+    for stage, seconds in samples:
+        by_stage.setdefault(stage, []).append(seconds)
+    return {stage: latency_stats(values) for stage, values in sorted(by_stage.items())}
+
+
+class FixtureServer:
+    """Local HTTP server for the benchmark: serves the saved pages and stands in for ChatGroq."""
+
+    def __init__(self, pages, summary_latency):
+        pages = {f"/{quote(name)}": html.encode("utf-8") for name, html in pages.items()}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.reply(body, "text/html; charset=utf-8")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(summary_latency)
+                body = json.dumps({"choices": [{"message": {"content": STUB_SUMMARY}}]}).encode()
+                self.reply(body, "application/json")
+
+            def reply(self, body, content_type):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.urls = [self.base_url + path for path in pages]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, name="bench-fixtures", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark indexing and search end to end on saved pages, offline: local fixture server, "
+            "throwaway database and vector store, stub summarizer.")
+    # standalone benchmark: skip URL checks
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", nargs="*", default=[str(DEFAULT_CORPUS)],
+                            help="HTML files or directories of saved pages (default: benchmarks/pages).")
+        parser.add_argument("--store", choices=["local", "memory"], default="local",
+                            help="Vector store: LocalStore in a temporary directory, or in-process Qdrant.")
+        parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16],
+                            help="Concurrent clients for the search runs.")
+        parser.add_argument("--requests", type=int, default=200, help="Searches per concurrency level.")
+        parser.add_argument("--summaries", choices=["full", "none", "lazy"], default="full")
+        parser.add_argument("--summary-latency-ms", type=float, default=50,
+                            help="Response time of the stub summarizer.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--baseline", help="Earlier --output file to compare against.")
+        parser.add_argument("--max-regression", type=float, default=0.2,
+                            help="Fail when a p95 grows, or throughput drops, by more than this fraction.")
+
+    def handle(self, *args, **options):
+        pages = load_corpus(options["corpus"])
+        if not pages:
+            raise CommandError("No .html pages found.")
+
+        tmp = tempfile.TemporaryDirectory(prefix="bench_search_")
+        # everything the run writes stays out of the configured database and var/
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = str(Path(tmp.name) / "db.sqlite3")
+        setup_test_environment()
+        old_db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.isolate(tmp.name, options)
+            with FixtureServer(pages, options["summary_latency_ms"] / 1000) as fixtures:
+                summaries.CHATGROQ_API_URL = fixtures.base_url + "/chatgroq"
+                results = self.run(fixtures.urls, pages, options)
+        finally:
+            close_old_connections()
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+            teardown_test_environment()
+            tmp.cleanup()
+
+        self.report(results)
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+        if options["baseline"]:
+            self.compare(results, json.loads(Path(options["baseline"]).read_text()), options["max_regression"])
+
+    def isolate(self, directory, options):
+        self.directory = Path(directory)
+        if options["store"] == "local":
+            set_store(LocalStore(self.directory / "vectors"))
+        else:
+            set_store(QdrantStore(location=":memory:"))
+        locks.LOCK_DIR = str(self.directory / "locks")
+        self.cold_caches("index")
+        # index jobs run in this process; the search runs only hit indexed pages
+        jobs.JOB_RUNNER = "thread"
+        # keep the benchmark's samples out of the service's /metrics totals
+        metrics.FLUSHER.directory = None
+
+    def cold_caches(self, run):
+        """Start ``run`` with empty caches, so every run does the same work."""
+        # embeddings are computed, not read from var/embeddings or an earlier run
+        embeddings.set_embedding_cache(embeddings.EmbeddingCache())
+        fetching.PAGE_CACHE = fetching.PageCache(self.directory / "fetch" / run)
+        ChunkSummary.objects.all().delete()
+
+    def run(self, urls, pages, options):
+        results = {
+            "pages": len(urls),
+            "store": options["store"],
+            "summaries": options["summaries"],
+            "summary_latency_ms": options["summary_latency_ms"],
+            "embed_backend": embeddings.EMBED_BACKEND,
+        }
+
+        started = time.perf_counter()
+        embeddings.warm_up()
+        results["model_load_s"] = round(time.perf_counter() - started, 2)
+
+        # cold indexing, as an index job runs it: fetch, extract, embed, upsert
+        latencies = []
+        with metrics.recording() as samples, sampling_rss() as rss:
+            for url in urls:
+                started = time.perf_counter()
+                jobs.index(url)
+                latencies.append(time.perf_counter() - started)
+        results["index"] = {**latency_stats(latencies), "stages": stage_stats(samples), "rss_mb": rss["mb"]}
+
+        # queries are runs of words from the pages' own chunks
+        rng = random.Random(options["seed"])
+        chunk_texts = {
+            url: [chunk["text"] for chunk in iter_page_chunks(html)]
+            for url, html in zip(urls, pages.values())
+        }
+        workload = []
+        for _ in range(options["requests"]):
+            url = rng.choice(urls)
+            words = rng.choice(chunk_texts[url] or ["benchmark"]).split()
+            start = rng.randrange(max(1, len(words) - 6))
+            workload.append({"url": url, "query": " ".join(words[start:start + 6]), "summaries": options["summaries"]})
+
+        results["search"] = {}
+        for concurrency in options["concurrency"]:
+            # each level starts cold: summaries and query embeddings of the
+            # previous level would otherwise make the later levels look faster
+            self.cold_caches(f"search-{concurrency}")
+            results["search"][str(concurrency)] = self.run_searches(workload, concurrency)
+        # once per run: the process-wide high-water mark covers every level
+        results["peak_rss_mb"] = round(peak_rss_bytes() / 2**20, 1)
+        return results
+
+    def run_searches(self, workload, concurrency):
+        """POST every search of ``workload`` through the full Django stack from ``concurrency`` threads."""
+        local = threading.local()
+
+        def search(body):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client()
+            started = time.perf_counter()
+            response = client.post("/api/search/", body, content_type="application/json")
+            return time.perf_counter() - started, response.status_code
+
+        with metrics.recording() as samples, sampling_rss() as rss:
+            wall = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+                outcomes = list(pool.map(search, workload))
+            wall = time.perf_counter() - wall
+        latencies = [seconds for seconds, code in outcomes if code == 200]
+        return {
+            **latency_stats(latencies),
+            "errors": sum(code != 200 for _, code in outcomes),
+            "throughput_rps": round(len(outcomes) / wall, 2),
+            "stages": stage_stats(samples),
+            # the highest RSS sampled during this level (None without /proc)
+            "rss_mb": rss["mb"],
+        }
+
+    def report(self, results):
+        index = results["index"]
+        self.stdout.write(f"{results['pages']} pages, store={results['store']}, embed={results['embed_backend']}, "
+                          f"summaries={results['summaries']} ({results['summary_latency_ms']:g} ms stub), "
+                          f"model load {results['model_load_s']} s")
+        self.stdout.write(f"index: p50 {index['p50_ms']:.1f} ms, p95 {index['p95_ms']:.1f} ms per page")
+        self.stdout.write(f"{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}{'RSS MB':>9}")
+        for concurrency, r in results["search"].items():
+            rss = f"{r['rss_mb']:.1f}" if r.get("rss_mb") is not None else "-"
+            self.stdout.write(f"{concurrency:>8}{r['throughput_rps']:>10.1f}{r.get('p50_ms', 0):>10.1f}"
+                              f"{r.get('p95_ms', 0):>10.1f}{r['errors']:>8}{rss:>9}")
+        runs = [("index", index)] + [(f"search, {c} clients", r) for c, r in results["search"].items()]
+        for label, r in runs:
+            self.stdout.write(f"  {label}: " + ", ".join(
+                f"{stage} {stats['p50_ms']:.2f}/{stats['p95_ms']:.2f}" for stage, stats in r["stages"].items()
+            ) + " (p50/p95 ms)")
+        self.stdout.write(f"peak RSS {results['peak_rss_mb']} MB over the whole run")
+
+    def compare(self, results, baseline, tolerance):
+        """Raise ``CommandError`` listing the measurements that regressed beyond ``tolerance``."""
+        regressions = []
+
+        def check(label, current, previous, higher_is_worse=True):
+            if not current or not previous:
+                return
+            change = (current - previous) / previous
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{label}: {previous} -> {current} ({change:+.0%})")
+
+        check("index p95_ms", results["index"].get("p95_ms"), baseline.get("index", {}).get("p95_ms"))
+        for concurrency, r in results["search"].items():
+            previous = baseline.get("search", {}).get(concurrency)
+            if previous is None:
+                continue
+            check(f"search@{concurrency} p95_ms", r.get("p95_ms"), previous.get("p95_ms"))
+            check(f"search@{concurrency} throughput_rps", r["throughput_rps"], previous.get("throughput_rps"),
+                  higher_is_worse=False)
+        check("peak_rss_mb", results["peak_rss_mb"], baseline.get("peak_rss_mb"))
+
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(f"No regression beyond {tolerance:.0%} against the baseline.")
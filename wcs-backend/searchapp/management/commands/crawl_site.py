@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from searchapp.crawler import CRAWL_CONCURRENCY, CRAWL_DELAY, CRAWL_MAX_PAGES
+from searchapp.jobs import crawl
+
+
+class Command(BaseCommand):
+    help = "Crawl a site from a start URL (sitemap.xml + same-domain links) and index every page."
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Start URL; only pages on the same host are crawled.")
+        parser.add_argument("--max-pages", type=int, default=CRAWL_MAX_PAGES)
+        parser.add_argument("--concurrency", type=int, default=CRAWL_CONCURRENCY,
+                            help="Simultaneous requests to the host.")
+        parser.add_argument("--delay", type=float, default=CRAWL_DELAY,
+                            help="Minimum seconds between requests to the host.")
+        parser.add_argument("--no-robots", action="store_true", help="Ignore robots.txt.")
+        parser.add_argument("--no-sitemap", action="store_true", help="Only follow links from the start URL.")
+
+    def handle(self, *args, **options):
+        if options["max_pages"] < 1 or options["concurrency"] < 1 or options["delay"] < 0:
+            raise CommandError("--max-pages and --concurrency must be at least 1, --delay at least 0.")
+        stats = crawl(
+            options["url"],
+            max_pages=options["max_pages"],
+            concurrency=options["concurrency"],
+            delay=options["delay"],
+            respect_robots=not options["no_robots"],
+            use_sitemap=not options["no_sitemap"],
+        )
+        for url, error in stats["errors"].items():
+            self.stderr.write(f"{url}: {error}")
+        summary = {key: value for key, value in stats.items() if key != "errors"}
+        self.stdout.write(json.dumps(summary, indent=2))
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from searchapp.indexing import (
+    COLLECTION_LAYOUT,
+    COLLECTION_NAME,
+    COLLECTIONS,
+    domain_of,
+    ensure_collection,
+    upsert_batch,
+)
+from searchapp.models import IndexedPage
+from searchapp.vectorstore import get_store
+
+
+class Command(BaseCommand):
+    help = "Copy chunks from the per-domain collections (html_chunks_<domain>) into the shared collection."
+    # maintenance command: skip system checks, which import every view module
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("collections", nargs="*",
+                            help="Per-domain collections to migrate (default: every html_chunks_* collection).")
+        parser.add_argument("--batch-size", type=int, default=256, help="Points read and written per request.")
+        parser.add_argument("--delete-source", action="store_true",
+                            help="Drop each per-domain collection once its points are all in the shared one.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated.")
+
+    def handle(self, *args, **options):
+        existing = COLLECTIONS.warm()
+        sources = options["collections"] or [
+            name for name in existing if name.startswith(f"{COLLECTION_NAME}_")
+        ]
+        missing = [name for name in sources if name not in existing]
+        if missing:
+            raise CommandError(f"Unknown collection(s): {', '.join(missing)}")
+        if COLLECTION_LAYOUT != "shared":
+            self.stderr.write("WCS_COLLECTION_LAYOUT is not 'shared'; set it before serving from the shared collection.")
+
+        if not options["dry_run"]:
+            ensure_collection(COLLECTION_NAME)
+
+        for name in sources:
+            total = get_store().count(name)
+            if options["dry_run"]:
+                self.stdout.write(f"{name}: {total} points")
+                continue
+
+            copied, domains = self.copy_points(name, options["batch_size"])
+            pages = IndexedPage.objects.filter(collection=name).update(collection=COLLECTION_NAME)
+            self.stdout.write(f"{name}: copied {copied}/{total} points, {pages} pages now in {COLLECTION_NAME}")
+
+            if options["delete_source"]:
+                stored = sum(get_store().count(COLLECTION_NAME, {"domain": domain}) for domain in domains)
+                if copied != total or stored < total:
+                    self.stderr.write(f"{name}: not deleted, {stored} of {total} points found in {COLLECTION_NAME}")
+                    continue
+                get_store().delete_collection(name)
+                COLLECTIONS.forget(name)
+                self.stdout.write(f"{name}: deleted")
+
+    def copy_points(self, name, batch_size):
+        """Copy every point of ``name`` with a ``domain`` payload; returns ``(count, domains)``."""
+        copied = 0
+        domains = set()
+        points = []
+        for record in get_store().scroll(name, with_vectors=True, batch_size=batch_size):
+            payload = dict(record.payload)
+            payload.setdefault("domain", domain_of(payload.get("url", "")))
+            domains.add(payload["domain"])
+            # point ids are derived from URL + chunk content, so they don't collide across domains
+            points.append({"id": record.id, "vector": record.vector, "payload": payload})
+            if len(points) >= batch_size:
+                upsert_batch(get_store(), COLLECTION_NAME, points)
+                copied += len(points)
+                points = []
+        if points:
+            upsert_batch(get_store(), COLLECTION_NAME, points)
+            copied += len(points)
+        return copied, domains
@@ -0,0 +1,82 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from searchapp.apps import PRELOAD
+from searchapp.indexing import COLLECTIONS, warm_up
+from searchapp.jobs import (
+    JOB_POLL_INTERVAL,
+    JOB_WORKERS,
+    requeue_interrupted_jobs,
+    requeue_worker_jobs,
+    work,
+)
+
+
+def _worker_main(poll_interval):
+    stop = threading.Event()
+    # finish the current job, then exit
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(stop, poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Run a pool of worker processes that execute queued index and crawl jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+        parser.add_argument("--poll-interval", type=float, default=JOB_POLL_INTERVAL,
+                            help="Seconds an idle worker waits before checking the queue again.")
+        parser.add_argument("--preload", action="store_true", default=PRELOAD,
+                            help="Load the embedding model once before forking, shared by all workers "
+                                 "(default: WCS_PRELOAD).")
+
+    def handle(self, *args, **options):
+        requeued = requeue_interrupted_jobs()
+        if requeued:
+            self.stdout.write(f"Re-queued {requeued} interrupted job(s).")
+        if options["preload"]:
+            warm_up()
+        else:
+            # workers inherit the list of existing collections instead of each listing them
+            COLLECTIONS.warm()
+        # forked children must open their own database connections
+        connections.close_all()
+
+        context = multiprocessing.get_context("fork")
+        stopping = threading.Event()
+
+        def spawn():
+            process = context.Process(target=_worker_main, args=(options["poll_interval"],), daemon=True)
+            process.start()
+            return process
+
+        def shutdown(*_):
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        processes = [spawn() for _ in range(options["workers"])]
+        self.stdout.write(f"Started {len(processes)} worker(s); Ctrl+C to stop.")
+        while not stopping.wait(1.0):
+            # replace workers that crashed
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    self.stderr.write(f"Worker {process.pid} exited ({process.exitcode}); restarting.")
+                    # its job would otherwise stay "running" and block its URL
+                    requeued = requeue_worker_jobs(process.pid)
+                    if requeued:
+                        self.stderr.write(f"Recovered {requeued} job(s) of worker {process.pid}.")
+                    connections.close_all()
+                    processes[i] = spawn()
+
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        self.stdout.write("Workers stopped.")
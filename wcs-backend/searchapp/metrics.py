@@ -0,0 +1,385 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+import portalocker
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from dotenv import load_dotenv
+
+from .locks import pid_alive
+
+load_dotenv()
+
+# add an X-Timing header with the per-stage breakdown to every response;
+# without it, a request opts in with ``X-Timing: 1`` or ``?timing=1``
+TIMING_HEADER = os.getenv("WCS_TIMING_HEADER", "0") == "1"
+# where each process leaves its counters and histograms so /metrics can add up
+# every web and job worker process on the host; empty keeps them per process
+METRICS_DIR = os.getenv("WCS_METRICS_DIR", str(Path(settings.BASE_DIR) / "var" / "metrics"))
+# seconds between writes of a process's metrics to METRICS_DIR
+METRICS_FLUSH_INTERVAL = float(os.getenv("WCS_METRICS_FLUSH_INTERVAL", "5"))
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count per label combination, e.g. cache lookups by result."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        FLUSHER.ensure_started()
+
+    def state(self):
+        with self._lock:
+            return {json.dumps(key): value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, state):
+        for key, value in state.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self, state):
+        for key, value in sorted(state.items()):
+            yield f"{self.name}{_labels(self.labels, json.loads(key))} {value}"
+
+
+class Histogram:
+    """Distribution of observed values (seconds) per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+        FLUSHER.ensure_started()
+
+    def state(self):
+        with self._lock:
+            return {json.dumps(key): list(row) for key, row in self._values.items()}
+
+    @staticmethod
+    def merge(total, state):
+        for key, row in state.items():
+            current = total.get(key)
+            total[key] = row if current is None else [a + b for a, b in zip(current, row)]
+
+    def render(self, state):
+        for key, row in sorted(state.items()):
+            values = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {row[-1]}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {cumulative}"
+
+
+class Gauge:
+    """Current value read from ``callback`` at scrape time, in the scraped process.
+
+    ``callback`` returns a number, or ``{label values tuple: number}``.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, callback, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.callback = callback
+        REGISTRY.append(self)
+
+    def state(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return {json.dumps([str(v) for v in key]): number for key, number in value.items()}
+
+    def render(self, state):
+        for key, value in sorted(state.items()):
+            yield f"{self.name}{_labels(self.labels, json.loads(key))} {value}"
+
+
+class MetricsFlusher:
+    """Background thread writing this process's counters and histograms to ``METRICS_DIR``.
+
+    Each process writes ``<pid>-<random>.json``; the suffix keeps a process
+    that reuses a dead one's pid from overwriting its totals. Files of
+    processes that exited are folded into ``archive.json``, so totals never
+    go backwards and the directory does not grow with every restart.
+    """
+
+    ARCHIVE = "archive"
+
+    def __init__(self, directory, interval=METRICS_FLUSH_INTERVAL):
+        self.directory = Path(directory) if directory else None
+        self.interval = interval
+        self._pid = None
+        self._name = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # like the embedding batcher, a thread started before a fork is gone in the child
+        if self.directory is None or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._name = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+                threading.Thread(target=self._run, name="metrics-flusher", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Could not write metrics: {e}")
+
+    def _locked(self):
+        # compaction moves totals between files; readers must not see them twice or not at all
+        return portalocker.Lock(str(self.directory / "metrics.lock"), timeout=10)
+
+    @staticmethod
+    def _read(path):
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write(path, state):
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, path)
+
+    def flush(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        state = {m.name: m.state() for m in REGISTRY if m.kind != "gauge"}
+        with self._locked():
+            self._write(self.directory / f"{self._name}.json", state)
+            self._compact()
+
+    def _compact(self):
+        """Fold the files of processes that exited into the archive (lock held)."""
+        dead = []
+        for path in self.directory.glob("*.json"):
+            pid = path.stem.split("-")[0]
+            if path.stem != self.ARCHIVE and pid.isdigit() and not pid_alive(int(pid)):
+                dead.append(path)
+        if not dead:
+            return
+        archive_path = self.directory / f"{self.ARCHIVE}.json"
+        archive = self._read(archive_path)
+        for path in dead:
+            state = self._read(path)
+            for metric in REGISTRY:
+                if metric.kind != "gauge" and metric.name in state:
+                    metric.merge(archive.setdefault(metric.name, {}), state[metric.name])
+        self._write(archive_path, archive)
+        for path in dead:
+            path.unlink(missing_ok=True)
+
+    def other_processes(self):
+        """Saved states of every other process, and the archive of the ones that exited."""
+        if self.directory is None or not self.directory.is_dir():
+            return []
+        with self._locked():
+            return [
+                self._read(path) for path in self.directory.glob("*.json")
+                if path.stem != self._name
+            ]
+
+
+FLUSHER = MetricsFlusher(METRICS_DIR)
+
+
+def _reset_after_fork():
+    # the parent reports its own counts; a forked child starts from zero
+    for metric in REGISTRY:
+        if metric.kind != "gauge":
+            metric._lock = threading.Lock()
+            metric._values = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def render_metrics():
+    """Every registered metric in the Prometheus text format."""
+    others = FLUSHER.other_processes()
+    lines = []
+    for metric in REGISTRY:
+        try:
+            state = metric.state()
+        except Exception as e:
+            # a failing gauge (e.g. database unavailable) must not break the scrape
+            print(f"Could not collect {metric.name}: {e}")
+            continue
+        if metric.kind != "gauge":
+            for other in others:
+                metric.merge(state, other.get(metric.name, {}))
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(state))
+    return "\n".join(lines) + "\n"
+
+
+#  timing spans
+
+STAGE_SECONDS = Histogram("wcs_stage_seconds", "Time spent in each processing stage.", ["stage"])
+REQUEST_SECONDS = Histogram("wcs_request_seconds", "Request latency by route.", ["route", "method", "status"])
+
+# stage -> seconds spent by the current request, when it is being timed
+_timings = ContextVar("wcs_timings", default=None)
+# lists collecting every (stage, seconds) observed in the process, see ``recording``
+_recorders = []
+
+
+def observe(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    for samples in _recorders:
+        samples.append((stage, seconds))
+
+
+@contextmanager
+def recording():
+    """Collect the raw ``(stage, seconds)`` observations of all threads while active (benchmarks)."""
+    samples = []
+    _recorders.append(samples)
+    try:
+        yield samples
+    finally:
+        _recorders.remove(samples)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as ``stage``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def format_timings(timings, total):
+    parts = [f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items()]
+    parts.append(f"total={total * 1000:.1f}ms")
+    return ", ".join(parts)
+
+
+def wants_timing(request):
+    """Whether the request asked for the stage breakdown (``X-Timing: 1`` or ``?timing=1``)."""
+    flags = (request.headers.get("X-Timing", ""), request.GET.get("timing", ""))
+    return any(flag.strip().lower() in ("1", "true", "yes") for flag in flags)
+
+
+class TimingMiddleware:
+    """Record each request's latency and, on request, its stage breakdown.
+
+    The breakdown goes to an ``X-Timing`` response header for every request
+    with ``WCS_TIMING_HEADER``, otherwise for requests that ask for it.
+
+    Stages timed on other threads (the indexing pipeline, summary pool) only
+    reach the histograms, not the header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self._acall(request)
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, started)
+
+    async def _acall(self, request):
+        timings = {}
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, started)
+
+    def _finish(self, request, response, timings, started):
+        total = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        # the route pattern, not the path, keeps the label set bounded
+        route = match.route if match is not None else "unmatched"
+        REQUEST_SECONDS.observe(total, route=route, method=request.method, status=response.status_code)
+        if TIMING_HEADER or wants_timing(request):
+            response["X-Timing"] = format_timings(timings, total)
+        return response
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexedPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=2048, unique=True)),
+                ('collection', models.CharField(max_length=255)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('indexed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('searchapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexedpage',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
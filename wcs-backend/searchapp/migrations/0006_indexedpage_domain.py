@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:46
+
+from urllib.parse import urlparse
+
+from django.db import migrations, models
+
+
+def fill_domain(apps, schema_editor):
+    IndexedPage = apps.get_model("searchapp", "IndexedPage")
+    pages = list(IndexedPage.objects.only("id", "url"))
+    for page in pages:
+        page.domain = urlparse(page.url).netloc
+    IndexedPage.objects.bulk_update(pages, ["domain"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('searchapp', '0005_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indexedpage',
+            name='domain',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.RunPython(fill_domain, migrations.RunPython.noop),
+    ]
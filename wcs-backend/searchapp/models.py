@@ -1,3 +1,106 @@
+from datetime import timedelta
+
 from django.db import models
+from django.utils import timezone
+
+
+class IndexedPage(models.Model):
+    """A URL whose chunks are stored in Qdrant, and when they were written."""
+
+    url = models.URLField(max_length=2048, unique=True)
+    # host part of the URL: the tenant key in the shared collection layout
+    domain = models.CharField(max_length=255, db_index=True, blank=True, default="")
+    collection = models.CharField(max_length=255)
+    chunk_count = models.PositiveIntegerField(default=0)
+    # sha256 of the fetched HTML; an unchanged page is not re-chunked or re-embedded
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+    indexed_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.url
+
+    def is_stale(self, ttl_seconds):
+        """A page is stale once it is older than ``ttl_seconds`` (0 disables expiry)."""
+        if ttl_seconds <= 0:
+            return False
+        return timezone.now() - self.indexed_at > timedelta(seconds=ttl_seconds)
+
+
+class ChunkSummary(models.Model):
+    """ChatGroq summary of a chunk, keyed by the sha256 of its text."""
+
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    summary = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.content_hash
+
+
+class Job(models.Model):
+    """A long-running background task (e.g. a site crawl) and its outcome."""
+
+    KIND_INDEX = "index"
+    KIND_CRAWL = "crawl"
+    KIND_CHOICES = [(KIND_INDEX, "Index page"), (KIND_CRAWL, "Crawl site")]
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+    # a URL has at most one job of each kind waiting or in progress
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    url = models.URLField(max_length=2048)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # "<host>:<pid>" of the process running the job, and when it last reported
+    # in; a running job whose heartbeat stops belonged to a process that died
+    worker = models.CharField(max_length=255, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    # times the job was claimed; a job that keeps killing its worker is failed
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "url"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="unique_active_job_per_url",
+            ),
+        ]
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"{self.kind} {self.url} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status not in self.ACTIVE_STATUSES
 
-# Create your models here.
+    def as_dict(self):
+        return {
+            "id": self.pk,
+            "kind": self.kind,
+            "url": self.url,
+            "params": self.params,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "attempts": self.attempts,
+        }
@@ -0,0 +1,111 @@
+import queue
+import random
+import threading
+import time
+
+_DONE = object()
+
+
+class _StageFailed(Exception):
+    pass
+
+
+def run_pipeline(source, stages, maxsize=2):
+    """Run ``source`` through ``stages`` with every step on its own thread.
+
+    ``source`` is an iterable (it is consumed on a worker thread, so a lazy
+    generator overlaps with the stages after it). Each stage is a callable
+    applied to one item; its result is handed to the next stage through a
+    queue holding at most ``maxsize`` items, which provides backpressure: a
+    fast producer blocks instead of buffering a whole page. The last stage
+    runs on the calling thread and its results are returned as a list.
+
+    The first exception raised anywhere stops the pipeline and is re-raised.
+    """
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():
+                    raise _StageFailed()
+
+    def produce(out):
+        try:
+            for item in source:
+                if not put(out, item):
+                    return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        put(out, _DONE)
+
+    def work(stage, inbox, out):
+        try:
+            while True:
+                item = get(inbox)
+                if item is _DONE:
+                    break
+                if not put(out, stage(item)):
+                    return
+        except _StageFailed:
+            return
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        put(out, _DONE)
+
+    *background, last = stages
+    queues = [queue.Queue(maxsize=maxsize) for _ in range(len(background) + 1)]
+    threads = [threading.Thread(target=produce, args=(queues[0],), daemon=True)]
+    for i, stage in enumerate(background):
+        threads.append(threading.Thread(target=work, args=(stage, queues[i], queues[i + 1]), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    results = []
+    try:
+        while True:
+            item = get(queues[-1])
+            if item is _DONE or errors:
+                break
+            results.append(last(item))
+    except _StageFailed:
+        pass
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        if errors:
+            stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+def retry_with_backoff(fn, retries=4, base_delay=0.5, max_delay=8.0, label="operation"):
+    """Call ``fn`` until it succeeds, sleeping exponentially longer (with jitter) between tries."""
+    for attempt in range(retries):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"{label} failed (attempt {attempt + 1}), retrying in {delay:.2f}s: {e}")
+            time.sleep(delay)
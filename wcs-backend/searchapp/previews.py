@@ -0,0 +1,89 @@
+import base64
+import os
+import threading
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# where chunk HTML previews live: "payload" stores them zlib-compressed in the
+# Qdrant point, "blob" in a local directory keyed by the chunk's content hash
+PREVIEW_STORE = os.getenv("WCS_PREVIEW_STORE", "payload")
+PREVIEW_DIR = os.getenv("WCS_PREVIEW_DIR", str(Path(settings.BASE_DIR) / "var" / "previews"))
+
+# payload field holding the compressed preview
+PREVIEW_FIELD = "html_z"
+# full wrapped preview stored by older versions; still read if present
+LEGACY_PREVIEW_FIELD = "html_pretty"
+
+PREVIEW_WRAPPER = """
+            <details style='margin-top:8px;'>
+                <summary style='cursor:pointer;color:#2563eb;font-weight:600;'>View HTML (readable preview)</summary>
+                <div style='border:1px solid #ddd;padding:10px;margin-top:5px;border-radius:8px;'>
+                    {html}
+                </div>
+            </details>
+            """
+
+
+def compress(html):
+    return base64.b64encode(zlib.compress(html.encode("utf-8"), 9)).decode("ascii")
+
+
+def decompress(data):
+    return zlib.decompress(base64.b64decode(data)).decode("utf-8")
+
+
+class BlobStore:
+    """Compressed previews on local disk, one file per chunk hash, written atomically."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.z"
+
+    def put(self, key, html):
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".z.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(zlib.compress(html.encode("utf-8"), 9))
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            return zlib.decompress(self._path(key).read_bytes()).decode("utf-8")
+        except (OSError, zlib.error):
+            return None
+
+
+BLOB_STORE = BlobStore(PREVIEW_DIR) if PREVIEW_STORE == "blob" else None
+# blobs written before a switch back to "payload" stay readable
+_BLOB_READER = BLOB_STORE or BlobStore(PREVIEW_DIR)
+
+
+def preview_payload(chunk_hash, html):
+    """Payload fields that store ``html`` as the preview of chunk ``chunk_hash``."""
+    if BLOB_STORE is not None:
+        BLOB_STORE.put(chunk_hash, html)
+        return {}
+    return {PREVIEW_FIELD: compress(html)}
+
+
+def render_preview(payload):
+    """The wrapped HTML preview shown for a search hit, built from its payload."""
+    if LEGACY_PREVIEW_FIELD in payload:
+        return payload[LEGACY_PREVIEW_FIELD]
+    html = None
+    if PREVIEW_FIELD in payload:
+        html = decompress(payload[PREVIEW_FIELD])
+    elif payload.get("content_hash"):
+        html = _BLOB_READER.get(payload["content_hash"])
+    if html is None:
+        return "(no html stored)"
+    return PREVIEW_WRAPPER.format(html=html)
@@ -0,0 +1,110 @@
+import os
+
+from dotenv import load_dotenv
+from qdrant_client.http.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+
+from .embeddings import EMBEDDING_DIM
+
+load_dotenv()
+
+# Storage profiles for chunk collections. A profile only takes effect when a
+# collection is created; search parameters follow the configured profile.
+#
+#   float32  full vectors and HNSW graph in RAM (the original setup)
+#   int8     scalar int8 quantized vectors in RAM, originals on disk and used
+#            to rescore the candidates: ~4x less vector RAM
+#   binary   1 bit per dimension in RAM, originals on disk for rescoring:
+#            ~32x less vector RAM, needs more oversampling to keep recall
+COLLECTION_PROFILES = {
+    "float32": {
+        "quantization": None,
+        "vectors_on_disk": False,
+        "payload_on_disk": False,
+        "oversampling": None,
+    },
+    "int8": {
+        "quantization": ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        ),
+        "vectors_on_disk": True,
+        "payload_on_disk": True,
+        "oversampling": 2.0,
+    },
+    "binary": {
+        "quantization": BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True)),
+        "vectors_on_disk": True,
+        "payload_on_disk": True,
+        "oversampling": 4.0,
+    },
+}
+
+COLLECTION_PROFILE = os.getenv("WCS_COLLECTION_PROFILE", "float32")
+# HNSW graph degree and build-time beam width (Qdrant defaults: 16 / 100)
+HNSW_M = int(os.getenv("WCS_HNSW_M", "16"))
+HNSW_EF_CONSTRUCT = int(os.getenv("WCS_HNSW_EF_CONSTRUCT", "100"))
+# search-time beam width; empty uses Qdrant's default
+HNSW_EF = int(os.getenv("WCS_HNSW_EF", "0")) or None
+# candidates fetched per requested hit before rescoring quantized results;
+# overrides the profile's own value when set
+SEARCH_OVERSAMPLING = float(os.getenv("WCS_SEARCH_OVERSAMPLING", "0")) or None
+
+
+def get_profile(name=None):
+    name = name or COLLECTION_PROFILE
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(
+            f"Unknown collection profile {name!r}; choose one of: {', '.join(COLLECTION_PROFILES)}"
+        )
+    return COLLECTION_PROFILES[name]
+
+
+def collection_options(name=None, multitenant=False, m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT):
+    """Keyword arguments for ``create_collection`` under profile ``name``.
+
+    A multi-tenant collection is only ever searched with a tenant filter, so
+    it builds per-tenant graphs (``payload_m``) instead of a global one.
+    """
+    profile = get_profile(name)
+    if multitenant:
+        hnsw_config = HnswConfigDiff(m=0, payload_m=m, ef_construct=ef_construct)
+    else:
+        hnsw_config = HnswConfigDiff(m=m, ef_construct=ef_construct)
+    return {
+        "vectors_config": VectorParams(
+            size=EMBEDDING_DIM,
+            distance=Distance.COSINE,
+            on_disk=profile["vectors_on_disk"] or None,
+        ),
+        "hnsw_config": hnsw_config,
+        "quantization_config": profile["quantization"],
+        "on_disk_payload": profile["payload_on_disk"],
+    }
+
+
+def search_params(name=None, hnsw_ef=HNSW_EF, oversampling=SEARCH_OVERSAMPLING, exact=False):
+    """``SearchParams`` for collections created with profile ``name``.
+
+    Quantized profiles search the compressed vectors, then rescore the
+    oversampled candidates with the original vectors.
+    """
+    profile = get_profile(name)
+    quantization = None
+    if profile["quantization"] is not None:
+        quantization = QuantizationSearchParams(
+            rescore=True,
+            oversampling=oversampling or profile["oversampling"],
+        )
+    if exact or hnsw_ef or quantization:
+        return SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+    return None
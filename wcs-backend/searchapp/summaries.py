@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from .aio import loop_local
+from .metrics import Counter, Gauge, span
+from .models import ChunkSummary
+
+load_dotenv()
+
+CHATGROQ_API_URL = os.getenv("CHATGROQ_API_URL", "https://api.chatgroq.com/v1/chat/completions")
+CHATGROQ_MODEL = os.getenv("CHATGROQ_MODEL", "llama-3.3-70b-versatile")
+# concurrent ChatGroq calls per process
+SUMMARY_WORKERS = int(os.getenv("WCS_SUMMARY_WORKERS", "8"))
+SUMMARY_TIMEOUT = float(os.getenv("WCS_SUMMARY_TIMEOUT", "30"))
+# summarize newly indexed chunks in the background so searches find them cached
+SUMMARIZE_ON_INDEX = os.getenv("WCS_SUMMARIZE_ON_INDEX", "0") == "1"
+
+# one keep-alive session shared by all summary threads
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=SUMMARY_WORKERS))
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=SUMMARY_WORKERS))
+
+SUMMARY_POOL = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+
+# summaries being generated right now, so overlapping requests share one call
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+SUMMARY_CACHE_LOOKUPS = Counter("wcs_summary_cache_lookups_total", "Summary cache lookups by result.", ["result"])
+SUMMARIES_IN_FLIGHT = Gauge("wcs_summaries_in_flight", "ChatGroq summaries being generated by the thread pool.", lambda: len(_in_flight))
+
+
+def summary_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chatgroq_request(text):
+    """Headers and JSON body of the ChatGroq call summarizing ``text``."""
+    return {
+        "headers": {
+            "Authorization": f"Bearer {os.getenv('CHATGROQ_API_KEY')}",
+            "Content-Type": "application/json",
+        },
+        "json": {
+            "model": CHATGROQ_MODEL,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "Summarize the following webpage content in 3–4 lines. Be concise and informative.",
+                },
+                {"role": "user", "content": text},
+            ],
+        },
+    }
+
+
+def summarize_with_chatgroq(text):
+    """Generate a 3–4 line summary using ChatGroq API.
+
+    Returns ``(summary, ok)``; on failure the summary falls back to the start
+    of ``text`` and ``ok`` is ``False`` so the fallback is not cached.
+    """
+    try:
+        with span("chatgroq"):
+            response = SESSION.post(CHATGROQ_API_URL, timeout=SUMMARY_TIMEOUT, **chatgroq_request(text))
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"], True
+    except Exception as e:
+        print(f"ChatGroq summarization failed: {e}")
+        return text[:300], False
+
+
+def store_summary(key, summary):
+    # a single INSERT .. ON CONFLICT statement, so concurrent writers don't
+    # hold a transaction open against SQLite
+    try:
+        ChunkSummary.objects.bulk_create(
+            [ChunkSummary(content_hash=key, summary=summary)],
+            update_conflicts=True,
+            unique_fields=["content_hash"],
+            update_fields=["summary"],
+        )
+    except Exception as e:
+        print(f"Could not cache summary {key}: {e}")
+
+
+def _summarize_and_store(key, text):
+    try:
+        summary, ok = summarize_with_chatgroq(text)
+        if ok:
+            store_summary(key, summary)
+        return summary
+    finally:
+        # pool threads outlive requests, so release their DB connections here
+        close_old_connections()
+
+
+def cached_summaries(texts):
+    """Return ``{summary_key: summary}`` for the texts that are already summarized."""
+    keys = {summary_key(text) for text in texts}
+    cached = dict(
+        ChunkSummary.objects.filter(content_hash__in=keys).values_list("content_hash", "summary")
+    )
+    SUMMARY_CACHE_LOOKUPS.inc(len(cached), result="hit")
+    SUMMARY_CACHE_LOOKUPS.inc(len(keys) - len(cached), result="miss")
+    return cached
+
+
+def submit_summaries(texts):
+    """Start summarizing ``texts`` on the shared pool.
+
+    Returns one future per text; cached summaries come back as already
+    completed futures, and identical texts share a single ChatGroq call.
+    """
+    cached = cached_summaries(texts)
+    futures = {}
+    result = []
+    for text in texts:
+        key = summary_key(text)
+        if key not in futures:
+            if key in cached:
+                futures[key] = Future()
+                futures[key].set_result(cached[key])
+            else:
+                futures[key] = _submit(key, text)
+        result.append(futures[key])
+    return result
+
+
+def _submit(key, text):
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        if future is None:
+            future = SUMMARY_POOL.submit(_summarize_and_store, key, text)
+            _in_flight[key] = future
+            future.add_done_callback(lambda _: _forget(key))
+        return future
+
+
+def _forget(key):
+    with _in_flight_lock:
+        _in_flight.pop(key, None)
+
+
+def summarize_many(texts):
+    """Summarize ``texts`` concurrently, reusing cached summaries."""
+    return [future.result() for future in submit_summaries(texts)]
+
+
+def prefetch_summaries(texts):
+    """Summarize ``texts`` in the background without waiting for the results."""
+    submit_summaries(texts)
+
+
+#  async (ASGI) variants 
+
+# one pooled async client per event loop, shared by all requests on it
+async_session = loop_local(lambda: httpx.AsyncClient(timeout=SUMMARY_TIMEOUT), close=lambda client: client.aclose())
+# at most SUMMARY_WORKERS ChatGroq calls in flight per event loop, like the thread pool
+_summary_slots = loop_local(lambda: asyncio.Semaphore(SUMMARY_WORKERS))
+
+
+async def asummarize_with_chatgroq(text):
+    """``summarize_with_chatgroq`` without holding a thread while ChatGroq answers."""
+    try:
+        async with _summary_slots():
+            with span("chatgroq"):
+                response = await async_session().post(CHATGROQ_API_URL, **chatgroq_request(text))
+        response.raise_for_status()
+        data = response.json()
+        return data["choices"][0]["message"]["content"], True
+    except Exception as e:
+        print(f"ChatGroq summarization failed: {e}")
+        return text[:300], False
+
+
+async def asubmit_summaries(texts):
+    """Async ``submit_summaries``: one task per text, identical texts sharing a call."""
+    cached = await sync_to_async(cached_summaries)(texts)
+
+    async def summarize(key, text):
+        summary, ok = await asummarize_with_chatgroq(text)
+        if ok:
+            await sync_to_async(store_summary)(key, summary)
+        return summary
+
+    async def done(summary):
+        return summary
+
+    tasks = {}
+    result = []
+    for text in texts:
+        key = summary_key(text)
+        if key not in tasks:
+            coro = done(cached[key]) if key in cached else summarize(key, text)
+            tasks[key] = asyncio.ensure_future(coro)
+        result.append(tasks[key])
+    return result
+
+
+async def asummarize_many(texts):
+    return list(await asyncio.gather(*await asubmit_summaries(texts)))
@@ -1,3 +1,1150 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import apps, embeddings, extraction, fetching, indexing, jobs, locks, metrics, pipeline, summaries, vectorstore
+from .embeddings import EMBEDDING_DIM, DiskEmbeddingStore, EmbeddingCache
+from .extraction import extract_chunks
+from .crawler import crawl_site
+from .locks import SingleFlight
+from .models import ChunkSummary, IndexedPage, Job
+from .pipeline import retry_with_backoff, run_pipeline
+from .vectorstore import LocalStore
+from .views import parse_crawl_params
+
+
+def setUpModule():
+    # the state directories default to var/ inside the tree: keep tests out of
+    # them, and keep metrics per process instead of adding to the server's
+    tmp = tempfile.TemporaryDirectory()
+    unittest.addModuleCleanup(tmp.cleanup)
+    for patcher in (
+        mock.patch.object(metrics.FLUSHER, "directory", None),
+        mock.patch.object(fetching, "PAGE_CACHE", fetching.PageCache(os.path.join(tmp.name, "fetch"))),
+        mock.patch.object(embeddings, "EMBEDDING_CACHE_DIR", os.path.join(tmp.name, "embeddings")),
+        mock.patch.object(locks, "LOCK_DIR", os.path.join(tmp.name, "locks")),
+    ):
+        patcher.start()
+        unittest.addModuleCleanup(patcher.stop)
+
+
+class StaticSite:
+    """Local HTTP server for tests: ``pages`` maps a path to ``(content type, body)``.
+
+    Every request is recorded in ``requests`` as ``(path, headers)``.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests.append((self.path, dict(self.headers)))
+                response = site.respond(self)
+                if response is None:
+                    self.send_error(404)
+                    return
+                code, headers, body = response
+                self.send_response(code)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def respond(self, handler):
+        """``(status, headers, body)`` for a request, or ``None`` for a 404."""
+        page = self.pages.get(handler.path)
+        if page is None:
+            return None
+        content_type, body = page
+        return 200, {"Content-Type": content_type}, body.encode("utf-8")
+
+    def paths(self):
+        return [path for path, _ in self.requests]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def html(*links, text="Some page text."):
+    anchors = "".join(f'<a href="{href}">link</a>' for href in links)
+    return "text/html; charset=utf-8", f"<html><body><p>{text}</p>{anchors}</body></html>"
+
+
+class VersionedSite(StaticSite):
+    """``StaticSite`` whose pages carry an ETag and a Last-Modified date and answer conditional GETs."""
+
+    LAST_MODIFIED = "Sat, 17 Oct 2026 12:00:00 GMT"
+
+    def respond(self, handler):
+        page = self.pages.get(handler.path)
+        if page is None:
+            return None
+        content_type, body = page
+        etag = '"%s"' % hash(body)
+        if handler.headers.get("If-None-Match") == etag or handler.headers.get("If-Modified-Since") == self.LAST_MODIFIED:
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": content_type, "ETag": etag, "Last-Modified": self.LAST_MODIFIED}, \
+            body.encode("utf-8") if isinstance(body, str) else body
+
+
+class ChatGroqStub(StaticSite):
+    """``StaticSite`` answering ChatGroq chat completions with ``"Summary: <text>"``.
+
+    Each call takes ``delay`` seconds and first waits for ``release`` to be
+    set. ``texts`` records what was summarized and ``peak`` the most calls
+    in progress at once. Set ``status`` to make the calls fail.
+    """
+
+    path = "/v1/chat/completions"
+
+    def __init__(self, delay=0.0):
+        super().__init__({})
+        self.delay = delay
+        self.status = 200
+        self.release = threading.Event()
+        self.release.set()
+        self.texts = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def respond(self, handler):
+        body = json.loads(handler.rfile.read(int(handler.headers["Content-Length"])))
+        text = body["messages"][-1]["content"]
+        with self._lock:
+            self.texts.append(text)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            self.release.wait(10)
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.active -= 1
+        reply = {"choices": [{"message": {"content": f"Summary: {text}"}}]}
+        return self.status, {"Content-Type": "application/json"}, json.dumps(reply).encode("utf-8")
+
+    def __enter__(self):
+        super().__enter__()
+        self.patcher = mock.patch.object(summaries, "CHATGROQ_API_URL", self.url + self.path)
+        self.patcher.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.release.set()
+        self.patcher.stop()
+        super().__exit__(*exc)
+
+
+def fake_vectors(texts):
+    """Deterministic random unit vectors standing in for the embedding model."""
+    rows = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        row = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+        rows.append(row / np.linalg.norm(row))
+    return np.asarray(rows, dtype=np.float32).reshape(len(rows), EMBEDDING_DIM)
+
+
+class LocalIndexTestCase(TransactionTestCase):
+    """Indexes into a temporary ``LocalStore``, with ``fake_vectors`` instead of the model.
+
+    Every text sent to the embedder is recorded in ``embedded``. Tokens are
+    split on whitespace, so the tests don't need NLTK's tokenizer data. Not
+    wrapped in a transaction, so pool threads can write to the database.
+    """
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = LocalStore(os.path.join(tmp.name, "vectors"))
+        self.embedded = []
+        embedded_lock = threading.Lock()
+
+        def embed_texts(texts):
+            with embedded_lock:
+                self.embedded.extend(texts)
+            return fake_vectors(texts)
+
+        for patcher in (
+            mock.patch.object(indexing, "get_store", lambda: self.store),
+            mock.patch.object(indexing, "COLLECTIONS", indexing.CollectionRegistry(lambda: self.store)),
+            mock.patch.object(indexing, "embed_texts", embed_texts),
+            mock.patch.object(indexing, "embed_query", lambda query: fake_vectors([query])[0]),
+            mock.patch.object(extraction, "word_tokenize", str.split),
+            mock.patch.object(locks, "LOCK_DIR", os.path.join(tmp.name, "locks")),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stored_ids(self, url):
+        collection = indexing.collection_for_url(url)
+        return {str(record.id) for record in self.store.scroll(collection, indexing.url_filter(url), fields=[])}
+
+
+class FetchTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(fetching, "PAGE_CACHE", fetching.PageCache(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_cache_hit_skips_the_origin(self):
+        with VersionedSite({"/": html(text="Cached page.")}) as site:
+            first = fetching.fetch_page(site.url + "/")
+            second = fetching.fetch_page(site.url + "/", ttl=60)
+        self.assertEqual((first.not_modified, first.from_cache), (False, False))
+        self.assertEqual((second.not_modified, second.from_cache), (True, True))
+        self.assertEqual(second.html, first.html)
+        self.assertEqual(len(site.requests), 1)
+
+    def test_stale_copy_is_revalidated_with_a_conditional_get(self):
+        with VersionedSite({"/": html(text="Unchanged page.")}) as site:
+            first = fetching.fetch_page(site.url + "/", ttl=0)
+            second = fetching.fetch_page(site.url + "/", ttl=0)
+        _, headers = site.requests[1]
+        self.assertIn("If-None-Match", headers)
+        self.assertEqual(headers["If-Modified-Since"], VersionedSite.LAST_MODIFIED)
+        self.assertTrue(second.not_modified)
+        self.assertEqual(second.html, first.html)
+
+    def test_changed_page_is_downloaded_again(self):
+        with VersionedSite({"/": html(text="First version.")}) as site:
+            fetching.fetch_page(site.url + "/", ttl=0)
+            site.pages["/"] = html(text="Second version.")
+            site.LAST_MODIFIED = "Sun, 18 Oct 2026 12:00:00 GMT"
+            second = fetching.fetch_page(site.url + "/", ttl=0)
+        self.assertFalse(second.not_modified)
+        self.assertIn("Second version.", second.html)
+
+    def test_charset_from_meta_tag_survives_revalidation(self):
+        body = '<html><head><meta charset="iso-8859-1"></head><body><p>Caf\xe9 cr\xe8me</p></body></html>'
+        with VersionedSite({"/": ("text/html", body.encode("iso-8859-1"))}) as site:
+            first = fetching.fetch_page(site.url + "/", ttl=0)
+            second = fetching.fetch_page(site.url + "/", ttl=0)
+        self.assertIn("Caf\xe9 cr\xe8me", first.html)
+        self.assertEqual(second.html, first.html)
+
+    def test_oversized_page_leaves_no_partial_body(self):
+        with VersionedSite({"/": html(text="x" * fetching.FETCH_MAX_BYTES)}) as site:
+            with self.assertRaises(fetching.FetchError):
+                fetching.fetch_page(site.url + "/")
+            self.assertEqual(os.listdir(fetching.PAGE_CACHE.directory), [])
+            site.pages["/"] = html(text="Small page.")
+            fetching.fetch_page(site.url + "/")
+        self.assertEqual(sorted(name.rsplit(".", 1)[1] for name in os.listdir(fetching.PAGE_CACHE.directory)),
+                         ["body", "json"])
+
+    def test_non_html_is_rejected(self):
+        with VersionedSite({"/data.json": ("application/json", "{}")}) as site:
+            with self.assertRaises(fetching.FetchError):
+                fetching.fetch_page(site.url + "/data.json")
+
+    def test_missing_page_raises(self):
+        with VersionedSite({}) as site:
+            with self.assertRaises(fetching.FetchError):
+                fetching.fetch_page(site.url + "/missing")
+
+
+class CrawlTests(SimpleTestCase):
+    def crawl(self, site, **options):
+        indexed = []
+
+        def index_page(url, page_html):
+            indexed.append(url)
+            return None, {"added": 1, "removed": 0}
+
+        options.setdefault("delay", 0)
+        stats = crawl_site(site.url + "/", index_page, **options)
+        return stats, sorted(url[len(site.url):] for url in indexed)
+
+    def test_follows_same_host_links(self):
+        pages = {
+            "/": html("/a", "/b#section", "http://other.example/x", "/logo.png"),
+            "/a": html("/b", "/"),
+            "/b": html(),
+        }
+        with StaticSite(pages) as site:
+            stats, indexed = self.crawl(site, use_sitemap=False)
+        self.assertEqual(indexed, ["/", "/a", "/b"])
+        self.assertEqual(stats["indexed"], 3)
+        self.assertEqual(stats["errors"], {})
+
+    def test_bad_links_do_not_stop_the_crawl(self):
+        pages = {
+            "/": html("http://[bad", "/a", "http://[also-bad/x"),
+            "/a": html("/b"),
+            "/b": html(),
+        }
+        with StaticSite(pages) as site:
+            _, indexed = self.crawl(site, concurrency=1, use_sitemap=False)
+        self.assertEqual(indexed, ["/", "/a", "/b"])
+
+    def test_failing_page_is_recorded(self):
+        def index_page(url, page_html):
+            if url.endswith("/a"):
+                raise ValueError("cannot index")
+            return None, {"added": 1, "removed": 0}
+
+        with StaticSite({"/": html("/a", "/b"), "/a": html(), "/b": html()}) as site:
+            stats = crawl_site(site.url + "/", index_page, concurrency=1, delay=0, use_sitemap=False)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["indexed"], 2)
+        self.assertIn(site.url + "/a", stats["errors"])
+
+    def test_respects_robots_txt(self):
+        pages = {
+            "/robots.txt": ("text/plain", "User-agent: *\nDisallow: /private\n"),
+            "/": html("/public", "/private/page"),
+            "/public": html(),
+            "/private/page": html(),
+        }
+        with StaticSite(pages) as site:
+            stats, indexed = self.crawl(site, use_sitemap=False)
+            self.assertNotIn("/private/page", site.paths())
+        self.assertEqual(indexed, ["/", "/public"])
+        self.assertEqual(stats["skipped"], 1)
+
+        with StaticSite(pages) as site:
+            _, indexed = self.crawl(site, use_sitemap=False, respect_robots=False)
+        self.assertEqual(indexed, ["/", "/private/page", "/public"])
+
+    def test_sitemap_pages_are_crawled(self):
+        with StaticSite({}) as site:
+            site.pages.update({
+                "/": html(),
+                "/sitemap.xml": ("application/xml", (
+                    '<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                    f"<url><loc>{site.url}/only-in-sitemap</loc></url><url><loc>http://[bad</loc></url></urlset>"
+                )),
+                "/only-in-sitemap": html(),
+            })
+            _, indexed = self.crawl(site)
+        self.assertEqual(indexed, ["/", "/only-in-sitemap"])
+
+    def test_max_pages(self):
+        pages = {"/": html(*[f"/p{i}" for i in range(10)])}
+        pages.update({f"/p{i}": html() for i in range(10)})
+        with StaticSite(pages) as site:
+            stats, indexed = self.crawl(site, max_pages=4, use_sitemap=False)
+        self.assertEqual(len(indexed), 4)
+        self.assertEqual(stats["pages_seen"], 4)
+
+    def test_invalid_options(self):
+        for options in ({"concurrency": 0}, {"max_pages": 0}, {"delay": -1}):
+            with self.subTest(**options), self.assertRaises(ValueError):
+                crawl_site("http://127.0.0.1/", lambda url, page_html: None, **options)
+
+
+class CrawlParamsTests(SimpleTestCase):
+    def test_valid(self):
+        params = parse_crawl_params({"max_pages": "10", "concurrency": 2, "delay": 0, "respect_robots": "false",
+                                     "use_sitemap": True})
+        self.assertEqual(params, {"max_pages": 10, "concurrency": 2, "delay": 0.0, "respect_robots": False,
+                                  "use_sitemap": True})
+
+    def test_invalid(self):
+        for data in ({"concurrency": 0}, {"max_pages": -5}, {"delay": -0.5}, {"max_pages": "many"},
+                     {"concurrency": True}, {"respect_robots": "maybe"}, {"use_sitemap": 2}):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                parse_crawl_params(data)
+
+
+@mock.patch.object(jobs.HEARTBEAT, "ensure_started")
+class JobRecoveryTests(TestCase):
+    url = "https://example.com/page"
+
+    def claimed_job(self):
+        job, _ = jobs.submit_job(Job.KIND_INDEX, self.url)
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed, job)
+        return claimed
+
+    def test_jobs_of_an_exited_worker_are_requeued(self, _):
+        job = self.claimed_job()
+        self.assertEqual(job.worker, jobs.worker_id())
+        self.assertEqual(jobs.requeue_worker_jobs(os.getpid()), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.STATUS_QUEUED, ""))
+
+    def test_stale_job_does_not_block_its_url(self, _):
+        job = self.claimed_job()
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        resubmitted, created = jobs.submit_job(Job.KIND_INDEX, self.url)
+        self.assertFalse(created)
+        self.assertEqual((resubmitted.pk, resubmitted.status), (job.pk, Job.STATUS_QUEUED))
+
+    def test_live_job_is_left_alone(self, _):
+        job = self.claimed_job()
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+        self.assertEqual(jobs.requeue_interrupted_jobs(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_RUNNING)
+
+    def test_job_fails_after_max_attempts(self, _):
+        job = self.claimed_job()
+        for _ in range(jobs.JOB_MAX_ATTEMPTS - 1):
+            jobs.requeue_worker_jobs(os.getpid())
+            jobs.claim_next_job()
+        jobs.requeue_worker_jobs(os.getpid())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_FAILED, jobs.JOB_MAX_ATTEMPTS))
+        _, created = jobs.submit_job(Job.KIND_INDEX, self.url)
+        self.assertTrue(created)
+
+
+@mock.patch.object(jobs.HEARTBEAT, "ensure_started")
+class ForcedJobTests(TestCase):
+    url = "https://example.com/page"
+
+    def test_forced_request_upgrades_a_queued_job(self, _):
+        job, _ = jobs.submit_job(Job.KIND_INDEX, self.url, {"force": False})
+        forced, created = jobs.submit_job(Job.KIND_INDEX, self.url, {"force": True})
+        self.assertFalse(created)
+        self.assertEqual((forced.pk, forced.params), (job.pk, {"force": True}))
+
+    def test_running_job_runs_again_when_a_forced_request_joins(self, _):
+        runs = []
+
+        def index(url, force=False):
+            runs.append(force)
+            if len(runs) == 1:
+                jobs.submit_job(Job.KIND_INDEX, url, {"force": True})
+            return {"forced": force}
+
+        jobs.submit_job(Job.KIND_INDEX, self.url, {"force": False})
+        with mock.patch.dict(jobs.HANDLERS, {Job.KIND_INDEX: index}):
+            job = jobs.run_job(jobs.claim_next_job())
+        self.assertEqual(runs, [False, True])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.STATUS_DONE, {"forced": True}))
+
+    def test_force_flag_is_parsed_strictly(self, _):
+        for value, forced in (("false", False), ("0", False), ("true", True)):
+            with self.subTest(value=value):
+                Job.objects.all().delete()
+                response = self.client.post("/api/index/", {"url": self.url, "force": value})
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response.json()["params"], {"force": forced})
+        response = self.client.post("/api/index/", {"url": self.url, "force": "maybe"})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsFlusherTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.flusher = metrics.MetricsFlusher(self.directory)
+        self.flusher._name = f"{os.getpid()}-test"
+
+    def write_state(self, name, count):
+        histogram = {json.dumps(["fetch"]): [count] + [0] * len(metrics.LATENCY_BUCKETS) + [0.5 * count]}
+        with open(os.path.join(self.directory, f"{name}.json"), "w") as f:
+            json.dump({metrics.STAGE_SECONDS.name: histogram}, f)
+
+    def fetch_count(self):
+        total = {}
+        for state in self.flusher.other_processes():
+            metrics.STAGE_SECONDS.merge(total, state.get(metrics.STAGE_SECONDS.name, {}))
+        return total.get(json.dumps(["fetch"]), [0])[0]
+
+    def test_exited_processes_are_folded_into_the_archive(self):
+        # pids above the kernel's pid_max never exist
+        self.write_state("99999998-aaaa", 2)
+        self.write_state("99999999-bbbb", 3)
+        self.assertEqual(self.fetch_count(), 5)
+
+        self.flusher.flush()
+        names = sorted(os.listdir(self.directory))
+        self.assertIn("archive.json", names)
+        self.assertNotIn("99999998-aaaa.json", names)
+        self.assertEqual(self.fetch_count(), 5)
+
+        self.write_state("99999998-cccc", 4)
+        self.flusher.flush()
+        self.assertEqual(self.fetch_count(), 9)
+
+    def test_live_processes_keep_their_files(self):
+        self.write_state(f"{os.getpid()}-other", 1)
+        self.flusher.flush()
+        self.assertIn(f"{os.getpid()}-other.json", os.listdir(self.directory))
+        self.assertEqual(self.fetch_count(), 1)
+
+
+class TimingHeaderTests(SimpleTestCase):
+    def test_requests_opt_in_to_the_breakdown(self):
+        self.assertNotIn("X-Timing", self.client.get("/metrics"))
+        self.assertIn("total=", self.client.get("/metrics", headers={"X-Timing": "1"})["X-Timing"])
+        self.assertIn("X-Timing", self.client.get("/metrics?timing=1"))
+        self.assertNotIn("X-Timing", self.client.get("/metrics?timing=0"))
+
+    def test_setting_adds_it_to_every_response(self):
+        with mock.patch.object(metrics, "TIMING_HEADER", True):
+            self.assertIn("X-Timing", self.client.get("/metrics"))
+
+
+def article(paragraphs, first=0):
+    """A page of ``paragraphs`` paragraphs (numbered from ``first``), with a heading before every eighth."""
+    body = []
+    for i in range(first, first + paragraphs):
+        if i % 8 == 0:
+            body.append(f"<h2>Part {i // 8}</h2>")
+        words = " ".join(f"topic{i}word{j}" for j in range(45))
+        body.append(f"<p>Paragraph {i} says {words}.</p>")
+    return f"<html><body><main>{''.join(body)}</main></body></html>"
+
+
+class IncrementalIndexTests(LocalIndexTestCase):
+    url = "https://example.com/guide"
+
+    def test_unchanged_page_is_not_embedded_again(self):
+        page = article(40)
+        _, first = indexing.index_html(self.url, page)
+        embedded = len(self.embedded)
+        self.assertEqual(first["added"], embedded)
+        _, second = indexing.index_html(self.url, page)
+        self.assertEqual((second["added"], second["removed"]), (0, 0))
+        # forced, the page is chunked again, but every chunk is already stored
+        _, forced = indexing.index_html(self.url, page, force=True)
+        self.assertEqual((forced["added"], forced["removed"], forced["unchanged"]), (0, 0, first["added"]))
+        self.assertEqual(len(self.embedded), embedded)
+
+    def test_inserted_paragraph_keeps_most_chunks(self):
+        page = article(40)
+        indexing.index_html(self.url, page)
+        before = self.stored_ids(self.url)
+        self.embedded.clear()
+
+        inserted = "<p>" + " ".join(f"new{j}" for j in range(60)) + "</p>"
+        page, changes = indexing.index_html(self.url, page.replace("<main>", "<main>" + inserted))
+        after = self.stored_ids(self.url)
+
+        self.assertEqual(len(after), page.chunk_count)
+        self.assertEqual(changes["added"], len(after - before))
+        self.assertEqual(changes["removed"], len(before - after))
+        self.assertEqual(len(self.embedded), changes["added"])
+        # only the chunk(s) next to the new paragraph change
+        self.assertLessEqual(changes["added"], 2)
+        self.assertGreaterEqual(len(before & after), len(before) - 2)
+
+    def test_removed_paragraphs_are_deleted(self):
+        indexing.index_html(self.url, article(40))
+        before = self.stored_ids(self.url)
+        page, changes = indexing.index_html(self.url, article(32))
+        after = self.stored_ids(self.url)
+        self.assertEqual(len(after), page.chunk_count)
+        self.assertEqual(changes["removed"], len(before - after))
+        self.assertTrue(after < before)
+
+
+class IndexedPageTests(LocalIndexTestCase):
+    url = "https://example.com/page"
+
+    def test_page_in_another_layout_is_stale(self):
+        IndexedPage.objects.create(url=self.url, domain="example.com", collection="html_chunks_example_com",
+                                   indexed_at=timezone.now())
+        self.assertIsNotNone(indexing.get_indexed_page(self.url))
+        with mock.patch.object(indexing, "COLLECTION_LAYOUT", "shared"):
+            self.assertIsNone(indexing.get_indexed_page(self.url))
+
+    def test_reindexing_in_another_layout_removes_the_old_points(self):
+        other = "https://example.com/other"
+        for url in (self.url, other):
+            indexing.index_html(url, article(16))
+        old_collection = indexing.collection_for_url(self.url)
+
+        with mock.patch.object(indexing, "COLLECTION_LAYOUT", "shared"):
+            page, _ = indexing.index_html(self.url, article(16))
+            self.assertEqual(page.collection, indexing.COLLECTION_NAME)
+            self.assertEqual(len(self.stored_ids(self.url)), page.chunk_count)
+            site_hits = self.store.search(old_collection, fake_vectors(["query"])[0], 100)
+        # the old collection only answers for pages that were not moved yet
+        self.assertEqual({hit.payload["url"] for hit in site_hits}, {other})
+
+
+class ExtractionTests(SimpleTestCase):
+    def test_navigation_and_forms_are_dropped_from_the_main_content(self):
+        article = " ".join(["The article explains how the search indexes page content."] * 10)
+        page = f"""<html><body><main>
+            <nav><a href="/">Home</a> <a href="/about">About us</a></nav>
+            <h1>Indexing</h1><p>{article}</p>
+            <form><input name="q"><button>Subscribe now</button></form>
+            <aside>Related links</aside>
+        </main></body></html>"""
+        chunks = extract_chunks(page)
+        text = " ".join(chunk["text"] for chunk in chunks)
+        html = "".join(chunk["html"] for chunk in chunks)
+        self.assertIn("The article explains", text)
+        for junk in ("About us", "Subscribe now", "Related links"):
+            self.assertNotIn(junk, text)
+        for tag in ("<nav", "<form", "<aside", "<button"):
+            self.assertNotIn(tag, html)
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.encoded = []
+
+        def encode(texts, batch_size=None):
+            self.encoded.append(list(texts))
+            return fake_vectors(texts)
+
+        self.cache = EmbeddingCache(store=DiskEmbeddingStore(self.directory))
+        for patcher in (
+            mock.patch.object(embeddings, "encode", encode),
+            mock.patch.object(embeddings, "_embedding_cache", self.cache),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cache_hit_skips_the_model(self):
+        first = embeddings.embed_texts(["alpha", "beta", "alpha"])
+        self.assertEqual(self.encoded, [["alpha", "beta"]])
+        # whitespace differences share a key
+        second = embeddings.embed_texts(["beta", "  alpha "])
+        self.assertEqual(len(self.encoded), 1)
+        np.testing.assert_array_equal(second, first[[1, 0]])
+
+    def test_vectors_survive_a_reopen(self):
+        vectors = embeddings.embed_texts(["alpha", "beta"])
+        self.cache = EmbeddingCache(store=DiskEmbeddingStore(self.directory))
+        with mock.patch.object(embeddings, "_embedding_cache", self.cache):
+            reopened = embeddings.embed_texts(["beta", "alpha"])
+        self.assertEqual(len(self.encoded), 1)
+        np.testing.assert_allclose(reopened, vectors[[1, 0]], atol=1e-3)
+
+    def test_lru_evicts_to_the_disk_store(self):
+        cache = EmbeddingCache(max_entries=2, store=DiskEmbeddingStore(self.directory))
+        keys = [embeddings.embedding_key(text) for text in ("a", "b", "c")]
+        cache.put_many(zip(keys, fake_vectors(["a", "b", "c"])))
+        self.assertEqual(list(cache._entries), keys[1:])
+        self.assertEqual(set(cache.get_many(keys)), set(keys))
+
+    def test_torn_row_does_not_shift_later_vectors(self):
+        store = DiskEmbeddingStore(self.directory)
+        store.put_many([("a", fake_vectors(["a"])[0])])
+        # a writer died half-way through a row and its index line
+        with open(store.vectors_path, "ab") as f:
+            f.write(b"\0" * (store.row_bytes // 2))
+        with open(store.index_path, "ab") as f:
+            f.write(b"torn\t")
+        store.put_many([("b", fake_vectors(["b"])[0])])
+
+        reopened = DiskEmbeddingStore(self.directory)
+        found = reopened.get_many(["a", "b", "torn"])
+        self.assertEqual(set(found), {"a", "b"})
+        np.testing.assert_allclose(found["b"], fake_vectors(["b"])[0], atol=1e-3)
+
+
+class EmbeddingBatcherTests(SimpleTestCase):
+    class Model:
+        def __init__(self, error=None):
+            self.batches = []
+            self.error = error
+
+        def encode(self, texts, batch_size=None):
+            self.batches.append(list(texts))
+            if self.error is not None:
+                raise self.error
+            return fake_vectors(texts)
+
+    def encode_concurrently(self, batcher, requests):
+        results = [None] * len(requests)
+        start = threading.Barrier(len(requests))
+
+        def call(i):
+            start.wait()
+            try:
+                results[i] = batcher.encode(requests[i])
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_encodes_share_one_batch(self):
+        model = self.Model()
+        batcher = embeddings.EmbeddingBatcher(lambda: model, max_batch_size=64, max_wait_ms=500)
+        requests = [[f"text {i}.{j}" for j in range(i + 1)] for i in range(4)]
+        results = self.encode_concurrently(batcher, requests)
+        self.assertEqual(len(model.batches), 1)
+        self.assertEqual(sorted(model.batches[0]), sorted(text for texts in requests for text in texts))
+        for texts, vectors in zip(requests, results):
+            np.testing.assert_array_equal(vectors, fake_vectors(texts))
+
+    def test_full_batch_is_flushed_without_waiting(self):
+        model = self.Model()
+        batcher = embeddings.EmbeddingBatcher(lambda: model, max_batch_size=2, max_wait_ms=60_000)
+        vectors = batcher.encode(["a", "b"])
+        np.testing.assert_array_equal(vectors, fake_vectors(["a", "b"]))
+
+    def test_model_error_reaches_every_caller(self):
+        model = self.Model(error=RuntimeError("out of memory"))
+        batcher = embeddings.EmbeddingBatcher(lambda: model, max_batch_size=64, max_wait_ms=500)
+        results = self.encode_concurrently(batcher, [["a"], ["b"], ["c"]])
+        self.assertEqual(len(model.batches), 1)
+        for result in results:
+            self.assertIsInstance(result, RuntimeError)
+
+
+class LocalStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.store = LocalStore(self.directory)
+        self.store.create_collection("pages", {})
+        texts = ["alpha", "beta", "gamma"]
+        self.vectors = fake_vectors(texts)
+        self.store.upsert("pages", [
+            {"id": text, "vector": vector, "payload": {"url": f"https://a.test/{text}", "domain": "a.test", "text": text}}
+            for text, vector in zip(texts, self.vectors)
+        ])
+
+    def test_upsert_search_and_filter(self):
+        hits = self.store.search("pages", self.vectors[1], 2)
+        self.assertEqual(hits[0].id, "beta")
+        self.assertAlmostEqual(hits[0].score, 1.0, places=2)
+        self.assertEqual(len(hits), 2)
+
+        hits = self.store.search("pages", self.vectors[1], 3, {"url": "https://a.test/gamma"}, fields=["text"])
+        self.assertEqual([(h.id, h.payload) for h in hits], [("gamma", {"text": "gamma"})])
+        self.assertEqual(self.store.count("pages", {"domain": "a.test"}), 3)
+        self.assertEqual(self.store.count("pages", {"domain": "b.test"}), 0)
+
+    def test_only_filter_fields_are_indexed(self):
+        collection = self.store._collection("pages")
+        self.assertEqual(set(collection.index), {"url", "domain"})
+        # other fields still filter, row by row
+        self.assertEqual([r.id for r in self.store.scroll("pages", {"text": "beta"})], ["beta"])
+
+    def test_delete_and_set_payloads(self):
+        self.store.delete("pages", ["alpha"])
+        self.store.set_payloads("pages", [("beta", {"domain": "b.test"})])
+        self.assertEqual([h.id for h in self.store.search("pages", self.vectors[0], 3)].count("alpha"), 0)
+        self.assertEqual([r.id for r in self.store.scroll("pages", {"domain": "b.test"})], ["beta"])
+        self.assertEqual(self.store.retrieve("pages", ["beta"])[0].payload["text"], "beta")
+        self.assertEqual(self.store.count("pages", {"domain": "a.test"}), 1)
+
+    def test_reopen_from_disk(self):
+        self.store.upsert("pages", [{"id": "alpha", "vector": self.vectors[2], "payload": {"url": "x", "domain": "c.test"}}])
+        self.store.delete("pages", ["beta"])
+        reopened = LocalStore(self.directory)
+        records = {r.id: r for r in reopened.scroll("pages", with_vectors=True)}
+        self.assertEqual(set(records), {"alpha", "gamma"})
+        self.assertEqual(records["alpha"].payload["domain"], "c.test")
+        np.testing.assert_allclose(records["alpha"].vector, self.vectors[2], atol=1e-3)
+
+    def test_compact_drops_dead_rows_for_every_reader(self):
+        reader = LocalStore(self.directory)
+        self.assertEqual(reader.count("pages"), 3)
+        for _ in range(3):
+            self.store.upsert("pages", [{"id": "alpha", "vector": self.vectors[0], "payload": {"url": "u", "domain": "a.test"}}])
+        self.store.delete("pages", ["gamma"])
+        collection = self.store._collection("pages")
+        self.assertEqual(collection._row_count(), 6)
+
+        self.store.compact("pages")
+        self.assertEqual(collection._row_count(), 2)
+        # the other instance switches to the compacted files on its next read
+        records = {r.id: r for r in reader.scroll("pages", with_vectors=True)}
+        self.assertEqual(set(records), {"alpha", "beta"})
+        np.testing.assert_allclose(records["beta"].vector, self.vectors[1], atol=1e-3)
+        self.assertEqual(reader.search("pages", self.vectors[0], 1, {"url": "u"})[0].id, "alpha")
+
+        # writes after a compaction append to the new generation
+        reader.upsert("pages", [{"id": "delta", "vector": self.vectors[2], "payload": {"url": "d", "domain": "a.test"}}])
+        self.assertEqual(self.store.count("pages", {"domain": "a.test"}), 3)
+        self.assertEqual(LocalStore(self.directory).count("pages"), 3)
+
+    def test_writes_compact_once_most_rows_are_dead(self):
+        with mock.patch.object(vectorstore, "LOCAL_COMPACT_MIN_DEAD", 4):
+            for _ in range(4):
+                self.store.upsert("pages", [{"id": "alpha", "vector": self.vectors[0], "payload": {"url": "u"}}])
+        collection = self.store._collection("pages")
+        self.assertEqual(collection.generation, 1)
+        self.assertLess(collection._row_count(), 7)
+        self.assertEqual(self.store.count("pages"), 3)
+
+    def test_torn_row_does_not_shift_later_vectors(self):
+        collection = self.store._collection("pages")
+        # a writer died half-way through a row and its log line
+        with open(collection.vectors_path, "ab") as f:
+            f.write(b"\0" * (collection.row_bytes // 2))
+        with open(collection.log_path, "ab") as f:
+            f.write(b'{"op": "upsert", "id": "torn"')
+        self.store.upsert("pages", [{"id": "delta", "vector": self.vectors[2], "payload": {"url": "d"}}])
+
+        records = {r.id: r for r in LocalStore(self.directory).scroll("pages", with_vectors=True)}
+        self.assertEqual(set(records), {"alpha", "beta", "gamma", "delta"})
+        np.testing.assert_allclose(records["delta"].vector, self.vectors[2], atol=1e-3)
+
+
+class SummaryTests(TransactionTestCase):
+    """Summaries against a local ChatGroq stub, with a two-thread summary pool."""
+
+    def setUp(self):
+        self.chatgroq = ChatGroqStub(delay=0.1)
+        self.chatgroq.__enter__()
+        self.addCleanup(self.chatgroq.__exit__)
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        for patcher in (
+            mock.patch.object(summaries, "SUMMARY_POOL", pool),
+            mock.patch.object(summaries, "SUMMARY_WORKERS", 2),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_pool_bounds_concurrent_calls(self):
+        texts = [f"chunk {i}" for i in range(6)]
+        self.assertEqual(summaries.summarize_many(texts), [f"Summary: {text}" for text in texts])
+        self.assertEqual(sorted(self.chatgroq.texts), texts)
+        self.assertEqual(self.chatgroq.peak, 2)
+
+    def test_repeated_chunk_is_summarized_once(self):
+        self.assertEqual(summaries.summarize_many(["chunk", "chunk"]), ["Summary: chunk"] * 2)
+        self.assertTrue(ChunkSummary.objects.filter(content_hash=summaries.summary_key("chunk")).exists())
+        self.assertEqual(summaries.summarize_many(["other", "chunk"]), ["Summary: other", "Summary: chunk"])
+        self.assertEqual(self.chatgroq.texts, ["chunk", "other"])
+
+    def test_overlapping_requests_share_the_call_in_flight(self):
+        self.chatgroq.release.clear()
+        first = summaries.submit_summaries(["chunk"])
+        second = summaries.submit_summaries(["chunk"])
+        self.assertIs(first[0], second[0])
+        self.chatgroq.release.set()
+        self.assertEqual(second[0].result(), "Summary: chunk")
+        self.assertEqual(self.chatgroq.texts, ["chunk"])
+
+    def test_failed_summary_falls_back_and_is_not_cached(self):
+        self.chatgroq.status = 500
+        self.assertEqual(summaries.summarize_many(["chunk text"]), ["chunk text"])
+        self.assertFalse(ChunkSummary.objects.exists())
+
+    def test_async_variant_is_bounded_and_shares_the_cache(self):
+        texts = [f"chunk {i}" for i in range(6)]
+        self.assertEqual(asyncio.run(summaries.asummarize_many(texts + texts[:1])),
+                         [f"Summary: {text}" for text in texts + texts[:1]])
+        self.assertEqual(self.chatgroq.peak, 2)
+        summaries.summarize_many(texts)
+        self.assertEqual(sorted(self.chatgroq.texts), texts)
+
+
+class SearchSummaryModeTests(LocalIndexTestCase):
+    url = "https://example.com/guide"
+
+    def setUp(self):
+        super().setUp()
+        indexing.index_html(self.url, article(16))
+        self.chatgroq = ChatGroqStub()
+        self.chatgroq.__enter__()
+        self.addCleanup(self.chatgroq.__exit__)
+
+    def search(self, mode):
+        collection = indexing.collection_for_url(self.url)
+        return indexing.search_url(self.url, "topic3word7", collection, limit=3, summaries=mode)
+
+    def test_no_summaries_make_no_calls(self):
+        results = self.search("none")
+        self.assertEqual([r["summary"] for r in results], [None] * 3)
+        self.assertEqual(self.chatgroq.texts, [])
+
+    def test_full_summaries(self):
+        results = self.search("full")
+        self.assertEqual([r["summary"] for r in results], [f"Summary: {r['text']}" for r in results])
+
+    def test_lazy_summaries_do_not_hold_up_the_search(self):
+        # ChatGroq hangs until released; the search must not wait for it
+        self.chatgroq.release.clear()
+        started = time.monotonic()
+        results = self.search("lazy")
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([r["summary"] for r in results], [None] * 3)
+        self.chatgroq.release.set()
+
+        # fetching them later reuses the background calls
+        fetched = indexing.summarize_points(self.url, [r["id"] for r in results])
+        self.assertEqual(fetched, {str(r["id"]): f"Summary: {r['text']}" for r in results})
+        self.assertEqual(sorted(self.chatgroq.texts), sorted(r["text"] for r in results))
+
+
+class PipelineTests(SimpleTestCase):
+    def test_items_pass_through_every_stage_in_order(self):
+        threads = set()
+
+        def stage(name):
+            def run(item):
+                threads.add((name, threading.current_thread().name))
+                return item + [name]
+            return run
+
+        results = run_pipeline(([i] for i in range(5)), [stage("a"), stage("b"), stage("c")])
+        self.assertEqual(results, [[i, "a", "b", "c"] for i in range(5)])
+        # each stage has a thread of its own; the last runs on the caller's
+        self.assertEqual(len({thread for _, thread in threads}), 3)
+        self.assertIn(("c", threading.current_thread().name), threads)
+
+    def assert_stops_and_raises(self, fail_in):
+        produced = []
+
+        def source():
+            for i in range(10_000):
+                produced.append(i)
+                if fail_in == "source" and i == 3:
+                    raise ValueError("boom")
+                yield i
+
+        def stage(name):
+            def run(item):
+                if fail_in == name and item == 3:
+                    raise ValueError("boom")
+                return item
+            return run
+
+        before = threading.active_count()
+        with self.assertRaisesMessage(ValueError, "boom"):
+            run_pipeline(source(), [stage("middle"), stage("last")], maxsize=1)
+        # the producer stopped early and every pipeline thread has exited
+        self.assertLess(len(produced), 20)
+        self.assertEqual(threading.active_count(), before)
+
+    def test_error_in_the_source_stops_the_pipeline(self):
+        self.assert_stops_and_raises("source")
+
+    def test_error_in_a_middle_stage_stops_the_pipeline(self):
+        self.assert_stops_and_raises("middle")
+
+    def test_error_in_the_last_stage_stops_the_pipeline(self):
+        self.assert_stops_and_raises("last")
+
+    def test_bounded_queues_apply_backpressure(self):
+        produced = []
+        lead = []
+
+        def source():
+            for i in range(30):
+                produced.append(i)
+                yield i
+
+        def slow_last(item):
+            time.sleep(0.01)
+            lead.append(len(produced) - item)
+            return item
+
+        run_pipeline(source(), [lambda item: item, slow_last], maxsize=1)
+        # two one-item queues plus one item held by each thread
+        self.assertLessEqual(max(lead), 5)
+
+
+class RetryTests(SimpleTestCase):
+    def setUp(self):
+        self.sleeps = []
+        for patcher in (
+            mock.patch.object(pipeline, "time", mock.Mock(sleep=self.sleeps.append)),
+            mock.patch.object(pipeline, "random", mock.Mock(uniform=lambda low, high: high)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def flaky(self, failures):
+        calls = []
+
+        def fn():
+            calls.append(None)
+            if len(calls) <= failures:
+                raise ConnectionError(f"attempt {len(calls)}")
+            return "ok"
+        return fn, calls
+
+    def test_backs_off_exponentially_until_success(self):
+        fn, calls = self.flaky(3)
+        self.assertEqual(retry_with_backoff(fn, retries=5, base_delay=0.5, max_delay=1.5), "ok")
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(self.sleeps, [0.5, 1.0, 1.5])
+
+    def test_gives_up_after_the_last_attempt(self):
+        fn, calls = self.flaky(10)
+        with self.assertRaisesMessage(ConnectionError, "attempt 3"):
+            retry_with_backoff(fn, retries=3)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(self.sleeps), 2)
+
+
+def run_threads(n, target):
+    """Run ``target(i)`` on ``n`` threads released together; returns the results (or exceptions) in order."""
+    results = [None] * n
+    start = threading.Barrier(n)
+
+    def call(i):
+        start.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def work():
+            calls.append(None)
+            release.wait(5)
+            return object()
+
+        timer = threading.Timer(0.2, release.set)
+        timer.start()
+        results = run_threads(5, lambda i: flights.do("key", work))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(result) for result in results}), 1)
+        # once it finished, the next call runs again
+        flights.do("key", work)
+        self.assertEqual(len(calls), 2)
+
+    def test_error_reaches_every_waiting_caller(self):
+        flights = SingleFlight()
+
+        def fail():
+            time.sleep(0.2)
+            raise ValueError("cannot index")
+
+        results = run_threads(3, lambda i: flights.do("key", fail))
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_url_lock_is_exclusive(self):
+        def acquire(url):
+            with locks.url_lock(url, timeout=0.2):
+                return "acquired"
+
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(locks, "LOCK_DIR", directory):
+            with locks.url_lock("https://example.com/"):
+                # flock conflicts between open files, so this stands in for another process
+                waiter = run_threads(1, lambda i: acquire("https://example.com/"))
+                self.assertEqual(acquire("https://example.com/other"), "acquired")
+            self.assertIsInstance(waiter[0], TimeoutError)
+            self.assertEqual(acquire("https://example.com/"), "acquired")
+
+
+class ConcurrentIndexTests(LocalIndexTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(fetching, "PAGE_CACHE", fetching.PageCache(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_calls_fetch_and_embed_once(self):
+        with StaticSite({"/guide": ("text/html", article(16))}) as site:
+            url = site.url + "/guide"
+            results = run_threads(6, lambda i: indexing.index_url(url))
+        self.assertEqual(site.paths(), ["/guide"])
+        self.assertEqual(len({result[0].pk for result in results}), 1)
+        self.assertEqual(len(self.embedded), results[0][0].chunk_count)
+
+    def test_waiter_on_the_url_lock_reuses_the_stored_page(self):
+        # the lock is held as if by another process indexing the page
+        with StaticSite({"/guide": ("text/html", article(16))}) as site:
+            url = site.url + "/guide"
+            with locks.url_lock(url):
+                waiter = ThreadPoolExecutor(max_workers=1)
+                self.addCleanup(waiter.shutdown)
+                result = waiter.submit(indexing.index_url, url)
+                time.sleep(0.2)
+                indexing._index_html(url, article(16))
+            _, changes = result.result(timeout=10)
+        self.assertEqual(site.paths(), [])
+        self.assertEqual((changes["added"], changes["removed"]), (0, 0))
+
+
+class LoopLocalTests(SimpleTestCase):
+    def test_clients_are_closed_when_their_loop_shuts_down(self):
+        clients = []
+
+        async def use_client():
+            client = summaries.async_session()
+            self.assertIs(summaries.async_session(), client)
+            clients.append(client)
+
+        asyncio.run(use_client())
+        # async views under WSGI: a new loop per request
+        async_to_sync(use_client)()
+        self.assertEqual(len(clients), 2)
+        self.assertIsNot(clients[0], clients[1])
+        self.assertTrue(all(client.is_closed for client in clients))
+
+
+class PreloadTests(SimpleTestCase):
+    def serving(self, argv, **environ):
+        environ = {"SERVER_SOFTWARE": "", "RUN_MAIN": "", **environ}
+        with mock.patch.object(sys, "argv", argv), mock.patch.dict(os.environ, environ):
+            return apps.is_serving()
+
+    def test_servers_are_detected(self):
+        self.assertTrue(self.serving(["/venv/bin/gunicorn", "wcs.wsgi"]))
+        self.assertTrue(self.serving(["/venv/lib/python3/site-packages/uvicorn/__main__.py", "wcs.asgi:application"]))
+        self.assertTrue(self.serving(["anything"], SERVER_SOFTWARE="gunicorn/23.0.0"))
+        self.assertTrue(self.serving(["manage.py", "runserver"], RUN_MAIN="true"))
+        self.assertTrue(self.serving(["manage.py", "runserver", "--noreload"]))
+
+    def test_other_processes_do_not_preload(self):
+        self.assertFalse(self.serving(["manage.py", "runserver"]))  # the autoreloader parent
+        self.assertFalse(self.serving(["manage.py", "run_workers"]))
+        self.assertFalse(self.serving(["/venv/bin/pytest"]))
+        self.assertFalse(self.serving(["/venv/bin/celery", "-A", "wcs", "worker"]))
+        self.assertFalse(self.serving(["scripts/reindex.py"]))
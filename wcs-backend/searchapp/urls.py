@@ -1,6 +1,11 @@
 from django.urls import path
-from .views import SearchAPIView
+from .views import AsyncSearchView, CrawlAPIView, IndexAPIView, JobAPIView, SearchAPIView, SummaryAPIView
 
 urlpatterns = [
+    path("index/", IndexAPIView.as_view(), name="index"),
     path("search/", SearchAPIView.as_view(), name="search"),
+    path("search/async/", AsyncSearchView.as_view(), name="search-async"),
+    path("summaries/", SummaryAPIView.as_view(), name="summaries"),
+    path("crawl/", CrawlAPIView.as_view(), name="crawl"),
+    path("jobs/<int:job_id>/", JobAPIView.as_view(), name="job"),
 ]
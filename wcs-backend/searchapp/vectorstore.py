@@ -0,0 +1,643 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import portalocker
+from django.conf import settings
+from dotenv import load_dotenv
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.models import (
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PointIdsList,
+    PointStruct,
+    SetPayload,
+    SetPayloadOperation,
+)
+
+from .aio import loop_local
+from .embeddings import EMBEDDING_DIM
+from .profiles import search_params
+
+load_dotenv()
+
+# "qdrant": the Qdrant server at QDRANT_URL; "local": the in-process LocalStore
+VECTOR_BACKEND = os.getenv("WCS_VECTOR_BACKEND", "qdrant")
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+
+# LocalStore data directory, shared by every process on the host
+LOCAL_STORE_DIR = os.getenv("WCS_LOCAL_STORE_DIR", str(Path(settings.BASE_DIR) / "var" / "vectors"))
+# candidate sets at least this large are searched through an HNSW graph
+# (needs ``pip install hnswlib``); smaller ones are scanned exactly
+LOCAL_HNSW_THRESHOLD = int(os.getenv("WCS_LOCAL_HNSW_THRESHOLD", "50000"))
+# graph candidates per requested hit, re-ranked exactly afterwards
+LOCAL_HNSW_OVERSAMPLING = 4
+# payload fields kept in an in-memory index (the filters indexing and search
+# use); conditions on other fields are checked row by row
+LOCAL_INDEX_FIELDS = tuple(
+    field.strip() for field in os.getenv("WCS_LOCAL_INDEX_FIELDS", "url,domain").split(",") if field.strip()
+)
+# a write compacts the collection once it has this many dead rows and at
+# least as many dead rows as live ones
+LOCAL_COMPACT_MIN_DEAD = int(os.getenv("WCS_LOCAL_COMPACT_MIN_DEAD", "10000"))
+
+# ``conditions`` everywhere below is a dict of payload field -> required value
+Hit = namedtuple("Hit", ["id", "score", "payload"])
+Record = namedtuple("Record", ["id", "payload", "vector"])
+
+
+class VectorStore:
+    """Operations the indexing and search code needs from a vector database.
+
+    Points are dicts with ``id``, ``vector`` and ``payload``. ``fields`` is a
+    list of payload fields to return, or ``True`` for the whole payload.
+    """
+
+    def collection_names(self):
+        raise NotImplementedError
+
+    def collection_exists(self, name):
+        raise NotImplementedError
+
+    def payload_index_fields(self, name):
+        """Names of the payload fields that have an index."""
+        raise NotImplementedError
+
+    def create_collection(self, name, options):
+        """Create ``name``; ``options`` are ``profiles.collection_options`` (backend-specific)."""
+        raise NotImplementedError
+
+    def create_payload_index(self, name, field, schema):
+        raise NotImplementedError
+
+    def delete_collection(self, name):
+        raise NotImplementedError
+
+    def upsert(self, name, points):
+        raise NotImplementedError
+
+    def delete(self, name, ids):
+        raise NotImplementedError
+
+    def set_payloads(self, name, updates):
+        """Merge each ``(id, payload)`` of ``updates`` into the stored payload."""
+        raise NotImplementedError
+
+    def scroll(self, name, conditions=None, fields=True, with_vectors=False, batch_size=256):
+        """Yield a ``Record`` for every point matching ``conditions``."""
+        raise NotImplementedError
+
+    def count(self, name, conditions=None):
+        raise NotImplementedError
+
+    def retrieve(self, name, ids, fields=True):
+        raise NotImplementedError
+
+    def search(self, name, vector, limit, conditions=None, fields=True):
+        """The ``limit`` points most similar (cosine) to ``vector``, as ``Hit`` tuples."""
+        raise NotImplementedError
+
+    async def asearch(self, name, vector, limit, conditions=None, fields=True):
+        raise NotImplementedError
+
+
+#  Qdrant
+
+def qdrant_filter(conditions):
+    if not conditions:
+        return None
+    return Filter(must=[
+        FieldCondition(key=field, match=MatchValue(value=value)) for field, value in conditions.items()
+    ])
+
+
+class QdrantStore(VectorStore):
+    """A Qdrant server; searches use the configured collection profile's parameters.
+
+    ``location=":memory:"`` runs qdrant-client's in-process mode instead
+    (benchmarks); there the async client sees a separate, empty instance.
+    """
+
+    def __init__(self, url=QDRANT_URL, api_key=QDRANT_API_KEY, location=None):
+        if location is not None:
+            self.client = QdrantClient(location=location)
+            self.async_client = loop_local(
+                lambda: AsyncQdrantClient(location=location), close=lambda client: client.close()
+            )
+        else:
+            self.client = QdrantClient(url=url, api_key=api_key, timeout=60)
+            # async views use their own client, one per event loop
+            self.async_client = loop_local(
+                lambda: AsyncQdrantClient(url=url, api_key=api_key, timeout=60), close=lambda client: client.close()
+            )
+        # quantization rescoring / hnsw_ef of the configured collection profile
+        self.search_params = search_params()
+
+    def collection_names(self):
+        return [c.name for c in self.client.get_collections().collections]
+
+    def collection_exists(self, name):
+        return self.client.collection_exists(name)
+
+    def payload_index_fields(self, name):
+        return set(self.client.get_collection(name).payload_schema or {})
+
+    def create_collection(self, name, options):
+        self.client.create_collection(collection_name=name, **options)
+
+    def create_payload_index(self, name, field, schema):
+        self.client.create_payload_index(collection_name=name, field_name=field, field_schema=schema)
+
+    def delete_collection(self, name):
+        self.client.delete_collection(collection_name=name)
+
+    def upsert(self, name, points):
+        self.client.upsert(collection_name=name, points=[
+            PointStruct(id=p["id"], vector=p["vector"], payload=p["payload"]) for p in points
+        ])
+
+    def delete(self, name, ids):
+        self.client.delete(collection_name=name, points_selector=PointIdsList(points=list(ids)))
+
+    def set_payloads(self, name, updates):
+        self.client.batch_update_points(
+            collection_name=name,
+            update_operations=[
+                SetPayloadOperation(set_payload=SetPayload(payload=payload, points=[point_id]))
+                for point_id, payload in updates
+            ],
+        )
+
+    def scroll(self, name, conditions=None, fields=True, with_vectors=False, batch_size=256):
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=name,
+                scroll_filter=qdrant_filter(conditions),
+                limit=batch_size,
+                offset=offset,
+                with_payload=fields,
+                with_vectors=with_vectors,
+            )
+            for record in records:
+                yield Record(record.id, record.payload or {}, record.vector)
+            if offset is None:
+                return
+
+    def count(self, name, conditions=None):
+        return self.client.count(collection_name=name, count_filter=qdrant_filter(conditions), exact=True).count
+
+    def retrieve(self, name, ids, fields=True):
+        records = self.client.retrieve(collection_name=name, ids=ids, with_payload=fields, with_vectors=False)
+        return [Record(r.id, r.payload or {}, None) for r in records]
+
+    def search(self, name, vector, limit, conditions=None, fields=True):
+        hits = self.client.search(
+            collection_name=name,
+            query_vector=list(vector),
+            limit=limit,
+            query_filter=qdrant_filter(conditions),
+            search_params=self.search_params,
+            with_payload=fields,
+        )
+        return [Hit(h.id, h.score, h.payload or {}) for h in hits]
+
+    async def asearch(self, name, vector, limit, conditions=None, fields=True):
+        hits = await self.async_client().search(
+            collection_name=name,
+            query_vector=list(vector),
+            limit=limit,
+            query_filter=qdrant_filter(conditions),
+            search_params=self.search_params,
+            with_payload=fields,
+        )
+        return [Hit(h.id, h.score, h.payload or {}) for h in hits]
+
+
+#  in-process
+
+def _select(payload, fields):
+    if fields is True:
+        return dict(payload)
+    return {field: payload[field] for field in fields if field in payload}
+
+
+class LocalCollection:
+    """One collection of a ``LocalStore``.
+
+    ``vectors.f16`` holds unit-normalized float16 rows and is only ever
+    appended to; ``log.jsonl`` records upserts (id -> row + payload), payload
+    updates and deletes. Writers append under a file lock; every process
+    replays the tail of the log it has not seen yet, so job workers and web
+    processes share one collection. A re-upserted or deleted point leaves a
+    dead row behind until ``compact`` rewrites the live rows into a new
+    generation of both files (``vectors.<n>.f16``, ``log.<n>.jsonl``, named
+    by the ``generation`` file).
+    """
+
+    def __init__(self, directory, dim=EMBEDDING_DIM, index_fields=LOCAL_INDEX_FIELDS):
+        self.directory = Path(directory)
+        self.dim = dim
+        self.row_bytes = dim * 2
+        self.index_fields = frozenset(index_fields)
+        self.generation_path = self.directory / "generation"
+        self.lock_path = str(self.directory / ".lock")
+        self._lock = threading.RLock()
+        self._reset(self._read_generation())
+
+    def _reset(self, generation):
+        self.generation = generation
+        suffix = f".{generation}" if generation else ""
+        self.vectors_path = self.directory / f"vectors{suffix}.f16"
+        self.log_path = self.directory / f"log{suffix}.jsonl"
+        self.rows = {}          # point id -> row
+        self.payloads = {}      # row -> payload
+        self.ids = {}           # row -> point id
+        self.index = {}         # payload field -> value -> set of rows
+        self._log_offset = 0
+        self._mmap = None
+        self._mapped_rows = 0
+        self._graph = None
+        self._graph_rows = set()
+
+    def _read_generation(self):
+        try:
+            return int(self.generation_path.read_text())
+        except (OSError, ValueError):
+            return 0
+
+    # -- log replay --
+
+    def _index_add(self, row, payload):
+        for field in self.index_fields.intersection(payload):
+            value = payload[field]
+            if isinstance(value, (str, int, bool)):
+                self.index.setdefault(field, {}).setdefault(value, set()).add(row)
+
+    def _index_remove(self, row, payload):
+        for field in self.index_fields.intersection(payload):
+            value = payload[field]
+            rows = self.index.get(field, {}).get(value) if isinstance(value, (str, int, bool)) else None
+            if rows is not None:
+                rows.discard(row)
+
+    def _drop(self, point_id):
+        row = self.rows.pop(point_id, None)
+        if row is not None:
+            self._index_remove(row, self.payloads.pop(row))
+            del self.ids[row]
+
+    def _apply(self, entry):
+        if entry["op"] == "upsert":
+            self._drop(entry["id"])
+            row = entry["row"]
+            self.rows[entry["id"]] = row
+            self.ids[row] = entry["id"]
+            self.payloads[row] = entry["payload"]
+            self._index_add(row, entry["payload"])
+        elif entry["op"] == "set":
+            row = self.rows.get(entry["id"])
+            if row is not None:
+                self._index_remove(row, self.payloads[row])
+                self.payloads[row] = {**self.payloads[row], **entry["payload"]}
+                self._index_add(row, self.payloads[row])
+        elif entry["op"] == "delete":
+            for point_id in entry["ids"]:
+                self._drop(point_id)
+
+    def refresh(self):
+        """Apply log entries written (by any process) since the last refresh."""
+        with self._lock:
+            generation = self._read_generation()
+            if generation != self.generation:
+                # compacted (by any process): rows were renumbered, replay the new log
+                self._reset(generation)
+            try:
+                size = os.path.getsize(self.log_path)
+            except OSError:
+                return
+            if size <= self._log_offset:
+                return
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read(size - self._log_offset)
+            # only whole lines; a line being appended right now is read next time
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if line:
+                    self._apply(json.loads(line))
+            self._log_offset += end
+
+    def _drop_torn_tail(self):
+        # a writer killed mid-append leaves a partial row or log line behind;
+        # appending after it would shift every later row / corrupt the next
+        # line. Called under the file lock, after ``refresh``.
+        if self.vectors_path.exists():
+            size = os.path.getsize(self.vectors_path)
+            if size % self.row_bytes:
+                os.truncate(self.vectors_path, size - size % self.row_bytes)
+        if self.log_path.exists() and os.path.getsize(self.log_path) > self._log_offset:
+            os.truncate(self.log_path, self._log_offset)
+
+    def _write(self, entries, vectors=None):
+        with self._lock, portalocker.Lock(self.lock_path, timeout=30):
+            self.refresh()
+            self._drop_torn_tail()
+            if vectors is not None:
+                with open(self.vectors_path, "ab") as f:
+                    first_row = f.tell() // self.row_bytes
+                    f.write(vectors.astype(np.float16).tobytes())
+                for i, entry in enumerate(entries):
+                    entry["row"] = first_row + i
+            with open(self.log_path, "ab") as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8"))
+            self.refresh()
+            dead = self._row_count() - len(self.ids)
+            if dead >= max(LOCAL_COMPACT_MIN_DEAD, len(self.ids)):
+                self._compact()
+
+    def compact(self):
+        """Rewrite the live rows and their payloads, dropping dead rows and old log entries."""
+        with self._lock, portalocker.Lock(self.lock_path, timeout=30):
+            self.refresh()
+            self._compact()
+
+    def _compact(self):
+        # called under both locks. The new generation's files are complete
+        # before the generation file names them, so other processes switch
+        # over atomically; the previous generation is kept for any reader
+        # still replaying it and removed by the next compaction.
+        generation = self.generation + 1
+        suffix = f".{generation}"
+        vectors_path = self.directory / f"vectors{suffix}.f16"
+        log_path = self.directory / f"log{suffix}.jsonl"
+        matrix, total = self._matrix(), self._row_count()
+        rows = sorted(self.ids)
+        with open(vectors_path, "wb") as f:
+            for start in range(0, len(rows), 4096):
+                f.write(np.asarray(matrix[rows[start:start + 4096]], dtype=np.float16).tobytes())
+        with open(log_path, "wb") as f:
+            for new_row, row in enumerate(rows):
+                entry = {"op": "upsert", "id": self.ids[row], "row": new_row, "payload": self.payloads[row]}
+                f.write((json.dumps(entry) + "\n").encode("utf-8"))
+        tmp = self.generation_path.with_suffix(f".{os.getpid()}")
+        tmp.write_text(str(generation))
+        os.replace(tmp, self.generation_path)
+
+        stale = self.generation - 1
+        if stale >= 0:
+            stale_suffix = f".{stale}" if stale else ""
+            for path in (self.directory / f"vectors{stale_suffix}.f16", self.directory / f"log{stale_suffix}.jsonl"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        print(f"Compacted {self.directory.name}: {len(rows)} live rows, dropped {total - len(rows)}")
+        self.refresh()
+
+    # -- writes --
+
+    def upsert(self, points):
+        if not points:
+            return
+        vectors = np.asarray([p["vector"] for p in points], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        self._write([{"op": "upsert", "id": str(p["id"]), "payload": p["payload"]} for p in points], vectors)
+
+    def delete(self, ids):
+        self._write([{"op": "delete", "ids": [str(point_id) for point_id in ids]}])
+
+    def set_payloads(self, updates):
+        self._write([{"op": "set", "id": str(point_id), "payload": payload} for point_id, payload in updates])
+
+    # -- reads --
+
+    def _row_count(self):
+        return os.path.getsize(self.vectors_path) // self.row_bytes if self.vectors_path.exists() else 0
+
+    def _matrix(self):
+        rows = self._row_count()
+        if rows != self._mapped_rows:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+            self._mapped_rows = rows
+        return self._mmap
+
+    def matching_rows(self, conditions=None):
+        with self._lock:
+            self.refresh()
+            if not conditions:
+                return sorted(self.ids)
+            indexed = {field: value for field, value in conditions.items() if field in self.index_fields}
+            if indexed:
+                sets = [self.index.get(field, {}).get(value, set()) for field, value in indexed.items()]
+                rows = set.intersection(*sets)
+            else:
+                rows = self.ids
+            others = {field: value for field, value in conditions.items() if field not in self.index_fields}
+            if others:
+                rows = [
+                    row for row in rows
+                    if all(self.payloads[row].get(field) == value for field, value in others.items())
+                ]
+            return sorted(rows)
+
+    def record(self, row, fields=True, with_vectors=False):
+        vector = self._matrix()[row].astype(np.float32).tolist() if with_vectors else None
+        return Record(self.ids[row], _select(self.payloads[row], fields), vector)
+
+    def search(self, vector, limit, conditions=None, fields=True):
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        with self._lock:
+            rows = self.matching_rows(conditions)
+            if not rows:
+                return []
+            matrix = self._matrix()
+            candidates = self._graph_candidates(query, limit, rows, matrix)
+            if candidates is not None:
+                rows = candidates
+            rows = np.asarray(rows)
+            # vectorized cosine: rows are unit-normalized, so a dot product suffices
+            scores = np.asarray(matrix[rows], dtype=np.float32) @ query
+            k = min(limit, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                Hit(self.ids[int(rows[i])], float(scores[i]), _select(self.payloads[int(rows[i])], fields))
+                for i in top
+            ]
+
+    def _graph_candidates(self, query, limit, rows, matrix):
+        """Approximate candidates from an HNSW graph, or ``None`` to scan ``rows`` exactly."""
+        if len(rows) < LOCAL_HNSW_THRESHOLD:
+            return None
+        try:
+            import hnswlib
+        except ImportError:
+            return None
+
+        alive = set(self.ids)
+        if self._graph is None:
+            self._graph = hnswlib.Index(space="ip", dim=self.dim)
+            self._graph.init_index(max_elements=max(1024, 2 * len(matrix)), ef_construction=100, M=16)
+            self._graph_rows = set()
+        new_rows = sorted(alive - self._graph_rows)
+        if new_rows:
+            needed = len(self._graph_rows) + len(new_rows)
+            if needed > self._graph.get_max_elements():
+                self._graph.resize_index(2 * needed)
+            self._graph.add_items(np.asarray(matrix[new_rows], dtype=np.float32), new_rows)
+            self._graph_rows.update(new_rows)
+        for row in self._graph_rows - alive:
+            self._graph.mark_deleted(row)
+        self._graph_rows &= alive
+
+        allowed = set(rows)
+        k = min(len(rows), limit * LOCAL_HNSW_OVERSAMPLING)
+        self._graph.set_ef(max(k, 64))
+        labels, _ = self._graph.knn_query(query, k=k, filter=lambda row: row in allowed)
+        return [int(row) for row in labels[0]]
+
+
+class LocalStore(VectorStore):
+    """In-process vector store: memory-mapped float16 matrices on local disk.
+
+    Search is an exact, vectorized cosine top-k over the rows that match the
+    payload conditions (``LOCAL_INDEX_FIELDS`` are indexed), switching to
+    an HNSW graph for very large candidate sets when ``hnswlib`` is
+    installed. Collection profiles (quantization, HNSW settings) don't apply.
+    """
+
+    def __init__(self, directory=LOCAL_STORE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="local-search")
+
+    def _collection(self, name):
+        path = self.directory / name
+        with self._lock:
+            if not path.is_dir():
+                # possibly deleted by another process
+                self._collections.pop(name, None)
+                raise ValueError(f"Collection {name} not found")
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = LocalCollection(path)
+            return collection
+
+    def collection_names(self):
+        return sorted(p.name for p in self.directory.iterdir() if p.is_dir())
+
+    def collection_exists(self, name):
+        return (self.directory / name).is_dir()
+
+    def payload_index_fields(self, name):
+        return set(self._collection(name).index_fields)
+
+    def create_collection(self, name, options):
+        path = self.directory / name
+        if path.is_dir():
+            raise ValueError(f"Collection {name} already exists")
+        path.mkdir(parents=True)
+
+    def create_payload_index(self, name, field, schema):
+        # the indexed fields are LOCAL_INDEX_FIELDS; others are filtered row by row
+        self._collection(name)
+
+    def compact(self, name):
+        self._collection(name).compact()
+
+    def delete_collection(self, name):
+        with self._lock:
+            self._collections.pop(name, None)
+        shutil.rmtree(self.directory / name, ignore_errors=True)
+
+    def upsert(self, name, points):
+        self._collection(name).upsert(points)
+
+    def delete(self, name, ids):
+        self._collection(name).delete(ids)
+
+    def set_payloads(self, name, updates):
+        self._collection(name).set_payloads(updates)
+
+    def scroll(self, name, conditions=None, fields=True, with_vectors=False, batch_size=256):
+        collection = self._collection(name)
+        with collection._lock:
+            # ids, not rows: a compaction between batches renumbers the rows
+            ids = [collection.ids[row] for row in collection.matching_rows(conditions)]
+        for start in range(0, len(ids), batch_size):
+            with collection._lock:
+                records = [
+                    collection.record(collection.rows[point_id], fields, with_vectors)
+                    for point_id in ids[start:start + batch_size] if point_id in collection.rows
+                ]
+            yield from records
+
+    def count(self, name, conditions=None):
+        return len(self._collection(name).matching_rows(conditions))
+
+    def retrieve(self, name, ids, fields=True):
+        collection = self._collection(name)
+        with collection._lock:
+            collection.refresh()
+            rows = [collection.rows[str(i)] for i in ids if str(i) in collection.rows]
+            return [collection.record(row, fields) for row in rows]
+
+    def search(self, name, vector, limit, conditions=None, fields=True):
+        return self._collection(name).search(vector, limit, conditions, fields)
+
+    async def asearch(self, name, vector, limit, conditions=None, fields=True):
+        # the scan is CPU work: keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.search, name, vector, limit, conditions, fields
+        )
+
+
+def make_store(backend=VECTOR_BACKEND):
+    if backend == "local":
+        return LocalStore()
+    if backend == "qdrant":
+        return QdrantStore()
+    raise ValueError(f"Unknown vector backend {backend!r}; choose 'qdrant' or 'local'")
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """This process's vector store, created on first use.
+
+    A store created before a fork is not reused by the child: its HTTP
+    connections (or open collection state) belong to the parent.
+    """
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        with _store_lock:
+            if _store is None or _store_pid != os.getpid():
+                _store = make_store()
+                _store_pid = os.getpid()
+    return _store
+
+
+def set_store(store):
+    """Make ``store`` this process's vector store (benchmarks)."""
+    global _store, _store_pid
+    with _store_lock:
+        _store = store
+        _store_pid = os.getpid()
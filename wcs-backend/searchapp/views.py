@@ -1,302 +1,347 @@
+import asyncio
+import json
 import os
-from bs4 import BeautifulSoup
-from html import escape
-import requests
-import hashlib
-from nltk.tokenize import word_tokenize
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams, PointStruct
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework import status
-from dotenv import load_dotenv
-import time
-import uuid
-from urllib.parse import urlparse
+from concurrent.futures import as_completed
 
-load_dotenv()
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from dotenv import load_dotenv
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
 
-#  utility functions 
-
-def upsert_in_batches(qdrant_client, collection_name, points, batch_size=50, retries=3):
-    for i in range(0, len(points), batch_size):
-        batch = points[i:i + batch_size]
-        structured_points = [
-            PointStruct(id=p["id"], vector=p["vector"], payload=p["payload"])
-            for p in batch
-        ]
-        for attempt in range(retries):
-            try:
-                qdrant_client.upsert(collection_name=collection_name, points=structured_points)
-                break
-            except Exception as e:
-                print(f"Batch {i // batch_size + 1} failed (attempt {attempt + 1}): {e}")
-                if attempt == retries - 1:
-                    raise e
-                time.sleep(2)
-
-
-def summarize_with_chatgroq(text):
-    """Generate a 3–4 line summary using ChatGroq API."""
-    try:
-        response = requests.post(
-            "https://api.chatgroq.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {os.getenv('CHATGROQ_API_KEY')}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "llama-3.3-70b-versatile",
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "Summarize the following webpage content in 3–4 lines. Be concise and informative.",
-                    },
-                    {"role": "user", "content": text},
-                ],
-            },
-            timeout=30,
-        )
-        data = response.json()
-        return data.get("choices", [{}])[0].get("message", {}).get("content", text[:300])
-    except Exception as e:
-        print(f"ChatGroq summarization failed: {e}")
-        return text[:300]
+from .indexing import (
+    SEARCH_SCOPES,
+    SUMMARY_MODES,
+    asearch_url,
+    collection_for_url,
+    get_indexed_page,
+    search_url,
+    site_is_indexed,
+    summarize_points,
+)
+from .jobs import await_job, submit_job, wait_for_job
+from .metrics import CONTENT_TYPE, render_metrics
+from .models import IndexedPage, Job
+from .summaries import asubmit_summaries, prefetch_summaries, submit_summaries
 
+load_dotenv()
 
-#  initialization 
+# how long a search for an unindexed page waits for its index job before
+# answering 202 with the job to poll instead (0 = don't wait)
+SEARCH_INDEX_WAIT = float(os.getenv("WCS_SEARCH_INDEX_WAIT", "5"))
+
+#  streaming 
 
-SENTENCE_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+# streaming search formats: newline-delimited JSON or Server-Sent Events
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def format_event(event, data, fmt):
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, **data}) + "\n"
+
+
+def stream_search_events(results, fmt, summaries="full"):
+    """Yield the ranked hits at once, then one event per summary as it finishes."""
+    yield format_event("results", {"results": results}, fmt)
+
+    if summaries == "full":
+        by_future = {}
+        for r, future in zip(results, submit_summaries([r["text"] for r in results])):
+            by_future.setdefault(future, []).append(r["id"])
+        for future in as_completed(by_future):
+            for point_id in by_future[future]:
+                yield format_event("summary", {"id": point_id, "summary": future.result()}, fmt)
+    elif summaries == "lazy":
+        prefetch_summaries([r["text"] for r in results])
+
+    yield format_event("done", {}, fmt)
+
+
+async def astream_search_events(results, fmt, summaries="full"):
+    """Async ``stream_search_events``: summaries are awaited on the event loop."""
+    yield format_event("results", {"results": results}, fmt)
+
+    if summaries == "full":
+        tasks = await asubmit_summaries([r["text"] for r in results])
+        by_task = {}
+        for r, task in zip(results, tasks):
+            by_task.setdefault(task, []).append(r["id"])
+        pending = set(by_task)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for point_id in by_task[task]:
+                    yield format_event("summary", {"id": point_id, "summary": task.result()}, fmt)
+    elif summaries == "lazy":
+        await sync_to_async(prefetch_summaries)([r["text"] for r in results])
+
+    yield format_event("done", {}, fmt)
+
+
+def streaming_response(events, fmt):
+    response = StreamingHttpResponse(events, content_type=STREAM_FORMATS[fmt])
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+#  request handling shared by the sync and async search views 
+
+def parse_search_params(data):
+    """Validate a search request body; raises ``ValueError`` with the message to return."""
+    url = data.get("url")
+    query = data.get("query")
+    if not url or not query:
+        raise ValueError("Both 'url' and 'query' are required.")
+
+    summaries = data.get("summaries", "full")
+    if summaries is True:
+        summaries = "full"
+    elif summaries is False:
+        summaries = "none"
+    if summaries not in SUMMARY_MODES:
+        raise ValueError(f"'summaries' must be one of: {', '.join(SUMMARY_MODES)}.")
+
+    stream = data.get("stream", False)
+    if stream is True:
+        stream = "ndjson"
+    if stream and stream not in STREAM_FORMATS:
+        raise ValueError(f"'stream' must be one of: {', '.join(STREAM_FORMATS)}.")
+
+    scope = data.get("scope", "page")
+    if scope not in SEARCH_SCOPES:
+        raise ValueError(f"'scope' must be one of: {', '.join(SEARCH_SCOPES)}.")
+
+    return {"url": url, "query": query, "summaries": summaries, "stream": stream, "scope": scope}
+
+
+def parse_flag(value):
+    """Strict boolean from JSON: ``true``/``false``, 0/1 or their string forms."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "1", "yes", "false", "0", "no"):
+        return value.strip().lower() in ("true", "1", "yes")
+    raise ValueError
+
+
+def parse_crawl_params(data):
+    """Validate the crawl options of a request body; raises ``ValueError`` with the message to return."""
+    # name -> (parser, description, smallest accepted value)
+    options = {
+        "max_pages": (int, "an integer of at least 1", 1),
+        "concurrency": (int, "an integer of at least 1", 1),
+        "delay": (float, "a number of seconds of at least 0", 0),
+        "respect_robots": (parse_flag, "true or false", None),
+        "use_sitemap": (parse_flag, "true or false", None),
+    }
+    params = {}
+    for name, (parse, expected, minimum) in options.items():
+        if name not in data:
+            continue
+        value = data[name]
+        try:
+            # JSON true/false are not numbers here
+            if isinstance(value, bool) and parse is not parse_flag:
+                raise ValueError
+            params[name] = parse(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{name}' must be {expected}.")
+        if minimum is not None and params[name] < minimum:
+            raise ValueError(f"'{name}' must be {expected}.")
+    return params
+
+
+def unfinished_job_response(job):
+    """``(body, status)`` for an index job that did not succeed, or ``None`` if it did."""
+    if job.status == Job.STATUS_FAILED:
+        return {"detail": job.error}, status.HTTP_400_BAD_REQUEST
+    if job.status != Job.STATUS_DONE:
+        return (
+            {"detail": "The page is being indexed; retry the search once the job is done.",
+             "job": job.as_dict()},
+            status.HTTP_202_ACCEPTED,
+        )
+    return None
 
-QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-COLLECTION_NAME = "html_chunks"
 
-qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=60)
+#  API views 
 
-#  main API View 
+class IndexAPIView(APIView):
+    """Queue a URL for (re-)indexing without searching it."""
 
-class SearchAPIView(APIView):
     def post(self, request):
-        print("Received data:", request.data)
-
         url = request.data.get("url")
-        query = request.data.get("query")
-
-        if not url or not query:
+        if not url:
             return Response(
-                {"detail": "Both 'url' and 'query' are required."},
+                {"detail": "'url' is required."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # fetch HTML
         try:
-            resp = requests.get(url, timeout=10, headers={"User-Agent": "Mozilla/5.0"})
-            resp.raise_for_status()
-            html = resp.text
-        except Exception as e:
+            force = parse_flag(request.data.get("force", False))
+        except ValueError:
             return Response(
-                {"detail": f"Failed to fetch the URL: {str(e)}"},
+                {"detail": "'force' must be true or false."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        page = None if force else get_indexed_page(url)
+        if page is not None:
+            return Response({
+                "url": page.url,
+                "collection": page.collection,
+                "chunks": page.chunk_count,
+                "indexed": False,
+                "indexed_at": page.indexed_at,
+                "added": 0,
+                "removed": 0,
+                "unchanged": page.chunk_count,
+            })
 
-        # parse and clean HTML
-        soup = BeautifulSoup(html, "html.parser")
-        for s in soup(["script", "style", "noscript", "header", "footer", "svg"]):
-            s.decompose()
-
-        text = "\n".join(
-            [line.strip() for line in soup.get_text(separator="\n").splitlines() if line.strip()]
-        )
+        # indexing runs on a job worker; poll /api/jobs/<id>/ for the outcome
+        job, _ = submit_job(Job.KIND_INDEX, url, {"force": force})
+        return Response(job.as_dict(), status=status.HTTP_202_ACCEPTED)
 
-        #  tokenize and chunk
-        words = word_tokenize(text)
-        max_tokens = 1000
-        chunks = []
-        for i in range(0, len(words), max_tokens):
-            chunk_text = " ".join(words[i:i + max_tokens])
-            if not chunk_text.strip():
-                continue
-            # try to extract the most readable section of the page
-            candidates = []
-
-            # priority tags that usually hold main content
-            for selector in [
-                "main",
-                "article",
-                "section",
-                "div#main-content",
-                "div#content",
-                "div#primary",
-                "div[class*='article']",
-                "div[class*='content']",
-                "div[class*='post']",
-                "div[class*='entry']",
-                "div[class*='page']",
-                "div[class*='text']",
-                "div[class*='read']",
-                "div[class*='container']",
-            ]:
-                tag = soup.select_one(selector)
-                if tag and len(tag.get_text(strip=True)) > 200:
-                    candidates.append(tag)
-
-            # if nothing found, fallback to the largest text block
-            if not candidates:
-                all_divs = soup.find_all(["div", "section", "article"])
-                largest = max(all_divs, key=lambda d: len(d.get_text(strip=True)), default=None)
-                if largest and len(largest.get_text(strip=True)) > 200:
-                    candidates.append(largest)
-
-            # choose the most text-heavy section
-            main_content = max(
-                candidates, key=lambda el: len(el.get_text(strip=True)), default=soup.body
-            )
 
-            #  clean up unwanted elements 
-            for junk in main_content.find_all(
-                ["nav", "aside", "footer", "form", "button", "svg", "script", "style", "noscript", "header", "iframe", "input"]
-            ):
-                junk.decompose()
+class SearchAPIView(APIView):
+    """Search a URL's indexed chunks, indexing it first if it is unknown or stale.
 
+    With ``"scope": "site"`` every indexed page of the URL's domain is
+    searched (see ``CrawlAPIView``); the URL itself is only indexed when
+    nothing from that domain is.
+    """
 
-            # extract prettified readable subset
-            html_text = str(main_content) if main_content else soup.prettify()
+    def post(self, request):
+        try:
+            params = parse_search_params(request.data)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        url, query, scope = params["url"], params["query"], params["scope"]
+        summaries, stream = params["summaries"], params["stream"]
+
+        if scope == "site" and site_is_indexed(url):
+            collection = collection_for_url(url)
+        else:
+            page = get_indexed_page(url)
+            if page is None:
+                job, _ = submit_job(Job.KIND_INDEX, url)
+                job = wait_for_job(job, SEARCH_INDEX_WAIT)
+                failure = unfinished_job_response(job)
+                if failure is not None:
+                    body, code = failure
+                    return Response(body, status=code)
+                page = IndexedPage.objects.get(url=url)
+            collection = page.collection
+
+        if stream:
+            # hits go out as soon as Qdrant answers; summaries follow one by one
+            results = search_url(url, query, collection, summaries="none", scope=scope)
+            return streaming_response(stream_search_events(results, stream, summaries), stream)
 
-            # Truncate 
-            if len(html_text) > 2000:
-                html_pretty_safe = html_text[:2000] + "\n<!-- [truncated for performance] -->"
-            else:
-                html_pretty_safe = html_text
+        # semantic search
+        results = search_url(url, query, collection, summaries=summaries, scope=scope)
+        return Response({"results": results})
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncSearchView(View):
+    """``SearchAPIView`` as a native async view for ASGI servers.
 
-            chunks.append({
-                "text": chunk_text,
-                "html_pretty": html_pretty_safe
-            })
+    Accepts the same JSON body and returns the same responses, but Qdrant and
+    ChatGroq are awaited and the query is embedded on a thread pool, so one
+    process can hold many concurrent searches without a thread per request.
+    """
 
-        if not chunks:
-            return Response({"detail": "No textual content found."}, status=400)
-
-        #  dynamic per domain collection
-        domain = urlparse(url).netloc.replace(".", "_")
-        COLLECTION_NAME = f"html_chunks_{domain}"
-
-        def ensure_collection(collection_name):
-            """Create collection if it doesn't exist and ensure URL index exists."""
-            collections = [c.name for c in qdrant.get_collections().collections]
-            if collection_name not in collections:
-                qdrant.create_collection(
-                    collection_name=collection_name,
-                    vectors_config=VectorParams(size=384, distance=Distance.COSINE),
-                )
-                print(f"Created collection: {collection_name}")
-
-            try:
-                qdrant.create_payload_index(
-                    collection_name=collection_name,
-                    field_name="url",
-                    field_schema="keyword",
-                )
-                print(f"Created index for 'url' in {collection_name}")
-            except Exception as e:
-                if "already exists" not in str(e).lower():
-                    print(f"Could not create index for 'url': {e}")
-
-        ensure_collection(COLLECTION_NAME)
-
-        # delete any previously stored chunks for this URL
+    async def post(self, request):
         try:
-            qdrant.delete(
-                collection_name=COLLECTION_NAME,
-                points_selector={
-                    "filter": {
-                        "must": [{"key": "url", "match": {"value": url}}]
-                    }
-                },
+            data = json.loads(request.body or b"{}")
+            if not isinstance(data, dict):
+                raise ValueError("The request body must be a JSON object.")
+            params = parse_search_params(data)
+        except ValueError as e:
+            return JsonResponse({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        url, query, scope = params["url"], params["query"], params["scope"]
+        summaries, stream = params["summaries"], params["stream"]
+
+        if scope == "site" and await sync_to_async(site_is_indexed)(url):
+            collection = collection_for_url(url)
+        else:
+            page = await sync_to_async(get_indexed_page)(url)
+            if page is None:
+                job, _ = await sync_to_async(submit_job)(Job.KIND_INDEX, url)
+                job = await await_job(job, SEARCH_INDEX_WAIT)
+                failure = unfinished_job_response(job)
+                if failure is not None:
+                    body, code = failure
+                    return JsonResponse(body, status=code, encoder=JSONEncoder)
+                page = await IndexedPage.objects.aget(url=url)
+            collection = page.collection
+
+        if stream:
+            results = await asearch_url(url, query, collection, summaries="none", scope=scope)
+            return streaming_response(astream_search_events(results, stream, summaries), stream)
+
+        results = await asearch_url(url, query, collection, summaries=summaries, scope=scope)
+        return JsonResponse({"results": results}, encoder=JSONEncoder)
+
+
+class SummaryAPIView(APIView):
+    """Summaries for search hits returned with ``"summaries": "lazy"``."""
+
+    def post(self, request):
+        url = request.data.get("url")
+        ids = request.data.get("ids")
+        if not url or not isinstance(ids, list) or not ids:
+            return Response(
+                {"detail": "'url' and a non-empty list of 'ids' are required."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            print(f"Deleted old chunks for URL: {url}")
-        except Exception as e:
-            print(f"Warning: could not delete old chunks for {url}: {e}")
-
-        # embed and store new content 
-        points = []
-        for idx, chunk in enumerate(chunks):
-            vector = SENTENCE_MODEL.encode(chunk["text"]).tolist()
-            html_pretty_full = chunk["html_pretty"]
-
-            # extract main readable HTML
-            soup = BeautifulSoup(html_pretty_full, "html.parser")
-            for tag in soup(["script", "style", "noscript", "iframe", "svg", "header", "footer"]):
-                tag.decompose()
-            readable_html = soup.prettify()
-
-            # limit size 
-            MAX_LEN = 2000
-            if len(readable_html) > MAX_LEN:
-                readable_html_safe = readable_html[:MAX_LEN] + "\n<!-- [truncated for performance] -->"
-            else:
-                readable_html_safe = readable_html
-
-            html_pretty_safe = f"""
-                <details style='margin-top:8px;'>
-                    <summary style='cursor:pointer;color:#2563eb;font-weight:600;'>View HTML (readable preview)</summary>
-                    <div style='border:1px solid #ddd;padding:10px;margin-top:5px;border-radius:8px;'>
-                        {readable_html_safe}
-                    </div>
-                </details>
-                """
-
-
-            points.append({
-                "id": str(uuid.uuid4()),
-                "vector": vector,
-                "payload": {
-                    "url": url,
-                    "chunk_index": idx,
-                    "text": chunk["text"],
-                    "html_pretty": html_pretty_safe,
-                },
-            })
 
-        upsert_in_batches(qdrant, COLLECTION_NAME, points)
+        return Response({"summaries": summarize_points(url, ids)})
 
-        # semantic search
-        query_vec = SENTENCE_MODEL.encode(query).tolist()
-        search_result = qdrant.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=query_vec,
-            limit=10,
-            query_filter={
-                "must": [{"key": "url", "match": {"value": url}}]
-            },
-        )
 
-        # prepare structured response
-        results = []
-        for item in search_result:
-            payload = item.payload or {}
-            raw_text = payload.get("text", "")
-            html_pretty = payload.get("html_pretty", "(no html stored)")
-            score = getattr(item, "score", 0.0) or 0.0
-
-            clean_text = BeautifulSoup(raw_text, "html.parser").get_text()
-            summary = summarize_with_chatgroq(clean_text)
-
-            results.append({
-                "id": item.id,
-                "summary": summary,
-                "score": round(score, 6),
-                "accuracy": round(score * 100, 2),
-                "html_pretty": html_pretty,
-                "text": clean_text,
-                "chunk_index": payload.get("chunk_index"),
-                "url": payload.get("url"),
-            })
+class CrawlAPIView(APIView):
+    """Queue a crawl of a URL's site; poll ``/api/jobs/<id>/`` for progress."""
+
+    def post(self, request):
+        url = request.data.get("url")
+        if not url:
+            return Response(
+                {"detail": "'url' is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            params = parse_crawl_params(request.data)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        for r in results:
-            print(f"Chunk #{r['chunk_index']} | {r['accuracy']}% | Summary:\n{r['summary']}\n")
+        # a crawl of the same start URL that is still queued or running is reused
+        job, _ = submit_job(Job.KIND_CRAWL, url, params)
+        return Response(job.as_dict(), status=status.HTTP_202_ACCEPTED)
 
-        return Response({"results": results})
+
+class JobAPIView(APIView):
+    """Status and result of a background job."""
+
+    def get(self, request, job_id):
+        job = Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({"detail": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job.as_dict())
+
+
+def metrics(request):
+    """Prometheus metrics: stage and request latency histograms, cache lookups, queue depths."""
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
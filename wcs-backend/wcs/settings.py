@@ -33,6 +33,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # request latency histograms and the optional X-Timing header
+    "searchapp.metrics.TimingMiddleware",
 
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -70,6 +72,12 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # job workers and web processes write concurrently: take the write lock
+        # when a transaction starts and wait for it instead of failing
+        "OPTIONS": {"timeout": 20, "transaction_mode": "IMMEDIATE"},
+        # tests use a file too: threads of an in-memory test database fail
+        # with "table is locked" instead of waiting for each other's writes
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
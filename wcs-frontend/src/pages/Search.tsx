@@ -21,6 +21,33 @@ interface SearchResult {
   };
 }
 
+interface Job {
+  id: number;
+  status: "queued" | "running" | "done" | "failed";
+  error: string;
+}
+
+const JOB_POLL_MS = 1000;
+// give up after five minutes, e.g. when no job worker is running
+const JOB_POLL_LIMIT = 300;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// a page that is not indexed yet is answered with 202 and its index job:
+// poll the job until it finishes, then repeat the search
+async function waitForJob(apiBase: string, job: Job): Promise<void> {
+  for (let polls = 0; job.status === "queued" || job.status === "running"; polls++) {
+    if (polls >= JOB_POLL_LIMIT) {
+      throw new Error("The page is still being indexed; try again later.");
+    }
+    await sleep(JOB_POLL_MS);
+    job = (await axios.get<Job>(`${apiBase}/api/jobs/${job.id}/`)).data;
+  }
+  if (job.status === "failed") {
+    throw new Error(job.error || "Indexing the page failed.");
+  }
+}
+
 export default function Search() {
   const [url, setUrl] = useState("");
   const [query, setQuery] = useState("");
@@ -43,7 +70,7 @@ export default function Search() {
     setLoading(true);
     try {
       const apiBase = import.meta.env.VITE_API_BASE || "http://localhost:8000";
-      const res = await axios.post(
+      const search = () => axios.post(
         `${apiBase}/api/search/`,
         { url, query },
         {
@@ -51,6 +78,15 @@ export default function Search() {
           timeout: 90000
         }
       );
+      let res = await search();
+      if (res.status === 202 && res.data.job) {
+        toast({
+          title: "Indexing Page",
+          description: "The page is being indexed; results will follow.",
+        });
+        await waitForJob(apiBase, res.data.job);
+        res = await search();
+      }
       setResults(res.data.results || []);
       toast({
         title: "Search Complete",